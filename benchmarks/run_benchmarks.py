@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+''' Benchmarks for the extraction, unpacking and conversion hot paths of picamraw.
+
+Synthetic JPEG+RAW files are generated for every entry of `RAW_BLOCK_SIZE_BY_VERSION_AND_MODE`, so no camera or
+fixture images are needed. Each stage is timed on its own, and its throughput and peak memory are reported.
+
+Usage:
+    python benchmarks/run_benchmarks.py --save-baseline baseline.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json
+
+When comparing against a baseline, the exit code is 1 if any stage has regressed by more than the tolerance.
+'''
+import argparse
+import ctypes
+from collections import OrderedDict
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from picamraw import main
+from picamraw.constants import BayerOrder, PiCameraVersion
+
+
+# The image resolution of each sensor mode, per https://picamera.readthedocs.io/en/release-1.13/fov.html#sensor-modes
+RESOLUTION_BY_VERSION_AND_MODE = {
+    PiCameraVersion.V1: {
+        0: (2592, 1944),
+        1: (1920, 1080),
+        2: (2592, 1944),
+        3: (2592, 1944),
+        4: (1296, 972),
+        5: (1296, 730),
+        6: (640, 480),
+        7: (640, 480),
+    },
+    PiCameraVersion.V2: {
+        0: (3280, 2464),
+        1: (1920, 1080),
+        2: (3280, 2464),
+        3: (3280, 2464),
+        4: (1640, 1232),
+        5: (1640, 922),
+        6: (1280, 720),
+        7: (640, 480),
+    },
+}
+
+# Enough arbitrary bytes to stand in for the JPEG in front of the raw block
+JPEG_SIZE = 2 * 1024 * 1024
+
+BYTES_PER_MB = 1024 * 1024
+
+
+def make_header(camera_version, sensor_mode):
+    ''' Make a `BroadcomRawHeader` for the sensor mode, with padding chosen so that its pixel data exactly fills the
+        sensor mode's raw block
+    '''
+    width, height = RESOLUTION_BY_VERSION_AND_MODE[camera_version][sensor_mode]
+    raw_block_size = main.RAW_BLOCK_SIZE_BY_VERSION_AND_MODE[camera_version][sensor_mode]
+
+    for padding_right in range(64):
+        for padding_down in range(64):
+            header = main.BroadcomRawHeader(
+                name=camera_version.value.lower().encode('ascii'),
+                width=width,
+                height=height,
+                padding_right=padding_right,
+                padding_down=padding_down,
+                bayer_order=2,  # BGGR
+            )
+            shape, _ = main._get_packed_shape_and_crop(header)
+            if main.PIXEL_BYTE_OFFSET + shape.width * shape.height == raw_block_size:
+                return header
+
+    raise ValueError('No padding fits {width}x{height} into {raw_block_size} bytes'.format(**locals()))
+
+
+def make_jpeg_raw(camera_version, sensor_mode, random_state):
+    ''' Make the contents of a synthetic JPEG+RAW file, with random pixel data '''
+    header = make_header(camera_version, sensor_mode)
+    raw_block_size = main.RAW_BLOCK_SIZE_BY_VERSION_AND_MODE[camera_version][sensor_mode]
+
+    raw_block = bytearray(random_state.randint(0, 256, size=raw_block_size, dtype=np.uint8).tobytes())
+    raw_block[:4] = b'BRCM'
+    header_end = main.HEADER_BYTE_OFFSET + ctypes.sizeof(main.BroadcomRawHeader)
+    raw_block[main.HEADER_BYTE_OFFSET:header_end] = bytes(header)
+
+    jpeg = random_state.randint(0, 256, size=JPEG_SIZE, dtype=np.uint8).tobytes()
+
+    return jpeg + bytes(raw_block)
+
+
+def measure(function, input_bytes, repeat):
+    ''' Time `function` (best of `repeat` runs) and measure its peak memory allocation in a separate run '''
+    seconds = min(timeit.repeat(function, number=1, repeat=repeat))
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return OrderedDict([
+        ('seconds', seconds),
+        ('mb_per_second', input_bytes / BYTES_PER_MB / seconds),
+        ('frames_per_second', 1 / seconds),
+        ('peak_mb', peak_bytes / BYTES_PER_MB),
+    ])
+
+
+def benchmark_sensor_mode(filepath, camera_version, sensor_mode, repeat):
+    ''' Benchmark each stage for a single sensor mode '''
+    raw_block_size = main.RAW_BLOCK_SIZE_BY_VERSION_AND_MODE[camera_version][sensor_mode]
+    pixel_bytes, header = main._read_pixel_bytes_and_header(filepath, camera_version, sensor_mode, memory_map=False)
+    pixel_bytes_2d = main._pixel_bytes_to_2d(pixel_bytes, header)
+    bayer_array = main._unpack_10bit_values(pixel_bytes_2d)
+
+    return OrderedDict([
+        ('extract_raw_from_jpeg', measure(
+            lambda: main.extract_raw_from_jpeg(filepath, camera_version, sensor_mode),
+            raw_block_size,
+            repeat,
+        )),
+        ('_unpack_10bit_values', measure(
+            lambda: main._unpack_10bit_values(pixel_bytes_2d),
+            pixel_bytes_2d.size,
+            repeat,
+        )),
+        ('bayer_array_to_rgb', measure(
+            lambda: main.bayer_array_to_rgb(bayer_array, BayerOrder.BGGR),
+            bayer_array.nbytes,
+            repeat,
+        )),
+        ('bayer_array_to_3d', measure(
+            lambda: main.bayer_array_to_3d(bayer_array, BayerOrder.BGGR),
+            bayer_array.nbytes,
+            repeat,
+        )),
+    ])
+
+
+def run_benchmarks(repeat):
+    ''' Benchmark every stage for every camera version and sensor mode
+
+    Returns:
+        An OrderedDict of measurements, keyed by '<camera version>-<sensor mode>/<stage>'
+    '''
+    random_state = np.random.RandomState(0)
+    results = OrderedDict()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for camera_version, raw_block_size_by_mode in main.RAW_BLOCK_SIZE_BY_VERSION_AND_MODE.items():
+            for sensor_mode in sorted(raw_block_size_by_mode):
+                filepath = os.path.join(directory, '{}-{}.jpeg'.format(camera_version.name, sensor_mode))
+                with open(filepath, mode='wb') as file:
+                    file.write(make_jpeg_raw(camera_version, sensor_mode, random_state))
+
+                stage_results = benchmark_sensor_mode(filepath, camera_version, sensor_mode, repeat)
+                for stage, measurements in stage_results.items():
+                    results['{}-{}/{}'.format(camera_version.name, sensor_mode, stage)] = measurements
+
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    ''' Print each result alongside its baseline
+
+    Returns:
+        The names of the benchmarks that are slower than the baseline by more than `tolerance` (a fraction)
+    '''
+    regressions = []
+
+    print('{:<40} {:>10} {:>10} {:>8}'.format('benchmark', 'ms', 'baseline', 'change'))
+    for name, measurements in results.items():
+        seconds = measurements['seconds']
+        if name not in baseline:
+            print('{:<40} {:>10.2f} {:>10} {:>8}'.format(name, seconds * 1000, '-', '-'))
+            continue
+
+        baseline_seconds = baseline[name]['seconds']
+        change = seconds / baseline_seconds - 1
+        is_regression = change > tolerance
+        if is_regression:
+            regressions.append(name)
+
+        print('{:<40} {:>10.2f} {:>10.2f} {:>+7.0%}{}'.format(
+            name, seconds * 1000, baseline_seconds * 1000, change, ' REGRESSION' if is_regression else ''
+        ))
+
+    return regressions
+
+
+def print_results(results):
+    print('{:<40} {:>10} {:>10} {:>10} {:>10}'.format('benchmark', 'ms', 'MB/s', 'frames/s', 'peak MB'))
+    for name, measurements in results.items():
+        print('{:<40} {:>10.2f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            name,
+            measurements['seconds'] * 1000,
+            measurements['mb_per_second'],
+            measurements['frames_per_second'],
+            measurements['peak_mb'],
+        ))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs per benchmark (the best is kept)')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Save the results as a baseline JSON file')
+    parser.add_argument('--baseline', metavar='PATH', help='Compare the results against a saved baseline JSON file')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1,
+        help='Fraction by which a benchmark may be slower than the baseline before it counts as a regression',
+    )
+    return parser.parse_args(args)
+
+
+def main_cli(args=None):
+    options = parse_args(sys.argv[1:] if args is None else args)
+
+    results = run_benchmarks(options.repeat)
+    print_results(results)
+
+    if options.save_baseline:
+        with open(options.save_baseline, mode='w') as file:
+            json.dump(results, file, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline = json.load(file)
+        print()
+        regressions = compare_to_baseline(results, baseline, options.tolerance)
+        if regressions:
+            print('\n{} benchmark(s) regressed by more than {:.0%}'.format(len(regressions), options.tolerance))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -1,2 +1,5 @@
 from .main import PiRawBayer  # noqa: F401 (imported but unused)
 from .constants import PiCameraVersion  # noqa: F401 (imported but unused)
+from .resolution import PiRegion  # noqa: F401 (imported but unused)
+from .cache import FrameCache, SidecarCache  # noqa: F401 (imported but unused)
+from .instrumentation import instrument  # noqa: F401 (imported but unused)
@@ -0,0 +1,104 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from typing import Optional  # noqa: F401 (used in type comments)
+
+
+class AsyncMap:
+    ''' An asynchronous iterator of the results of a coroutine function applied to each of `items`, with at most
+        `concurrency` of them running at once. See `amap`.
+
+    Use `async with` (or call `aclose()`) to cancel any coroutines still running if iteration is stopped early.
+    '''
+    def __init__(self, function, items, concurrency=None, ordered=True):
+        self._function = function
+        self._items = iter(items)
+        self._concurrency = concurrency or os.cpu_count() or 1
+        self._ordered = ordered
+        self._pending = deque()  # type: deque
+        self._started = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._started:
+            self._started = True
+            for _ in range(self._concurrency):
+                if not self._schedule_next():
+                    break
+
+        if not self._pending:
+            raise StopAsyncIteration
+
+        if self._ordered:
+            task = self._pending.popleft()
+        else:
+            done, _ = await asyncio.wait(self._pending, return_when=asyncio.FIRST_COMPLETED)
+            task = next(task for task in self._pending if task in done)
+            self._pending.remove(task)
+
+        try:
+            result = await task
+        except BaseException:
+            # Don't leave work running that nothing will collect
+            await self.aclose()
+            raise
+
+        self._schedule_next()
+        return result
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        ''' Cancel the coroutines still running, and stop iterating '''
+        for task in self._pending:
+            task.cancel()
+        self._pending.clear()
+        self._items = iter(())
+
+    def _schedule_next(self):
+        for item in self._items:
+            self._pending.append(asyncio.ensure_future(self._function(item)))
+            return True
+        return False
+
+
+def amap(function, items, concurrency=None, ordered=True):
+    ''' Apply the coroutine function `function` to each of `items`, running at most `concurrency` at once, and
+        asynchronously iterate over the results. The asyncio counterpart of `parallel.imap`.
+
+    Args:
+        function: A coroutine function of a single argument to apply to each item
+        items: An iterable of items to apply `function` to
+        concurrency: Optional - defaults to the number of CPUs. The number of coroutines to run at once.
+        ordered: Optional - defaults to True. If True, results are yielded in the order of `items`. Otherwise they are
+            yielded as soon as they are completed.
+
+    Returns:
+        An `AsyncMap`, to iterate over with `async for`. If `function` raises, the exception is re-raised when the
+        corresponding result is reached.
+    '''
+    return AsyncMap(function, items, concurrency=concurrency, ordered=ordered)
+
+
+_default_unpack_executor = None  # type: Optional[ThreadPoolExecutor]
+_default_unpack_executor_lock = threading.Lock()
+
+
+def get_default_unpack_executor():
+    ''' Returns the executor that unpacking runs on by default: a thread pool shared by the whole process, with a
+        thread per CPU - so that however many coroutines are extracting at once, unpacking never oversubscribes the
+        CPUs. Unpacking is done by numpy, which releases the GIL.
+    '''
+    global _default_unpack_executor
+    with _default_unpack_executor_lock:
+        if _default_unpack_executor is None:
+            _default_unpack_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _default_unpack_executor
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from . import aio as module
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def _collect(async_iterable):
+    results = []
+    async for result in async_iterable:
+        results.append(result)
+    return results
+
+
+class TestAmap:
+    def test_yields_results_in_order(self):
+        async def _slow_for_small_numbers(number):
+            await asyncio.sleep(0.01 * (5 - number))
+            return number * 2
+
+        actual = _run(_collect(module.amap(_slow_for_small_numbers, range(5), concurrency=5)))
+
+        assert actual == [0, 2, 4, 6, 8]
+
+    def test_unordered_yields_results_as_completed(self):
+        async def _slow_for_small_numbers(number):
+            await asyncio.sleep(0.01 * (5 - number))
+            return number * 2
+
+        actual = _run(_collect(module.amap(_slow_for_small_numbers, range(5), concurrency=5, ordered=False)))
+
+        assert actual == [8, 6, 4, 2, 0]
+
+    def test_reraises_exceptions_and_cancels_the_rest(self):
+        cancelled = []
+
+        async def _raise_on_one(number):
+            if number == 1:
+                raise ValueError('one')
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(number)
+                raise
+
+        async def _consume():
+            async for _ in module.amap(_raise_on_one, range(3), concurrency=3, ordered=False):
+                pass
+
+        with pytest.raises(ValueError, match='one'):
+            _run(_consume())
+
+        assert sorted(cancelled) == [0, 2]
+
+    def test_bounds_coroutines_in_flight(self):
+        running = []
+        max_running = []
+
+        async def _record_running(number):
+            running.append(number)
+            max_running.append(len(running))
+            await asyncio.sleep(0.001)
+            running.remove(number)
+            return number
+
+        actual = _run(_collect(module.amap(_record_running, range(20), concurrency=3)))
+
+        assert actual == list(range(20))
+        assert max(max_running) == 3
+
+    def test_aclose_cancels_running_coroutines(self):
+        cancelled = []
+
+        async def _sleep_unless_zero(number):
+            if number == 0:
+                return number
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(number)
+                raise
+
+        async def _stop_early():
+            async with module.amap(_sleep_unless_zero, range(100), concurrency=3, ordered=False) as results:
+                async for result in results:
+                    break
+            # Let the cancellations be delivered
+            await asyncio.sleep(0)
+            return result, await _collect(results)
+
+        assert _run(_stop_early()) == (0, [])
+        # 3 was scheduled in place of 0, and cancelled before it started
+        assert sorted(cancelled) == [1, 2]
+
+
+class TestGetDefaultUnpackExecutor:
+    def test_is_shared(self):
+        assert module.get_default_unpack_executor() is module.get_default_unpack_executor()
@@ -0,0 +1,221 @@
+import json
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from . import main
+from .constants import BayerOrder
+
+
+# An archive starts with the magic bytes and format version, and ends with a footer giving the offset and length of
+# the JSON index that follows the frames. Each frame is stored as packed 10-bit values (as in the raw block, with the
+# padding cropped off) - optionally compressed with zlib.
+ARCHIVE_MAGIC = b'PICAMRAW'
+ARCHIVE_VERSION = 1
+_ARCHIVE_PREAMBLE = struct.Struct('<8sI')
+_ARCHIVE_FOOTER = struct.Struct('<QQ8s')
+
+COMPRESSIONS = (None, 'zlib')
+
+
+class ArchiveWriter:
+    ''' Writes the raw data of many frames to a single compact archive file, that `ArchiveReader` can read any frame
+        of without reading the rest. Frames are stored as packed 10-bit values - 5/8 of the size of the unpacked
+        `bayer_array` - without the JPEG, and optionally compressed losslessly with zlib.
+
+    Use as a context manager, or call `close()` when done: the index is written on closing.
+
+    Example:
+        with ArchiveWriter('frames.picamraw', compression='zlib') as archive:
+            for filepath in filepaths:
+                archive.add_file(filepath)
+    '''
+    def __init__(self, path, compression=None, compression_level=1):
+        '''
+        Args:
+            path: The path of the archive file to write
+            compression: Optional - defaults to None. None to store frames uncompressed, or 'zlib'.
+            compression_level: Optional - defaults to 1 (the fastest). The zlib compression level.
+        '''
+        if compression not in COMPRESSIONS:
+            raise ValueError('Unknown compression {compression!r}: expected one of {COMPRESSIONS}'.format(
+                compression=compression, COMPRESSIONS=COMPRESSIONS
+            ))
+
+        self.compression = compression
+        self.compression_level = compression_level
+        self._index = []  # type: list
+        self._file = open(path, mode='wb')
+        self._file.write(_ARCHIVE_PREAMBLE.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_file(self, filepath, camera_version=None, sensor_mode=0, name=None):
+        ''' Add the raw data of a JPEG+RAW file. The packed pixel data is copied across without being unpacked.
+
+        Args:
+            filepath: The full path of the JPEG+RAW image
+            camera_version: Optional - defaults to None. See `extract_raw_from_jpeg` for details.
+            sensor_mode: Optional - defaults to 0. See `extract_raw_from_jpeg` for details.
+            name: Optional - defaults to `filepath`. The name to index the frame by.
+        '''
+        camera_version, sensor_mode = main._resolve_raw_format(filepath, camera_version, sensor_mode)
+        pixel_bytes, header = main._read_pixel_bytes_and_header(filepath, camera_version, sensor_mode, memory_map=False)
+
+        self._add_packed(
+            packed_bytes_2d=main._pixel_bytes_to_2d(pixel_bytes, header),
+            bayer_order=main.BROADCOM_BAYER_ORDER_TO_ENUM[header.bayer_order],
+            header=header,
+            camera_version=camera_version,
+            sensor_mode=sensor_mode,
+            name=filepath if name is None else name,
+        )
+
+    def add(self, raw_bayer, name=None):
+        ''' Add the `bayer_array` of a `PiRawBayer`, re-packing it to 10-bit values. Its width must be a multiple of 4.
+
+        Args:
+            raw_bayer: A `PiRawBayer` object, e.g. of a region of interest
+            name: Optional - defaults to the `filepath` of `raw_bayer`. The name to index the frame by.
+        '''
+        self._add_packed(
+            packed_bytes_2d=main._pack_10bit_values(raw_bayer.bayer_array),
+            bayer_order=raw_bayer.bayer_order,
+            header=raw_bayer.header,
+            camera_version=raw_bayer.camera_version,
+            sensor_mode=raw_bayer.sensor_mode,
+            name=raw_bayer.filepath if name is None else name,
+        )
+
+    def _add_packed(self, packed_bytes_2d, bayer_order, header, camera_version, sensor_mode, name):
+        height, packed_width = packed_bytes_2d.shape
+        packed_bytes_2d = np.ascontiguousarray(packed_bytes_2d)
+
+        offset = self._file.tell()
+        if self.compression == 'zlib':
+            self._file.write(zlib.compress(packed_bytes_2d, self.compression_level))
+        else:
+            self._file.write(packed_bytes_2d.data)
+
+        self._index.append({
+            'name': name,
+            'offset': offset,
+            'length': self._file.tell() - offset,
+            'compression': self.compression,
+            'width': packed_width * 4 // 5,
+            'height': height,
+            'bayer_order': bayer_order.value,
+            'camera_version': None if camera_version is None else camera_version.value,
+            'sensor_mode': sensor_mode,
+            'header': None if header is None else bytes(header).hex(),
+        })
+
+    def close(self):
+        if self._file.closed:
+            return
+
+        index_bytes = json.dumps(self._index).encode('utf-8')
+        index_offset = self._file.tell()
+        self._file.write(index_bytes)
+        self._file.write(_ARCHIVE_FOOTER.pack(index_offset, len(index_bytes), ARCHIVE_MAGIC))
+        self._file.close()
+
+
+class ArchiveReader:
+    ''' Reads frames from an archive written by `ArchiveWriter`. Any frame can be read without reading (or
+        decompressing) the others. Safe to share between threads.
+
+    Attrs:
+        index: A list with a dict of metadata for each frame: its 'name', 'width', 'height', 'bayer_order',
+            'camera_version', 'sensor_mode' and the 'offset', 'length' and 'compression' of its data in the archive
+
+    Example:
+        with ArchiveReader('frames.picamraw') as archive:
+            bayer_array, bayer_order = archive.read_frame(10)
+    '''
+    def __init__(self, path):
+        self._file = open(path, mode='rb')
+        self._lock = threading.Lock()
+
+        try:
+            magic, version = _ARCHIVE_PREAMBLE.unpack(self._file.read(_ARCHIVE_PREAMBLE.size))
+            if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+                raise ValueError('{path} is not a version {ARCHIVE_VERSION} picamraw archive'.format(
+                    path=path, ARCHIVE_VERSION=ARCHIVE_VERSION
+                ))
+
+            self._file.seek(-_ARCHIVE_FOOTER.size, 2)
+            index_offset, index_length, footer_magic = _ARCHIVE_FOOTER.unpack(self._file.read(_ARCHIVE_FOOTER.size))
+            if footer_magic != ARCHIVE_MAGIC:
+                raise ValueError('{path} is an incomplete picamraw archive'.format(path=path))
+
+            self._file.seek(index_offset)
+            self.index = json.loads(self._file.read(index_length).decode('utf-8'))
+        except BaseException:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def read_frame(self, frame_index, out=None):
+        ''' Read and unpack a single frame
+
+        Args:
+            frame_index: The index of the frame in the archive
+            out: Optional. A preallocated 2D uint16 array to unpack the frame into, e.g. one reused from frame to frame.
+
+        Returns: (bayer_data, bayer_order), as returned by `extract_raw_from_jpeg`
+        '''
+        frame = self.index[frame_index]
+
+        return (
+            main._unpack_10bit_values(self.read_packed_frame(frame_index), out=out),
+            BayerOrder(frame['bayer_order']),
+        )
+
+    def read_packed_frame(self, frame_index):
+        ''' Read a single frame without unpacking it
+
+        Returns:
+            The packed 10-bit values of the frame, as a 2D array of uint8
+        '''
+        frame = self.index[frame_index]
+
+        with self._lock:
+            self._file.seek(frame['offset'])
+            frame_bytes = self._file.read(frame['length'])
+
+        if frame['compression'] == 'zlib':
+            frame_bytes = zlib.decompress(frame_bytes)
+
+        return np.frombuffer(frame_bytes, dtype=np.uint8).reshape((frame['height'], frame['width'] * 5 // 4))
+
+    def read_header(self, frame_index):
+        ''' Returns: The `BroadcomRawHeader` of the raw data a frame came from, or None if it wasn't recorded '''
+        header_hex = self.index[frame_index]['header']
+        if header_hex is None:
+            return None
+        return main.BroadcomRawHeader.from_buffer_copy(bytes.fromhex(header_hex))
+
+    def close(self):
+        self._file.close()
+
+
+def write_archive(path, filepaths, camera_version=None, sensor_mode=0, compression=None):
+    ''' Write the raw data of many JPEG+RAW files to a single archive. See `ArchiveWriter` for details. '''
+    with ArchiveWriter(path, compression=compression) as archive:
+        for filepath in filepaths:
+            archive.add_file(filepath, camera_version, sensor_mode)
@@ -0,0 +1,59 @@
+import pkg_resources
+
+import numpy as np
+import pytest
+
+from . import archive as module
+from .constants import BayerOrder, PiCameraVersion
+from .main import PiRawBayer
+
+picamv2_jpeg_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2.jpeg')
+picamv2_BGGR_bayer_array_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2_BGGR_bayer_array.npy')
+
+
+class TestArchive:
+    @pytest.mark.parametrize('compression', module.COMPRESSIONS)
+    def test_reads_back_each_frame(self, tmpdir, compression):
+        archive_path = str(tmpdir.join('frames.picamraw'))
+        expected = np.load(picamv2_BGGR_bayer_array_path)
+
+        with module.ArchiveWriter(archive_path, compression=compression) as archive:
+            archive.add_file(picamv2_jpeg_path, PiCameraVersion.V2)
+            archive.add(PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, roi=(1, 2, 8, 4)), name='region')
+
+        with module.ArchiveReader(archive_path) as archive:
+            assert len(archive) == 2
+            assert [frame['name'] for frame in archive.index] == [picamv2_jpeg_path, 'region']
+
+            region_array, region_bayer_order = archive.read_frame(1)
+            np.testing.assert_array_equal(region_array, expected[2:6, 1:9])
+            assert region_bayer_order == BayerOrder.GBRG
+
+            bayer_array, bayer_order = archive.read_frame(0)
+            np.testing.assert_array_equal(bayer_array, expected)
+            assert bayer_order == BayerOrder.BGGR
+            assert archive.read_header(0).width == 3280
+
+    def test_stores_packed_10bit_values(self, tmpdir):
+        archive_path = str(tmpdir.join('frames.picamraw'))
+
+        module.write_archive(archive_path, [picamv2_jpeg_path], PiCameraVersion.V2)
+
+        with module.ArchiveReader(archive_path) as archive:
+            assert archive.index[0]['length'] == 3280 * 2464 * 5 // 4
+            assert archive.read_packed_frame(0).shape == (2464, 4100)
+
+    def test_raises_on_unknown_compression(self, tmpdir):
+        with pytest.raises(ValueError):
+            module.ArchiveWriter(str(tmpdir.join('frames.picamraw')), compression='lzw')
+
+    def test_raises_on_incomplete_archive(self, tmpdir):
+        archive_path = str(tmpdir.join('frames.picamraw'))
+        writer = module.ArchiveWriter(archive_path)
+        writer.add_file(picamv2_jpeg_path, PiCameraVersion.V2)
+        writer._file.flush()
+
+        with pytest.raises(ValueError, match='incomplete'):
+            module.ArchiveReader(archive_path)
+
+        writer.close()
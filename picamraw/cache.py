@@ -0,0 +1,209 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+# Default upper bound on the total size of the arrays held by a `FrameCache`
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class FrameCache:
+    ''' An in-process cache of decoded frames, evicting the least recently used once the total size of the cached
+        arrays exceeds `max_bytes`. Safe to share between threads, e.g. with `PiRawBayer.from_files`.
+
+    Pass a `FrameCache` as the `cache` argument of `PiRawBayer` to reuse decoded frames across `PiRawBayer` objects for
+    the same file, e.g. when sweeping ROIs or conversions. Frames are keyed on the file's identity (see
+    `file_cache_key`), so a file that is modified is decoded again.
+
+    Attrs:
+        max_bytes: The upper bound on the total size (in bytes) of the cached arrays
+        hits: The number of lookups that found a cached value
+        misses: The number of lookups that didn't
+    '''
+    def __init__(self, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        ''' The total size (in bytes) of the cached arrays '''
+        return self._nbytes
+
+    def get(self, key):
+        ''' Returns the value cached for `key`, marking it as most recently used, or None if it isn't cached '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            value, _ = entry
+            return value
+
+    def put(self, key, value, nbytes):
+        ''' Cache `value` for `key`, evicting the least recently used values until the cache fits within `max_bytes`.
+            A value larger than `max_bytes` is not cached at all.
+
+        Args:
+            key: A hashable key
+            value: The value to cache. Arrays should be made read-only first, as they are handed out without copying.
+            nbytes: The size of `value` in bytes
+        '''
+        with self._lock:
+            if key in self._entries:
+                _, previous_nbytes = self._entries.pop(key)
+                self._nbytes -= previous_nbytes
+
+            if nbytes > self.max_bytes:
+                return
+
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+def file_cache_key(filepath, camera_version, sensor_mode):
+    ''' Returns a key identifying the current contents of a file, as decoded with the given camera version and sensor
+        mode: (absolute path, modification time in ns, size in bytes, camera_version, sensor_mode)
+    '''
+    stat = os.stat(filepath)
+    return (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, camera_version, sensor_mode)
+
+
+# Suffixes of the sidecar files written next to each JPEG+RAW file, when no sidecar directory is given
+SIDECAR_ARRAY_SUFFIX = '.picamraw.npy'
+SIDECAR_METADATA_SUFFIX = '.picamraw.json'
+
+
+class SidecarCache:
+    ''' An on-disk cache of decoded frames, each stored as a `.npy` file of the unpacked bayer array (that is loaded
+        memory-mapped and read-only) plus a JSON file of metadata. A sidecar is only used while the modification time
+        and size of its JPEG+RAW file are unchanged since it was written.
+
+    Pass a `SidecarCache` as the `disk_cache` argument of `PiRawBayer` to decode each file once and load the sidecar
+    instead on later runs.
+
+    Attrs:
+        directory: The directory sidecars are written to, or None to write them next to each JPEG+RAW file
+    '''
+    def __init__(self, directory=None):
+        self.directory = directory
+
+    def paths(self, filepath):
+        ''' Returns: (array_path, metadata_path) of the sidecar files for a JPEG+RAW file '''
+        if self.directory is None:
+            sidecar_prefix = filepath
+        else:
+            # Name the sidecars after the source's absolute path, so that files of the same name don't collide
+            path_hash = hashlib.sha1(os.path.abspath(filepath).encode('utf-8')).hexdigest()
+            sidecar_prefix = os.path.join(self.directory, path_hash)
+
+        return sidecar_prefix + SIDECAR_ARRAY_SUFFIX, sidecar_prefix + SIDECAR_METADATA_SUFFIX
+
+    def load(self, filepath, camera_version, sensor_mode):
+        ''' Load the decoded frame of a JPEG+RAW file from its sidecar, if there's one that is up to date
+
+        Returns: (bayer_array, header_bytes), or None if there's no up-to-date sidecar
+            bayer_array: The bayer array, as a read-only memory-mapped array
+            header_bytes: The bytes of the raw data's `BroadcomRawHeader`
+        '''
+        array_path, metadata_path = self.paths(filepath)
+
+        try:
+            with open(metadata_path) as metadata_file:
+                metadata = json.load(metadata_file)
+            source_stat = os.stat(filepath)
+        except (OSError, ValueError):
+            return None
+
+        is_up_to_date = (
+            metadata.get('source_size') == source_stat.st_size
+            and metadata.get('source_mtime_ns') == source_stat.st_mtime_ns
+            and metadata.get('camera_version') == camera_version.value
+            and metadata.get('sensor_mode') == sensor_mode
+        )
+        if not is_up_to_date:
+            return None
+
+        try:
+            bayer_array = np.load(array_path, mmap_mode='r')
+            header_bytes = bytes.fromhex(metadata['header'])
+        except (KeyError, OSError, ValueError):
+            return None
+
+        if list(bayer_array.shape) != [metadata.get('height'), metadata.get('width')]:
+            return None
+
+        return bayer_array, header_bytes
+
+    def save(self, filepath, source_stat, camera_version, sensor_mode, bayer_array, header):
+        ''' Write the decoded frame of a JPEG+RAW file to its sidecar. Each sidecar file is written to a temporary file
+            and then moved into place, so that readers never see a partly-written sidecar. If the sidecar can't be
+            written (e.g. the directory is read-only), nothing is written.
+
+        Args:
+            filepath: The full path of the JPEG+RAW image that was decoded
+            source_stat: The `os.stat` of the JPEG+RAW image from before it was decoded. If the file was modified while
+                it was being decoded, the sidecar is then out of date as soon as it's written.
+            camera_version: The `PiCameraVersion` it was decoded with
+            sensor_mode: The sensor mode it was decoded with
+            bayer_array: The decoded bayer array of the whole image
+            header: The `BroadcomRawHeader` of the raw data
+        '''
+        array_path, metadata_path = self.paths(filepath)
+
+        try:
+            metadata = {
+                'source_size': source_stat.st_size,
+                'source_mtime_ns': source_stat.st_mtime_ns,
+                'camera_version': camera_version.value,
+                'sensor_mode': sensor_mode,
+                'width': header.width,
+                'height': header.height,
+                'padding_right': header.padding_right,
+                'padding_down': header.padding_down,
+                'bayer_order': header.bayer_order,
+                'header': bytes(header).hex(),
+            }
+
+            # The metadata is written last: until it is, any previous sidecar is out of date and won't be loaded
+            _write_atomically(array_path, lambda file: np.save(file, bayer_array))
+            _write_atomically(metadata_path, lambda file: file.write(json.dumps(metadata).encode('utf-8')))
+        except OSError:
+            pass
+
+
+def _write_atomically(path, write):
+    ''' Call `write` with a temporary file alongside `path`, and then move the temporary file to `path` '''
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as temporary_file:
+        try:
+            write(temporary_file)
+        except BaseException:
+            temporary_file.close()
+            os.remove(temporary_file.name)
+            raise
+
+    os.replace(temporary_file.name, path)
@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+import pytest
+
+from . import cache as module
+from .constants import PiCameraVersion
+from .main import BroadcomRawHeader
+
+
+class TestFrameCache:
+    def test_get_returns_cached_value(self):
+        cache = module.FrameCache(max_bytes=10)
+        cache.put('key', 'value', nbytes=4)
+
+        assert cache.get('key') == 'value'
+        assert cache.get('missing') is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_evicts_least_recently_used_to_fit(self):
+        cache = module.FrameCache(max_bytes=10)
+        cache.put('a', 'A', nbytes=4)
+        cache.put('b', 'B', nbytes=4)
+        cache.get('a')
+        cache.put('c', 'C', nbytes=4)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 'A'
+        assert cache.get('c') == 'C'
+        assert cache.nbytes == 8
+
+    def test_does_not_cache_values_larger_than_max_bytes(self):
+        cache = module.FrameCache(max_bytes=10)
+        cache.put('a', 'A', nbytes=4)
+        cache.put('big', 'BIG', nbytes=11)
+
+        assert cache.get('big') is None
+        assert cache.get('a') == 'A'
+
+    def test_replacing_value_updates_size(self):
+        cache = module.FrameCache(max_bytes=10)
+        cache.put('a', 'A', nbytes=4)
+        cache.put('a', 'AA', nbytes=6)
+
+        assert cache.get('a') == 'AA'
+        assert len(cache) == 1
+        assert cache.nbytes == 6
+
+    def test_clear(self):
+        cache = module.FrameCache(max_bytes=10)
+        cache.put('a', 'A', nbytes=4)
+        cache.clear()
+
+        assert len(cache) == 0
+        assert cache.nbytes == 0
+
+
+class TestFileCacheKey:
+    def test_changes_when_file_is_modified(self, tmpdir):
+        filepath = str(tmpdir.join('image.jpeg'))
+        with open(filepath, mode='wb') as file:
+            file.write(b'first')
+        os.utime(filepath, ns=(0, 0))
+        key = module.file_cache_key(filepath, 'V2', 0)
+
+        with open(filepath, mode='wb') as file:
+            file.write(b'second')
+        os.utime(filepath, ns=(0, 0))
+
+        assert module.file_cache_key(filepath, 'V2', 0) != key
+        assert module.file_cache_key(filepath, 'V2', 1) != module.file_cache_key(filepath, 'V2', 0)
+
+
+class TestSidecarCache:
+    @pytest.fixture
+    def source_path(self, tmpdir):
+        source_path = str(tmpdir.join('image.jpeg'))
+        with open(source_path, mode='wb') as file:
+            file.write(b'jpeg+raw')
+        return source_path
+
+    @pytest.fixture
+    def header(self):
+        return BroadcomRawHeader(name=b'imx219', width=4, height=2, bayer_order=2)
+
+    def test_load_returns_saved_frame(self, source_path, header):
+        bayer_array = np.arange(8, dtype=np.uint16).reshape((2, 4))
+        sidecar_cache = module.SidecarCache()
+        sidecar_cache.save(source_path, os.stat(source_path), PiCameraVersion.V2, 0, bayer_array, header)
+
+        actual_array, actual_header_bytes = sidecar_cache.load(source_path, PiCameraVersion.V2, 0)
+
+        np.testing.assert_array_equal(actual_array, bayer_array)
+        assert isinstance(actual_array, np.memmap)
+        assert not actual_array.flags.writeable
+        assert actual_header_bytes == bytes(header)
+        assert os.path.exists(source_path + '.picamraw.npy')
+        assert os.path.exists(source_path + '.picamraw.json')
+
+    def test_writes_to_directory(self, source_path, header, tmpdir):
+        directory = str(tmpdir.mkdir('sidecars'))
+        sidecar_cache = module.SidecarCache(directory)
+        sidecar_cache.save(
+            source_path, os.stat(source_path), PiCameraVersion.V2, 0, np.zeros((2, 4), dtype=np.uint16), header
+        )
+
+        assert len(os.listdir(directory)) == 2
+        assert sidecar_cache.load(source_path, PiCameraVersion.V2, 0) is not None
+
+    def test_load_misses_when_source_changes(self, source_path, header):
+        sidecar_cache = module.SidecarCache()
+        sidecar_cache.save(
+            source_path, os.stat(source_path), PiCameraVersion.V2, 0, np.zeros((2, 4), dtype=np.uint16), header
+        )
+
+        with open(source_path, mode='ab') as file:
+            file.write(b'more')
+
+        assert sidecar_cache.load(source_path, PiCameraVersion.V2, 0) is None
+
+    def test_load_misses_for_other_sensor_mode(self, source_path, header):
+        sidecar_cache = module.SidecarCache()
+        sidecar_cache.save(
+            source_path, os.stat(source_path), PiCameraVersion.V2, 0, np.zeros((2, 4), dtype=np.uint16), header
+        )
+
+        assert sidecar_cache.load(source_path, PiCameraVersion.V2, 1) is None
+
+    def test_load_misses_without_sidecar(self, source_path):
+        assert module.SidecarCache().load(source_path, PiCameraVersion.V2, 0) is None
+
+    def test_save_ignores_unwritable_directory(self, source_path, header, tmpdir):
+        sidecar_cache = module.SidecarCache(str(tmpdir.join('missing')))
+
+        sidecar_cache.save(
+            source_path, os.stat(source_path), PiCameraVersion.V2, 0, np.zeros((2, 4), dtype=np.uint16), header
+        )
+
+        assert sidecar_cache.load(source_path, PiCameraVersion.V2, 0) is None
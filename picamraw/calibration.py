@@ -0,0 +1,131 @@
+import numpy as np
+
+from . import instrumentation
+from . import main
+from .resolution import PiRegion, PiResolution
+
+
+# The (row, column) positions of the four pixels of each 2x2 bayer tile
+BAYER_TILE_POSITIONS = ((0, 0), (0, 1), (1, 0), (1, 1))
+
+
+class Calibration:
+    ''' Corrects bayer arrays with master dark and flat frames: subtracts the dark frame (and/or a constant black
+        level), clamps negative values to 0, and divides by the flat frame normalized per bayer channel.
+
+    The masters are prepared once, on initialization, and stored as one float32 plane per bayer tile position, so the
+    same `Calibration` can be applied to any number of frames - or regions of frames - of the same sensor mode.
+
+    Example:
+        calibration = Calibration.from_files(dark_frame_path='dark.npy', flat_frame_path='flat.npy')
+        raw_bayer = PiRawBayer('path/to/image.jpeg', PiCameraVersion.V2, calibration=calibration)
+
+    Master frames can be made by averaging many dark or flat exposures, e.g. with `picamraw.stacking.stack_frames`.
+    '''
+    def __init__(self, dark_frame=None, flat_frame=None, black_level=0):
+        '''
+        Args:
+            dark_frame: Optional. A 2D master dark frame (including the sensor's black level) to subtract.
+            flat_frame: Optional. A 2D master flat frame - already corrected for its own dark signal - to divide by.
+                Each bayer channel of it is normalized to its mean, so flat fielding doesn't change the color balance.
+            black_level: Optional - defaults to 0. A constant to subtract, in addition to `dark_frame`.
+        '''
+        shapes = {frame.shape for frame in (dark_frame, flat_frame) if frame is not None}
+        if len(shapes) > 1:
+            raise ValueError('Dark frame ({}) and flat frame ({}) are different shapes'.format(
+                dark_frame.shape, flat_frame.shape
+            ))
+
+        self.black_level = black_level
+        self.resolution = None if not shapes else PiResolution(*reversed(shapes.pop()))
+
+        self._offset_planes = None if dark_frame is None else {
+            (y, x): np.add(dark_frame[y::2, x::2], black_level, dtype=np.float32)
+            for y, x in BAYER_TILE_POSITIONS
+        }
+        self._gain_planes = None if flat_frame is None else {
+            (y, x): _flat_plane_to_gain(flat_frame[y::2, x::2])
+            for y, x in BAYER_TILE_POSITIONS
+        }
+
+    @classmethod
+    def from_files(cls, dark_frame_path=None, flat_frame_path=None, black_level=0):
+        ''' Load the master dark and/or flat frames from `.npy` files. See `Calibration` for details. '''
+        return cls(
+            dark_frame=None if dark_frame_path is None else np.load(dark_frame_path),
+            flat_frame=None if flat_frame_path is None else np.load(flat_frame_path),
+            black_level=black_level,
+        )
+
+    @instrumentation.instrumented_call('Calibration.apply')
+    def apply(self, bayer_array, roi=None, dtype=np.uint16, out=None):
+        ''' Calibrate a bayer array, one bayer plane at a time through a single reused float32 scratch plane.
+
+        Args:
+            bayer_array: The 2D bayer array to calibrate
+            roi: Optional. The `PiRegion` (or (x, y, width, height) tuple) of the master frames that `bayer_array` was
+                extracted from, if it's not the whole image.
+            dtype: Optional - defaults to np.uint16. The dtype of the output array. Integer outputs are rounded to the
+                nearest integer and clipped to the dtype's range.
+            out: Optional. A preallocated output array to fill in - which may be `bayer_array` itself, to calibrate it
+                in place. If provided, `dtype` is ignored in favor of the dtype of `out`.
+
+        Returns:
+            The calibrated array, of the same shape as `bayer_array`
+        '''
+        height, width = bayer_array.shape
+        roi = PiRegion(0, 0, width, height) if roi is None else PiRegion(*roi)
+        if (roi.width, roi.height) != (width, height):
+            raise ValueError('Region of interest ({roi}) is not the size of the bayer array ({width}x{height})'.format(
+                roi=roi, width=width, height=height
+            ))
+        if self.resolution is not None:
+            main._guard_region_is_within_image(roi, self.resolution)
+
+        with instrumentation.stage('calibrate'):
+            output_array = main._prepare_output_array(out, bayer_array.shape, dtype)
+            is_integer_output = np.issubdtype(output_array.dtype, np.integer)
+            scratch = np.empty(((height + 1) // 2, (width + 1) // 2), dtype=np.float32)
+            instrumentation.record_allocation(scratch.nbytes)
+
+            for y, x in BAYER_TILE_POSITIONS:
+                values = bayer_array[y::2, x::2]
+                plane = scratch[:values.shape[0], :values.shape[1]]
+
+                # The position of this plane within the master frames' planes
+                master_y, master_x = roi.y + y, roi.x + x
+                master_tile_position = (master_y % 2, master_x % 2)
+                master_slice = (
+                    slice(master_y // 2, master_y // 2 + values.shape[0]),
+                    slice(master_x // 2, master_x // 2 + values.shape[1]),
+                )
+
+                plane[...] = values
+                if self._offset_planes is None:
+                    plane -= self.black_level
+                else:
+                    plane -= self._offset_planes[master_tile_position][master_slice]
+                np.maximum(plane, 0, out=plane)
+
+                if self._gain_planes is not None:
+                    plane *= self._gain_planes[master_tile_position][master_slice]
+
+                if is_integer_output:
+                    np.rint(plane, out=plane)
+                    np.minimum(plane, np.iinfo(output_array.dtype).max, out=plane)
+
+                output_array[y::2, x::2] = plane
+
+            return output_array
+
+
+def _flat_plane_to_gain(flat_plane):
+    ''' Returns the gain to multiply each pixel of a bayer plane by to flatten it: the plane's mean over its value.
+        Pixels with no signal in the flat are left as they are (a gain of 1).
+    '''
+    flat_plane = flat_plane.astype(np.float32)
+    has_signal = flat_plane > 0
+
+    gain = np.ones_like(flat_plane)
+    np.divide(flat_plane[has_signal].mean(), flat_plane, out=gain, where=has_signal)
+    return gain
@@ -0,0 +1,108 @@
+import pkg_resources
+
+import numpy as np
+import pytest
+
+from . import calibration as module
+from .constants import PiCameraVersion
+from .main import PiRawBayer
+
+picamv2_jpeg_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2.jpeg')
+picamv2_BGGR_bayer_array_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2_BGGR_bayer_array.npy')
+
+
+@pytest.fixture
+def bayer_array():
+    return np.array([
+        [100, 200, 300, 400],
+        [500, 600, 700, 800],
+        [10, 20, 30, 40],
+        [50, 60, 70, 80],
+    ], dtype=np.uint16)
+
+
+class TestCalibration:
+    def test_subtracts_black_level_and_clamps(self, bayer_array):
+        actual = module.Calibration(black_level=64).apply(bayer_array)
+
+        assert actual.dtype == np.uint16
+        np.testing.assert_array_equal(actual[0], [36, 136, 236, 336])
+        np.testing.assert_array_equal(actual[2], [0, 0, 0, 0])
+
+    def test_subtracts_dark_frame_and_black_level(self, bayer_array):
+        dark_frame = np.full(bayer_array.shape, 5, dtype=np.uint16)
+        dark_frame[0, 0] = 50
+
+        actual = module.Calibration(dark_frame=dark_frame, black_level=10).apply(bayer_array, dtype=np.float32)
+
+        assert actual.dtype == np.float32
+        np.testing.assert_array_equal(actual[0], [40, 185, 285, 385])
+
+    def test_divides_by_flat_normalized_per_channel(self, bayer_array):
+        flat_frame = np.ones(bayer_array.shape, dtype=np.float32)
+        # Halve the top left pixel of each tile in the top row, so its channel's mean is 0.75
+        flat_frame[0, 0::2] = 0.5
+
+        actual = module.Calibration(flat_frame=flat_frame).apply(bayer_array, dtype=np.float32)
+
+        np.testing.assert_allclose(actual[0], [100 * 1.5, 200, 300 * 1.5, 400])
+        np.testing.assert_allclose(actual[2], [10 * 0.75, 20, 30 * 0.75, 40])
+
+    def test_leaves_pixels_without_flat_signal(self, bayer_array):
+        flat_frame = np.ones(bayer_array.shape, dtype=np.float32)
+        flat_frame[1, 1] = 0
+
+        actual = module.Calibration(flat_frame=flat_frame).apply(bayer_array)
+
+        np.testing.assert_array_equal(actual, bayer_array)
+
+    def test_applies_in_place(self, bayer_array):
+        actual = module.Calibration(black_level=10).apply(bayer_array, out=bayer_array)
+
+        assert actual is bayer_array
+        assert bayer_array[0, 0] == 90
+
+    def test_applies_masters_of_region(self, bayer_array):
+        dark_frame = np.arange(16, dtype=np.uint16).reshape((4, 4))
+        calibration = module.Calibration(dark_frame=dark_frame)
+
+        actual = calibration.apply(bayer_array[1:4, 1:3], roi=(1, 1, 2, 3))
+
+        np.testing.assert_array_equal(actual, bayer_array[1:4, 1:3] - dark_frame[1:4, 1:3])
+
+    def test_raises_on_region_outside_masters(self, bayer_array):
+        calibration = module.Calibration(dark_frame=np.zeros((4, 4)))
+
+        with pytest.raises(ValueError, match='not within the image'):
+            calibration.apply(bayer_array[:2, :2], roi=(3, 3, 2, 2))
+
+    def test_raises_on_mismatched_masters(self):
+        with pytest.raises(ValueError, match='different shapes'):
+            module.Calibration(dark_frame=np.zeros((4, 4)), flat_frame=np.ones((2, 2)))
+
+    def test_from_files(self, tmpdir):
+        dark_frame_path = str(tmpdir.join('dark.npy'))
+        np.save(dark_frame_path, np.full((2, 2), 3, dtype=np.uint16))
+
+        calibration = module.Calibration.from_files(dark_frame_path=dark_frame_path)
+
+        np.testing.assert_array_equal(calibration.apply(np.full((2, 2), 10, dtype=np.uint16)), np.full((2, 2), 7))
+
+
+class TestPiRawBayerCalibration:
+    def test_calibrates_bayer_array(self):
+        calibration = module.Calibration(black_level=64)
+        expected = np.load(picamv2_BGGR_bayer_array_path).astype(np.int32) - 64
+        expected[expected < 0] = 0
+
+        raw_bayer = PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, roi=(1, 1, 8, 8), calibration=calibration)
+
+        assert raw_bayer.bayer_array.dtype == np.uint16
+        np.testing.assert_array_equal(raw_bayer.bayer_array, expected[1:9, 1:9])
+
+    def test_lazy_to_rgb_is_calibrated(self):
+        calibration = module.Calibration(black_level=1023)
+
+        raw_bayer = PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, lazy=True, calibration=calibration)
+
+        assert not raw_bayer.to_rgb().any()
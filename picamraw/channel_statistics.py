@@ -0,0 +1,101 @@
+from collections import namedtuple, OrderedDict
+
+import numpy as np
+
+from .constants import BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES, MAX_10BIT_VALUE
+
+
+# The number of possible values of a 10-bit pixel, and so of bins in each channel's histogram
+HISTOGRAM_BIN_COUNT = MAX_10BIT_VALUE + 1
+
+DEFAULT_PERCENTILES = (1, 5, 25, 75, 95, 99)
+
+# The number of rows of each channel to histogram at a time. Each band is copied into a small contiguous temporary.
+STATISTICS_BAND_HEIGHT = 64
+
+CHANNEL_NAMES = ('R', 'G1', 'G2', 'B')
+
+
+class ChannelStatistics(namedtuple('ChannelStatistics', (
+    'count', 'mean', 'min', 'max', 'median', 'percentiles', 'saturated_count', 'histogram'
+))):
+    ''' Statistics of the values of a single bayer channel
+
+    Attrs:
+        count: The number of pixels
+        mean: The mean value
+        min: The smallest value
+        max: The largest value
+        median: The 50th percentile (see `percentiles`)
+        percentiles: An OrderedDict of {percentile: value}. Each value is the lowest value that at least that
+            percentage of the pixels are less than or equal to (the "nearest rank" percentile).
+        saturated_count: The number of pixels at or above the saturation level
+        histogram: An array of the number of pixels with each value, 0 to 1023
+    '''
+    __slots__ = ()
+
+
+def channel_statistics(bayer_array, bayer_order, percentiles=DEFAULT_PERCENTILES, saturation_level=MAX_10BIT_VALUE):
+    ''' Calculate statistics of each bayer channel of 10-bit bayer data from integer histograms. Each channel is read
+        through a strided view of `bayer_array`: no RGB (or other full-size) array is built.
+
+    Args:
+        bayer_array: The 2D bayer array of 10-bit values, of any integer dtype
+        bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the `bayer_array`
+        percentiles: Optional - defaults to (1, 5, 25, 75, 95, 99). The percentiles to calculate, from 0 to 100.
+        saturation_level: Optional - defaults to 1023. The value at or above which a pixel is counted as saturated.
+
+    Returns:
+        An OrderedDict of {channel name: `ChannelStatistics`}, for the channels 'R', 'G1', 'G2' and 'B'
+    '''
+    channel_coordinates = BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES[bayer_order]
+
+    return OrderedDict(
+        (
+            channel_name,
+            _histogram_statistics(_channel_histogram(bayer_array[y::2, x::2]), percentiles, saturation_level),
+        )
+        for channel_name, (y, x) in zip(CHANNEL_NAMES, channel_coordinates)
+    )
+
+
+def _channel_histogram(channel_values):
+    ''' Count the number of pixels with each 10-bit value, a band of rows at a time '''
+    histogram = np.zeros(HISTOGRAM_BIN_COUNT, dtype=np.int64)
+
+    for band_start in range(0, channel_values.shape[0], STATISTICS_BAND_HEIGHT):
+        band_values = channel_values[band_start:band_start + STATISTICS_BAND_HEIGHT].ravel()
+        band_histogram = np.bincount(band_values, minlength=HISTOGRAM_BIN_COUNT)
+        if len(band_histogram) > HISTOGRAM_BIN_COUNT:
+            raise ValueError('Unable to calculate statistics of values larger than 10 bits (max {})'.format(
+                MAX_10BIT_VALUE
+            ))
+        histogram += band_histogram
+
+    return histogram
+
+
+def _histogram_statistics(histogram, percentiles, saturation_level):
+    count = int(histogram.sum())
+    if count == 0:
+        raise ValueError('Unable to calculate statistics of an empty channel')
+
+    values = np.arange(HISTOGRAM_BIN_COUNT)
+    nonzero_values = np.flatnonzero(histogram)
+    cumulative_counts = np.cumsum(histogram)
+
+    def _percentile(percentile):
+        # The rank of the pixel at the percentile, counting from 1, is ceil(percentile / 100 * count)
+        rank = max(-(-percentile * count // 100), 1)
+        return int(np.searchsorted(cumulative_counts, rank))
+
+    return ChannelStatistics(
+        count=count,
+        mean=float(np.dot(histogram, values)) / count,
+        min=int(nonzero_values[0]),
+        max=int(nonzero_values[-1]),
+        median=_percentile(50),
+        percentiles=OrderedDict((percentile, _percentile(percentile)) for percentile in percentiles),
+        saturated_count=int(histogram[saturation_level:].sum()),
+        histogram=histogram,
+    )
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from . import channel_statistics as module
+from .constants import BayerOrder
+
+
+class TestChannelStatistics:
+    def test_calculates_statistics_per_channel(self):
+        bayer_array = np.array([
+            [1, 10, 3, 10],
+            [20, 1023, 40, 1023],
+            [5, 30, 7, 50],
+            [60, 1023, 80, 0],
+        ], dtype=np.uint16)
+
+        actual = module.channel_statistics(bayer_array, BayerOrder.RGGB, percentiles=(0, 25, 100))
+
+        assert list(actual.keys()) == ['R', 'G1', 'G2', 'B']
+
+        red = actual['R']
+        assert red.count == 4
+        assert red.mean == 4
+        assert (red.min, red.max) == (1, 7)
+        assert red.median == 3
+        assert red.percentiles == {0: 1, 25: 1, 100: 7}
+        assert red.saturated_count == 0
+        assert red.histogram.shape == (1024,)
+        assert red.histogram[[1, 3, 5, 7]].tolist() == [1, 1, 1, 1]
+
+        # In RGGB, G1 is below R and G2 is to its right
+        assert actual['G1'].mean == np.mean([20, 40, 60, 80])
+        assert actual['G2'].mean == np.mean([10, 10, 30, 50])
+        assert actual['B'].saturated_count == 3
+        assert actual['B'].min == 0
+
+    def test_matches_numpy_over_many_bands(self, mocker):
+        mocker.patch.object(module, 'STATISTICS_BAND_HEIGHT', 3)
+        bayer_array = np.random.RandomState(0).randint(0, 1024, size=(20, 16)).astype(np.uint16)
+
+        actual = module.channel_statistics(bayer_array, BayerOrder.BGGR, percentiles=(10, 90))
+
+        blue_values = bayer_array[0::2, 0::2]
+        assert actual['B'].count == blue_values.size
+        assert actual['B'].mean == pytest.approx(blue_values.mean())
+        # Nearest rank: the ceil(0.9 * 80)th smallest value
+        assert actual['B'].percentiles[90] == np.sort(blue_values, axis=None)[72 - 1]
+        assert actual['B'].saturated_count == np.count_nonzero(blue_values == 1023)
+
+    def test_saturation_level(self):
+        bayer_array = np.array([[900, 0], [0, 1000]], dtype=np.uint16)
+
+        actual = module.channel_statistics(bayer_array, BayerOrder.RGGB, saturation_level=900)
+
+        assert actual['R'].saturated_count == 1
+        assert actual['B'].saturated_count == 1
+        assert actual['G1'].saturated_count == 0
+
+    def test_raises_on_values_larger_than_10_bits(self):
+        with pytest.raises(ValueError, match='10 bits'):
+            module.channel_statistics(np.array([[1024, 0], [0, 0]], dtype=np.uint16), BayerOrder.RGGB)
@@ -28,6 +28,10 @@ class BayerOrder(Enum):
     GRBG = 'GRBG'
 
 
+# The largest value that fits in 10 bits: the raw data's maximum pixel value
+MAX_10BIT_VALUE = 0b1111111111
+
+
 BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES = {
     # (ry, rx), (gy, gx), (Gy, Gx), (by, bx)
     BayerOrder.RGGB: ((0, 0), (1, 0), (0, 1), (1, 1)),
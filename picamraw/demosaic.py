@@ -0,0 +1,210 @@
+import numpy as np
+
+from . import instrumentation
+from .constants import BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES
+from .parallel import imap
+
+
+# Each kernel is a list of (row offset, column offset, weight) terms, applied around every pixel it's used at.
+# Bilinear interpolation: the mean of the nearest neighbors of the wanted color.
+_BILINEAR_CROSS = [(-1, 0, 1 / 4), (1, 0, 1 / 4), (0, -1, 1 / 4), (0, 1, 1 / 4)]
+_BILINEAR_DIAGONAL = [(-1, -1, 1 / 4), (-1, 1, 1 / 4), (1, -1, 1 / 4), (1, 1, 1 / 4)]
+_BILINEAR_HORIZONTAL = [(0, -1, 1 / 2), (0, 1, 1 / 2)]
+_BILINEAR_VERTICAL = [(-1, 0, 1 / 2), (1, 0, 1 / 2)]
+
+# Malvar-He-Cutler interpolation: bilinear interpolation corrected by the gradient of the pixel's own color.
+# See "High-quality linear interpolation for demosaicing of Bayer-patterned color images", Malvar et al. (2004)
+_MALVAR_GREEN_AT_RED_OR_BLUE = [
+    (0, 0, 4 / 8),
+    (-1, 0, 2 / 8), (1, 0, 2 / 8), (0, -1, 2 / 8), (0, 1, 2 / 8),
+    (-2, 0, -1 / 8), (2, 0, -1 / 8), (0, -2, -1 / 8), (0, 2, -1 / 8),
+]
+# At a green pixel, for the color of its horizontal neighbors
+_MALVAR_HORIZONTAL_AT_GREEN = [
+    (0, 0, 5 / 8),
+    (0, -1, 4 / 8), (0, 1, 4 / 8),
+    (-1, -1, -1 / 8), (-1, 1, -1 / 8), (1, -1, -1 / 8), (1, 1, -1 / 8),
+    (0, -2, -1 / 8), (0, 2, -1 / 8),
+    (-2, 0, 0.5 / 8), (2, 0, 0.5 / 8),
+]
+# At a green pixel, for the color of its vertical neighbors
+_MALVAR_VERTICAL_AT_GREEN = [(column, row, weight) for row, column, weight in _MALVAR_HORIZONTAL_AT_GREEN]
+# At a red pixel for blue, or at a blue pixel for red
+_MALVAR_DIAGONAL_AT_RED_OR_BLUE = [
+    (0, 0, 6 / 8),
+    (-1, -1, 2 / 8), (-1, 1, 2 / 8), (1, -1, 2 / 8), (1, 1, 2 / 8),
+    (-2, 0, -1.5 / 8), (2, 0, -1.5 / 8), (0, -2, -1.5 / 8), (0, 2, -1.5 / 8),
+]
+
+# The kernels of each method: (green at red or blue, horizontal at green, vertical at green, diagonal at red or blue)
+DEMOSAIC_KERNELS = {
+    'bilinear': (_BILINEAR_CROSS, _BILINEAR_HORIZONTAL, _BILINEAR_VERTICAL, _BILINEAR_DIAGONAL),
+    'malvar_he_cutler': (
+        _MALVAR_GREEN_AT_RED_OR_BLUE,
+        _MALVAR_HORIZONTAL_AT_GREEN,
+        _MALVAR_VERTICAL_AT_GREEN,
+        _MALVAR_DIAGONAL_AT_RED_OR_BLUE,
+    ),
+}
+
+# The number of pixels around each tile that the kernels reach
+TILE_HALO = 2
+
+DEFAULT_TILE_SIZE = 256
+
+
+@instrumentation.instrumented_call('demosaic')
+def demosaic(bayer_array, bayer_order, method='malvar_he_cutler', dtype=np.float64, out=None,
+             tile_size=DEFAULT_TILE_SIZE, workers=None):
+    ''' Interpolate the 2D `bayer_array` to a full-resolution 3D RGB array.
+
+    The image is processed in square tiles (each with a halo of the pixels around it, reflected at the edges of the
+    image), so the working set of each tile is small, and tiles are processed in parallel on a pool of threads.
+
+    Args:
+        bayer_array: the 2D bayer array to demosaic
+        bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the `bayer_array`
+        method: Optional - defaults to 'malvar_he_cutler'. One of:
+            'bilinear': Each missing color is the mean of its nearest neighbors of that color
+            'malvar_he_cutler': Bilinear interpolation, corrected by the gradient of the pixel's own color, which
+                reduces color fringes at edges (Malvar, He & Cutler, 2004)
+        dtype: Optional - defaults to np.float64. The dtype of the output array. Interpolated values below 0 are
+            clipped to 0, and for integer dtypes values are rounded and clipped to the dtype's range.
+        out: Optional. A preallocated output array to fill in, e.g. one reused from a previous frame. If provided,
+            `dtype` is ignored in favor of the dtype of `out`.
+        tile_size: Optional - defaults to 256. The height and width of each tile, rounded up to an even number.
+        workers: Optional - defaults to the number of CPUs. The number of tiles to process concurrently.
+
+    Returns:
+        A 3D numpy array with the same 2D dimensions as `bayer_array`, in which every pixel has all of [R, G, B]
+    '''
+    if method not in DEMOSAIC_KERNELS:
+        raise ValueError('Unknown demosaic method {method!r}: expected one of {methods}'.format(
+            method=method, methods=tuple(sorted(DEMOSAIC_KERNELS))
+        ))
+
+    height, width = bayer_array.shape
+    output_shape = (height, width, 3)
+    if out is None:
+        rgb_array = np.empty(output_shape, dtype=dtype)
+        instrumentation.record_allocation(rgb_array.nbytes)
+    elif out.shape != output_shape:
+        raise ValueError(
+            'Output array is the wrong shape: expected {output_shape}, got {out.shape}'
+            .format(output_shape=output_shape, out=out)
+        )
+    else:
+        rgb_array = out
+
+    # Keep tiles aligned to the 2x2 bayer pattern, so that every tile has the same bayer order as the whole image
+    tile_size = tile_size + tile_size % 2
+    tile_origins = [
+        (tile_y, tile_x)
+        for tile_y in range(0, height, tile_size)
+        for tile_x in range(0, width, tile_size)
+    ]
+
+    def _demosaic_tile(tile_origin):
+        tile_y, tile_x = tile_origin
+        _demosaic_tile_into(
+            bayer_array,
+            bayer_order,
+            DEMOSAIC_KERNELS[method],
+            rgb_array[tile_y:tile_y + tile_size, tile_x:tile_x + tile_size],
+            tile_y,
+            tile_x,
+        )
+
+    with instrumentation.stage('demosaic'):
+        if workers == 1 or len(tile_origins) == 1:
+            for tile_origin in tile_origins:
+                _demosaic_tile(tile_origin)
+        else:
+            for _ in imap(_demosaic_tile, tile_origins, workers=workers):
+                pass
+
+    return rgb_array
+
+
+def _demosaic_tile_into(bayer_array, bayer_order, kernels, rgb_tile, tile_y, tile_x):
+    ''' Demosaic the tile of `bayer_array` at (`tile_y`, `tile_x`) into `rgb_tile` '''
+    green_at_red_or_blue, horizontal_at_green, vertical_at_green, diagonal_at_red_or_blue = kernels
+    tile_height, tile_width = rgb_tile.shape[:2]
+    padded_tile = _get_padded_tile(bayer_array, tile_y, tile_x, tile_height, tile_width)
+
+    ((ry, rx), (gy, gx), (Gy, Gx), (by, bx)) = BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES[bayer_order]
+
+    # One of the two greens shares its row with red (and so has red neighbors horizontally); the other with blue
+    if gy == ry:
+        (red_row_green_y, red_row_green_x), (blue_row_green_y, blue_row_green_x) = (gy, gx), (Gy, Gx)
+    else:
+        (red_row_green_y, red_row_green_x), (blue_row_green_y, blue_row_green_x) = (Gy, Gx), (gy, gx)
+
+    # For each of the 4 positions in the bayer pattern: the kernel (or None, for the pixel's own value) of each channel
+    kernels_by_position = [
+        ((ry, rx), (None, green_at_red_or_blue, diagonal_at_red_or_blue)),
+        ((by, bx), (diagonal_at_red_or_blue, green_at_red_or_blue, None)),
+        ((red_row_green_y, red_row_green_x), (horizontal_at_green, None, vertical_at_green)),
+        ((blue_row_green_y, blue_row_green_x), (vertical_at_green, None, horizontal_at_green)),
+    ]
+
+    is_integer_output = np.issubdtype(rgb_tile.dtype, np.integer)
+
+    for (y, x), channel_kernels in kernels_by_position:
+        plane_shape = ((tile_height - y + 1) // 2, (tile_width - x + 1) // 2)
+        if 0 in plane_shape:
+            continue
+
+        plane = np.empty(plane_shape, dtype=np.float32)
+        scratch = np.empty(plane_shape, dtype=np.float32)
+        for channel_index, kernel in enumerate(channel_kernels):
+            if kernel is None:
+                plane[...] = _padded_plane(padded_tile, y, x, 0, 0, plane_shape)
+            else:
+                _apply_kernel(padded_tile, kernel, y, x, plane, scratch)
+                np.maximum(plane, 0, out=plane)
+                if is_integer_output:
+                    np.rint(plane, out=plane)
+                    np.minimum(plane, np.iinfo(rgb_tile.dtype).max, out=plane)
+
+            rgb_tile[y::2, x::2, channel_index] = plane
+
+
+def _get_padded_tile(bayer_array, tile_y, tile_x, tile_height, tile_width):
+    ''' Get a float32 copy of a tile of `bayer_array` with a halo of `TILE_HALO` pixels around it. Where the halo falls
+        outside the image, the image is reflected about its edge pixels - which preserves the bayer pattern.
+    '''
+    height, width = bayer_array.shape
+
+    window_top = max(tile_y - TILE_HALO, 0)
+    window_bottom = min(tile_y + tile_height + TILE_HALO, height)
+    window_left = max(tile_x - TILE_HALO, 0)
+    window_right = min(tile_x + tile_width + TILE_HALO, width)
+
+    window = bayer_array[window_top:window_bottom, window_left:window_right].astype(np.float32)
+
+    padding = (
+        (TILE_HALO - (tile_y - window_top), (tile_y + tile_height + TILE_HALO) - window_bottom),
+        (TILE_HALO - (tile_x - window_left), (tile_x + tile_width + TILE_HALO) - window_right),
+    )
+    return np.pad(window, padding, mode='reflect')
+
+
+def _padded_plane(padded_tile, y, x, row_offset, column_offset, plane_shape):
+    ''' A strided view of every other pixel of every other row of a padded tile, starting at (y, x) of the tile
+        itself, offset by (row_offset, column_offset)
+    '''
+    start_y = TILE_HALO + y + row_offset
+    start_x = TILE_HALO + x + column_offset
+    return padded_tile[
+        start_y:start_y + 2 * plane_shape[0]:2,
+        start_x:start_x + 2 * plane_shape[1]:2,
+    ]
+
+
+def _apply_kernel(padded_tile, kernel, y, x, out, scratch):
+    ''' Apply a kernel at every other pixel of every other row of a padded tile, starting at (y, x), into `out` '''
+    out.fill(0)
+    for row_offset, column_offset, weight in kernel:
+        np.multiply(_padded_plane(padded_tile, y, x, row_offset, column_offset, out.shape), weight, out=scratch)
+        out += scratch
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from . import demosaic as module
+from .constants import BayerOrder
+
+
+class TestDemosaic:
+    def test_bilinear_interpolates_from_nearest_neighbors(self):
+        bayer_array = np.array([
+            [10, 20, 30, 40],  # R  G2 R  G2
+            [50, 60, 70, 80],  # G1 B  G1 B
+            [90, 100, 110, 120],  # R  G2 R  G2
+            [130, 140, 150, 160],  # G1 B  G1 B
+        ], dtype=np.uint16)
+
+        actual = module.demosaic(bayer_array, BayerOrder.RGGB, method='bilinear')
+
+        # Each pixel keeps its own value
+        assert actual[1, 1, 2] == 60
+        # Green at a blue pixel: its 4 green neighbors
+        assert actual[1, 1, 1] == (20 + 100 + 50 + 70) / 4
+        # Red at a blue pixel: its 4 red diagonal neighbors
+        assert actual[1, 1, 0] == (10 + 30 + 90 + 110) / 4
+        # At the G2 pixel (in a red row), red is interpolated horizontally and blue vertically
+        assert actual[2, 1, 0] == (90 + 110) / 2
+        assert actual[2, 1, 2] == (60 + 140) / 2
+        # At the G1 pixel (in a blue row), red is interpolated vertically and blue horizontally
+        assert actual[1, 2, 0] == (30 + 110) / 2
+        assert actual[1, 2, 2] == (60 + 80) / 2
+
+    @pytest.mark.parametrize('method', ['bilinear', 'malvar_he_cutler'])
+    @pytest.mark.parametrize('bayer_order', list(BayerOrder))
+    def test_preserves_a_flat_image(self, method, bayer_order):
+        bayer_array = np.full((6, 10), 500, dtype=np.uint16)
+
+        actual = module.demosaic(bayer_array, bayer_order, method=method)
+
+        np.testing.assert_array_equal(actual, 500)
+
+    def test_malvar_he_cutler_reproduces_a_linear_gradient(self):
+        y, x = np.mgrid[0:12, 0:16]
+        bayer_array = (10 * x + 3 * y + 100).astype(np.uint16)
+
+        actual = module.demosaic(bayer_array, BayerOrder.BGGR, method='malvar_he_cutler')
+
+        # Away from the edges of the image (where it is reflected), every channel is the gradient itself
+        np.testing.assert_array_equal(actual[2:-2, 2:-2], np.dstack([bayer_array] * 3)[2:-2, 2:-2])
+
+    @pytest.mark.parametrize('method', ['bilinear', 'malvar_he_cutler'])
+    def test_tiles_and_workers_do_not_change_the_result(self, method):
+        bayer_array = np.random.RandomState(0).randint(0, 1024, size=(37, 53)).astype(np.uint16)
+
+        whole = module.demosaic(bayer_array, BayerOrder.GBRG, method=method, workers=1, tile_size=100)
+        tiled = module.demosaic(bayer_array, BayerOrder.GBRG, method=method, workers=3, tile_size=5)
+
+        np.testing.assert_array_equal(whole, tiled)
+
+    def test_integer_dtype_is_rounded_and_clipped(self):
+        # A bright pixel surrounded by dark ones overshoots below 0 nearby with Malvar-He-Cutler
+        bayer_array = np.zeros((8, 8), dtype=np.uint16)
+        bayer_array[4, 4] = 1023
+
+        actual = module.demosaic(bayer_array, BayerOrder.RGGB, dtype=np.uint8)
+
+        assert actual.dtype == np.uint8
+        assert actual.max() == 255
+        expected = np.clip(np.rint(module.demosaic(bayer_array, BayerOrder.RGGB)), 0, 255)
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_fills_out(self):
+        bayer_array = np.full((4, 4), 7, dtype=np.uint16)
+        out = np.zeros((4, 4, 3), dtype=np.float32)
+
+        actual = module.demosaic(bayer_array, BayerOrder.RGGB, out=out)
+
+        assert actual is out
+        np.testing.assert_array_equal(out, 7)
+
+    def test_raises_on_out_of_wrong_shape(self):
+        with pytest.raises(ValueError, match='wrong shape'):
+            module.demosaic(np.zeros((4, 4)), BayerOrder.RGGB, out=np.zeros((4, 4)))
+
+    def test_raises_on_unknown_method(self):
+        with pytest.raises(ValueError, match='Unknown demosaic method'):
+            module.demosaic(np.zeros((4, 4)), BayerOrder.RGGB, method='nearest')
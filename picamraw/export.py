@@ -0,0 +1,224 @@
+from collections import namedtuple
+import json
+import os
+from typing import Any  # noqa: F401 (used in type comments)
+
+import numpy as np
+
+from . import main
+from .resolution import PiRegion
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python < 3.8
+    resource_tracker = shared_memory = None  # type: ignore
+
+
+# The key of the picamraw metadata (as JSON) in the schema metadata of Arrow record batches
+ARROW_METADATA_KEY = 'picamraw'
+
+
+def raw_bayer_metadata(raw_bayer):
+    ''' The metadata of a `PiRawBayer` that describes its `bayer_array`: where it came from, and the fields of its
+        `BroadcomRawHeader`. Only JSON-compatible types are used, so it can be attached to exported data.
+
+    Returns:
+        A dict of metadata
+    '''
+    header = raw_bayer.header
+    return {
+        'filepath': raw_bayer.filepath,
+        'camera_version': None if raw_bayer.camera_version is None else raw_bayer.camera_version.value,
+        'sensor_mode': raw_bayer.sensor_mode,
+        'roi': None if raw_bayer.roi is None else list(raw_bayer.roi),
+        'bayer_order': raw_bayer.bayer_order.value,
+        'header': {
+            'name': header.name.decode('ascii', errors='replace'),
+            'width': header.width,
+            'height': header.height,
+            'padding_right': header.padding_right,
+            'padding_down': header.padding_down,
+            'transform': header.transform,
+            'format': header.format,
+            'bayer_order': header.bayer_order,
+            'bayer_format': header.bayer_format,
+        },
+    }
+
+
+def to_arrow_tensor(array):
+    ''' Wrap a numpy array (e.g. a `bayer_array` or the output of `to_rgb()`) in a `pyarrow.Tensor`, without copying it.
+        Requires pyarrow.
+    '''
+    pyarrow = _import_pyarrow()
+    return pyarrow.Tensor.from_numpy(array)
+
+
+def to_arrow_record_batch(raw_bayer, array=None, column_name='pixels'):
+    ''' Wrap the `bayer_array` of a `PiRawBayer` (or an array derived from it, e.g. the output of `to_rgb()`) in a
+        `pyarrow.RecordBatch` with a row per row of the image, without copying it. Requires pyarrow.
+
+    Args:
+        raw_bayer: A `PiRawBayer`
+        array: Optional - defaults to `raw_bayer.bayer_array`. The array to wrap. Arrays that aren't C-contiguous (e.g.
+            regions sliced out of a cached frame) are copied into one that is.
+        column_name: Optional - defaults to 'pixels'. The name of the column.
+
+    Returns:
+        A `pyarrow.RecordBatch` with a single fixed-size list column, holding all the values of each row of `array`.
+        The schema metadata holds the `raw_bayer_metadata` of `raw_bayer` and the shape and dtype of `array`, as JSON
+        under the key 'picamraw'.
+    '''
+    pyarrow = _import_pyarrow()
+
+    array = np.ascontiguousarray(raw_bayer.bayer_array if array is None else array)
+    values_per_row = int(np.prod(array.shape[1:]))
+
+    rows = pyarrow.FixedSizeListArray.from_arrays(pyarrow.array(array.reshape(-1)), values_per_row)
+
+    metadata = raw_bayer_metadata(raw_bayer)
+    metadata.update(shape=list(array.shape), dtype=array.dtype.str)
+    schema = pyarrow.schema(
+        [pyarrow.field(column_name, rows.type)],
+        metadata={ARROW_METADATA_KEY: json.dumps(metadata)},
+    )
+
+    return pyarrow.RecordBatch.from_arrays([rows], schema=schema)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('Exporting to Arrow requires pyarrow: pip install pyarrow')
+    return pyarrow
+
+
+class SharedArrayDescriptor(namedtuple('SharedArrayDescriptor', ('name', 'shape', 'dtype'))):
+    ''' Everything another process needs to attach to a `SharedArray`. Picklable, to send over a queue or pipe.
+
+    Attrs:
+        name: The name of the shared memory block
+        shape: The shape of the array
+        dtype: The dtype of the array, as a string
+    '''
+    __slots__ = ()
+
+
+class SharedArray:
+    ''' A numpy array in a block of shared memory (see `multiprocessing.shared_memory`), that other processes can
+        attach to by name and use in place. Requires Python 3.8 or later.
+
+    Arrays can be placed straight into shared memory by passing `array` as the `out` of picamraw functions, e.g.
+    `raw_bayer.to_rgb(out=shared_array.array)`. See also `extract_raw_to_shared_memory`.
+
+    Example:
+        with SharedArray.create((1232, 1640, 3), np.float64) as shared_rgb:
+            raw_bayer.to_rgb(out=shared_rgb.array)
+            queue.put(shared_rgb.descriptor)  # Another process calls `SharedArray.attach(descriptor)`
+
+    Attrs:
+        array: The numpy array, backed by the shared memory
+        shared_memory: The `multiprocessing.shared_memory.SharedMemory` block
+    '''
+    def __init__(self, shared_memory_block, shape, dtype, owner):
+        self.shared_memory = shared_memory_block
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shared_memory_block.buf)  # type: Any
+        self._owner = owner
+
+    @classmethod
+    def create(cls, shape, dtype, name=None):
+        ''' Allocate a new array in shared memory. Its creator should `unlink()` it (or use it as a context manager)
+            once no other process needs to attach to it.
+
+        Args:
+            shape: The shape of the array
+            dtype: The dtype of the array
+            name: Optional - defaults to a unique name. The name of the shared memory block.
+        '''
+        _guard_shared_memory_is_available()
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        # A shared memory block can't be empty
+        shared_memory_block = shared_memory.SharedMemory(name=name, create=True, size=max(nbytes, 1))
+        return cls(shared_memory_block, shape, dtype, owner=True)
+
+    @classmethod
+    def attach(cls, descriptor):
+        ''' Attach to an array that another process created, by its `descriptor` '''
+        _guard_shared_memory_is_available()
+        descriptor = SharedArrayDescriptor(*descriptor)
+        return cls(_attach_shared_memory(descriptor.name), tuple(descriptor.shape), descriptor.dtype, owner=False)
+
+    @property
+    def descriptor(self):
+        return SharedArrayDescriptor(name=self.shared_memory.name, shape=self.array.shape, dtype=self.array.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        if self._owner:
+            self.unlink()
+
+    def close(self):
+        ''' Stop using the array in this process. Any other references to `array` must be dropped first. '''
+        self.array = None
+        self.shared_memory.close()
+
+    def unlink(self):
+        ''' Free the shared memory, once every process has closed it '''
+        self.shared_memory.unlink()
+
+
+def _attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # type: ignore
+    except TypeError:  # Python < 3.13
+        shared_memory_block = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            # Otherwise the block would be unlinked when this process exits, even though this process didn't create it
+            resource_tracker.unregister(shared_memory_block._name, 'shared_memory')  # type: ignore
+        return shared_memory_block
+
+
+def _guard_shared_memory_is_available():
+    if shared_memory is None:
+        raise ImportError('Shared memory requires Python 3.8 or later')
+
+
+def extract_raw_to_shared_memory(filepath, camera_version=None, sensor_mode=0, roi=None, name=None):
+    ''' Extract the raw bayer data of a JPEG+RAW file straight into shared memory: the packed pixel data is unpacked
+        into the shared block, with no intermediate array to copy from.
+
+    Args:
+        filepath: The full path of the JPEG+RAW image
+        camera_version: Optional - defaults to None. See `extract_raw_from_jpeg` for details.
+        sensor_mode: Optional - defaults to 0. See `extract_raw_from_jpeg` for details.
+        roi: Optional. A `PiRegion` (or an (x, y, width, height) tuple) to extract instead of the whole image.
+        name: Optional - defaults to a unique name. The name of the shared memory block.
+
+    Returns: (shared_array, bayer_order)
+        shared_array: A `SharedArray` of the uint16 bayer data, which the caller should `unlink()` when done
+        bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the array
+    '''
+    camera_version, sensor_mode = main._resolve_raw_format(filepath, camera_version, sensor_mode)
+
+    if roi is None:
+        header = main.read_raw_header(filepath, camera_version, sensor_mode)
+        shape = (header.height, header.width)
+    else:
+        roi = PiRegion(*roi)
+        shape = (roi.height, roi.width)
+
+    shared_array = SharedArray.create(shape, np.uint16, name=name)
+    try:
+        _, bayer_order = main.extract_raw_from_jpeg(
+            filepath, camera_version, sensor_mode, out=shared_array.array, roi=roi
+        )
+    except BaseException:
+        shared_array.close()
+        shared_array.unlink()
+        raise
+
+    return shared_array, bayer_order
@@ -0,0 +1,153 @@
+import json
+import multiprocessing
+import pkg_resources
+import sys
+from typing import Any  # noqa: F401 (used in type comments)
+
+import numpy as np
+import pytest
+
+from . import export as module
+from .cache import FrameCache
+from .constants import BayerOrder, PiCameraVersion
+from .main import PiRawBayer
+
+picamv2_jpeg_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2.jpeg')
+picamv2_BGGR_bayer_array_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2_BGGR_bayer_array.npy')
+
+
+@pytest.fixture(scope='module')
+def raw_bayer():
+    return PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, roi=(1, 1, 64, 32))
+
+
+def _sum_shared_array(descriptor, results):
+    ''' Run in a child process: attach to a shared array and report the sum of its values '''
+    shared_array = module.SharedArray.attach(descriptor)
+    results.put(int(shared_array.array.sum()))
+    shared_array.close()
+
+
+class TestPiRawBayerInterfaces:
+    def test_array_interface_shares_bayer_array(self, raw_bayer):
+        actual = np.asarray(raw_bayer)
+
+        assert np.shares_memory(actual, raw_bayer.bayer_array)
+        np.testing.assert_array_equal(actual, raw_bayer.bayer_array)
+
+    def test_dlpack_shares_bayer_array(self, raw_bayer):
+        actual = np.from_dlpack(raw_bayer)
+
+        assert np.shares_memory(actual, raw_bayer.bayer_array)
+        np.testing.assert_array_equal(actual, raw_bayer.bayer_array)
+
+    def test_dlpack_shares_read_only_cached_bayer_array(self):
+        raw_bayer = PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, cache=FrameCache())
+
+        actual = np.from_dlpack(raw_bayer)
+
+        assert np.shares_memory(actual, raw_bayer.bayer_array)
+        assert not actual.flags.writeable
+
+    @pytest.mark.skipif(sys.version_info < (3, 12), reason='The Python buffer protocol requires Python 3.12')
+    def test_memoryview_shares_bayer_array(self, raw_bayer):
+        actual = memoryview(raw_bayer)
+
+        assert actual.shape == raw_bayer.bayer_array.shape
+        assert np.shares_memory(np.asarray(actual), raw_bayer.bayer_array)
+
+
+class TestRawBayerMetadata:
+    def test_describes_raw_bayer_as_json(self, raw_bayer):
+        actual = json.loads(json.dumps(module.raw_bayer_metadata(raw_bayer)))
+
+        assert actual['filepath'] == picamv2_jpeg_path
+        assert actual['camera_version'] == 'IMX219'
+        assert actual['roi'] == [1, 1, 64, 32]
+        assert actual['bayer_order'] == 'RGGB'
+        assert (actual['header']['width'], actual['header']['height']) == (3280, 2464)
+
+
+class TestArrow:
+    def test_tensor_shares_array(self, raw_bayer):
+        pytest.importorskip('pyarrow')
+
+        actual = module.to_arrow_tensor(raw_bayer.bayer_array)
+
+        assert actual.shape == (32, 64)
+        assert np.shares_memory(actual.to_numpy(), raw_bayer.bayer_array)
+
+    def test_record_batch_shares_array_and_carries_metadata(self, raw_bayer):
+        pytest.importorskip('pyarrow')
+
+        actual = module.to_arrow_record_batch(raw_bayer)
+
+        assert actual.num_rows == 32
+        values = actual.column(0).flatten().to_numpy()
+        assert np.shares_memory(values, raw_bayer.bayer_array)
+        metadata = json.loads(actual.schema.metadata[b'picamraw'].decode('utf-8'))
+        assert metadata['shape'] == [32, 64]
+        assert metadata['bayer_order'] == 'RGGB'
+
+    def test_raises_without_pyarrow(self, raw_bayer, mocker):
+        mocker.patch.dict(sys.modules, {'pyarrow': None})
+
+        with pytest.raises(ImportError, match='requires pyarrow'):
+            module.to_arrow_record_batch(raw_bayer)
+
+
+class TestSharedArray:
+    def test_attaches_by_descriptor(self):
+        with module.SharedArray.create((4, 6), np.uint16) as shared_array:
+            shared_array.array[...] = np.arange(24).reshape((4, 6))
+
+            attached = module.SharedArray.attach(shared_array.descriptor)
+            attached.array[0, 0] = 100
+
+            assert shared_array.array[0, 0] == 100
+            np.testing.assert_array_equal(attached.array[1:], shared_array.array[1:])
+            attached.close()
+
+    def test_is_shared_with_another_process(self):
+        results = multiprocessing.Queue()  # type: Any
+        with module.SharedArray.create((100,), np.uint16) as shared_array:
+            shared_array.array[...] = 3
+
+            process = multiprocessing.Process(target=_sum_shared_array, args=(shared_array.descriptor, results))
+            process.start()
+            actual = results.get(timeout=30)
+            process.join()
+
+        assert actual == 300
+
+    def test_rgb_can_be_converted_into_shared_memory(self, raw_bayer):
+        with module.SharedArray.create((16, 32, 3), np.float32) as shared_rgb:
+            actual = raw_bayer.to_rgb(dtype=np.float32, out=shared_rgb.array)
+
+            assert actual is shared_rgb.array
+            np.testing.assert_array_equal(actual, raw_bayer.to_rgb(dtype=np.float32))
+            del actual
+
+
+class TestExtractRawToSharedMemory:
+    @pytest.mark.parametrize('roi,expected_slice,expected_bayer_order', [
+        (None, np.s_[:, :], BayerOrder.BGGR),
+        ((3, 1, 10, 6), np.s_[1:7, 3:13], BayerOrder.RGGB),
+    ])
+    def test_unpacks_into_shared_memory(self, roi, expected_slice, expected_bayer_order):
+        shared_array, bayer_order = module.extract_raw_to_shared_memory(picamv2_jpeg_path, roi=roi)
+
+        with shared_array:
+            assert bayer_order == expected_bayer_order
+            np.testing.assert_array_equal(
+                shared_array.array, np.load(picamv2_BGGR_bayer_array_path)[expected_slice]
+            )
+
+    def test_frees_shared_memory_on_error(self, mocker):
+        mocker.patch.object(module.main, 'extract_raw_from_jpeg', side_effect=ValueError('Corrupt'))
+        spy_unlink = mocker.spy(module.SharedArray, 'unlink')
+
+        with pytest.raises(ValueError, match='Corrupt'):
+            module.extract_raw_to_shared_memory(picamv2_jpeg_path, PiCameraVersion.V2)
+
+        assert spy_unlink.call_count == 1
@@ -0,0 +1,301 @@
+from collections import namedtuple
+import os
+import sqlite3
+
+from . import main
+from .constants import BayerOrder, PiCameraVersion
+from .parallel import imap
+
+
+DEFAULT_PATTERNS = ('.jpg', '.jpeg')
+
+# Reading a header is a couple of small reads, so many more files than CPUs can usefully be read at once
+DEFAULT_SCAN_WORKERS = 16
+
+# The number of rows to write in each transaction while refreshing
+REFRESH_BATCH_SIZE = 10000
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS raw_headers (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    raw_block_size INTEGER,
+    sensor_name TEXT,
+    camera_version TEXT,
+    sensor_mode INTEGER,
+    width INTEGER,
+    height INTEGER,
+    padding_right INTEGER,
+    padding_down INTEGER,
+    bayer_order TEXT,
+    format INTEGER,
+    bayer_format INTEGER
+);
+CREATE INDEX IF NOT EXISTS raw_headers_by_format ON raw_headers (camera_version, sensor_mode);
+CREATE INDEX IF NOT EXISTS raw_headers_by_resolution ON raw_headers (width, height);
+CREATE INDEX IF NOT EXISTS raw_headers_by_bayer_order ON raw_headers (bayer_order);
+'''
+
+
+class IndexedFile(namedtuple('IndexedFile', (
+    'path', 'size', 'mtime_ns', 'raw_block_size', 'sensor_name', 'camera_version', 'sensor_mode', 'width', 'height',
+    'padding_right', 'padding_down', 'bayer_order', 'format', 'bayer_format',
+))):
+    ''' The raw header metadata of a single file in a `HeaderIndex`
+
+    Attrs:
+        path: The absolute path of the file
+        size: The size of the file, in bytes, when it was indexed
+        mtime_ns: The modification time of the file, in nanoseconds, when it was indexed
+        raw_block_size: The size of the raw block at the end of the file, or None if the file has no raw block of a
+            known size (in which case all of the following are None too)
+        sensor_name: The name of the sensor, from the `BroadcomRawHeader`
+        camera_version: A `PiCameraVersion` enum, or None if it couldn't be determined (see `detect_raw_format`)
+        sensor_mode: The lowest sensor mode with the file's raw block size, or None if it couldn't be determined
+        width, height, padding_right, padding_down, format, bayer_format: As in the `BroadcomRawHeader`
+        bayer_order: A `BayerOrder` enum that indicates the bayer pattern of the whole image
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def _from_row(cls, row):
+        indexed_file = cls(*row)
+        camera_version, bayer_order = indexed_file.camera_version, indexed_file.bayer_order
+        return indexed_file._replace(
+            camera_version=None if camera_version is None else PiCameraVersion(camera_version),
+            bayer_order=None if bayer_order is None else BayerOrder(bayer_order),
+        )
+
+
+_COLUMNS = IndexedFile._fields
+
+
+class IndexRefresh(namedtuple('IndexRefresh', ('scanned', 'updated', 'removed'))):
+    ''' The outcome of `HeaderIndex.refresh`
+
+    Attrs:
+        scanned: The number of files found
+        updated: The number of those files whose headers were read, because they were new or had changed
+        removed: The number of files removed from the index, because they no longer exist
+    '''
+    __slots__ = ()
+
+
+class HeaderIndex:
+    ''' An SQLite index of the raw headers of many JPEG+RAW files - their size, resolution, bayer order, camera version
+        and sensor mode - to find captures by format without decoding (or even fully reading) them.
+
+    Only the `BroadcomRawHeader` at the end of each file (and the 'BRCM' marker in front of it) is read, on a pool of
+    threads. Refreshing the index only reads the headers of files that are new or whose size or modification time have
+    changed since they were last indexed, and removes the files that no longer exist.
+
+    Example:
+        with HeaderIndex('captures.sqlite') as index:
+            index.refresh(['/data/captures'])
+            paths = [indexed_file.path for indexed_file in index.query(sensor_mode=0, bayer_order=BayerOrder.BGGR)]
+    '''
+    def __init__(self, path):
+        '''
+        Args:
+            path: The path of the SQLite database to store the index in. It's created if it doesn't exist.
+        '''
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM raw_headers').fetchone()[0]
+
+    def refresh(self, roots, patterns=DEFAULT_PATTERNS, workers=DEFAULT_SCAN_WORKERS):
+        ''' Bring the index up to date with the files under `roots`
+
+        Args:
+            roots: An iterable of paths of directories to scan recursively, and/or of individual files
+            patterns: Optional - defaults to ('.jpg', '.jpeg'). The (case-insensitive) suffixes of the names of files
+                to index within directories.
+            workers: Optional - defaults to 16. The number of files to read headers from concurrently.
+
+        Returns:
+            An `IndexRefresh` with the number of files scanned, updated and removed
+        '''
+        scanned = updated = removed = 0
+
+        for root in roots:
+            root = os.path.abspath(root)
+            indexed = self._indexed_sizes_and_mtimes(root)
+
+            changed_files = []
+            for filepath, stat in _iter_files(root, tuple(pattern.lower() for pattern in patterns)):
+                scanned += 1
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if indexed.pop(filepath, None) != signature:
+                    changed_files.append((filepath, signature))
+
+            rows = imap(lambda changed_file: _read_row(*changed_file), changed_files, workers=workers)
+            updated += self._write_rows(rows)
+
+            # Anything left in `indexed` wasn't found
+            with self._connection:
+                self._connection.executemany('DELETE FROM raw_headers WHERE path = ?', ((path,) for path in indexed))
+            removed += len(indexed)
+
+        return IndexRefresh(scanned=scanned, updated=updated, removed=removed)
+
+    def _indexed_sizes_and_mtimes(self, root):
+        ''' Returns: {path: (size, mtime_ns)} of the indexed files that are (or are under) `root` '''
+        directory_prefix = os.path.join(root, '')
+        cursor = self._connection.execute(
+            'SELECT path, size, mtime_ns FROM raw_headers WHERE path = ? OR (path >= ? AND path < ?)',
+            # All paths that start with the prefix sort between it and the prefix followed by the largest character
+            (root, directory_prefix, directory_prefix + '\U0010ffff'),
+        )
+        return {path: (size, mtime_ns) for path, size, mtime_ns in cursor}
+
+    def _write_rows(self, rows):
+        insert = 'INSERT OR REPLACE INTO raw_headers ({columns}) VALUES ({placeholders})'.format(
+            columns=', '.join(_COLUMNS), placeholders=', '.join('?' * len(_COLUMNS))
+        )
+
+        written = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == REFRESH_BATCH_SIZE:
+                with self._connection:
+                    self._connection.executemany(insert, batch)
+                written += len(batch)
+                batch = []
+
+        with self._connection:
+            self._connection.executemany(insert, batch)
+        return written + len(batch)
+
+    def query(self, camera_version=None, sensor_mode=None, width=None, height=None, bayer_order=None,
+              path_prefix=None):
+        ''' Find indexed files that have raw data, matching all of the given criteria
+
+        Args:
+            camera_version: Optional. A `PiCameraVersion` enum.
+            sensor_mode: Optional. An integer sensor mode. Note that sensor modes that share a raw block size are
+                indexed as the lowest of them (see `detect_raw_format`).
+            width: Optional. The width of the image.
+            height: Optional. The height of the image.
+            bayer_order: Optional. A `BayerOrder` enum.
+            path_prefix: Optional. Only find files whose absolute paths start with this.
+
+        Returns:
+            A list of `IndexedFile`, ordered by path
+        '''
+        criteria = [
+            ('camera_version', None if camera_version is None else camera_version.value),
+            ('sensor_mode', sensor_mode),
+            ('width', width),
+            ('height', height),
+            ('bayer_order', None if bayer_order is None else bayer_order.value),
+        ]
+        conditions = ['raw_block_size IS NOT NULL']
+        parameters = []
+        for column, value in criteria:
+            if value is not None:
+                conditions.append('{column} = ?'.format(column=column))
+                parameters.append(value)
+        if path_prefix is not None:
+            conditions.append('substr(path, 1, ?) = ?')
+            parameters.extend([len(path_prefix), path_prefix])
+
+        cursor = self._connection.execute(
+            'SELECT {columns} FROM raw_headers WHERE {conditions} ORDER BY path'.format(
+                columns=', '.join(_COLUMNS), conditions=' AND '.join(conditions)
+            ),
+            parameters,
+        )
+        return [IndexedFile._from_row(row) for row in cursor]
+
+    def get(self, path):
+        ''' Returns: The `IndexedFile` of a file, or None if it isn't indexed '''
+        row = self._connection.execute(
+            'SELECT {columns} FROM raw_headers WHERE path = ?'.format(columns=', '.join(_COLUMNS)),
+            (os.path.abspath(path),),
+        ).fetchone()
+        return None if row is None else IndexedFile._from_row(row)
+
+    def close(self):
+        self._connection.close()
+
+
+def _iter_files(root, suffixes):
+    ''' Yields (path, stat) of `root` if it's a file, or else of each file under it with one of `suffixes`. As with
+        `os.walk`, symlinks to directories aren't followed, so a symlink cycle can't make the walk loop.
+    '''
+    if not os.path.isdir(root):
+        try:
+            yield root, os.stat(root)
+        except OSError:  # The file doesn't exist (any more)
+            pass
+        return
+
+    directories = [root]
+    while directories:
+        try:
+            entries = list(os.scandir(directories.pop()))
+        except OSError:  # The directory was removed, or can't be read
+            continue
+
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.name.lower().endswith(suffixes) and entry.is_file():
+                    yield entry.path, entry.stat()
+            except OSError:  # The file was removed
+                continue
+
+
+def _read_row(filepath, signature):
+    ''' Read the raw header of a file, and returns its row of the index: all columns but the first three are None if
+        the file has no raw block (or can't be read). Only the known raw block sizes are checked, so a file without a
+        raw block costs a few small reads rather than a scan of the whole file.
+    '''
+    size, mtime_ns = signature
+    try:
+        with open(filepath, mode='rb') as file:
+            raw_block_size, header_bytes = main._locate_raw_block_of_known_size(file, os.fstat(file.fileno()).st_size)
+    except OSError:
+        raw_block_size = None
+
+    if raw_block_size is None:
+        return (filepath, size, mtime_ns) + (None,) * (len(_COLUMNS) - 3)
+
+    header = main.BroadcomRawHeader.from_buffer_copy(header_bytes)
+    try:
+        camera_version, sensor_mode = main._get_camera_version_and_sensor_mode(header, raw_block_size)
+    except ValueError:  # The camera version is ambiguous, or the raw block size isn't a known sensor mode
+        camera_version, sensor_mode = None, None
+
+    bayer_order = main.BROADCOM_BAYER_ORDER_TO_ENUM.get(header.bayer_order)
+
+    return (
+        filepath,
+        size,
+        mtime_ns,
+        raw_block_size,
+        header.name.decode('ascii', errors='replace'),
+        None if camera_version is None else camera_version.value,
+        sensor_mode,
+        header.width,
+        header.height,
+        header.padding_right,
+        header.padding_down,
+        None if bayer_order is None else bayer_order.value,
+        header.format,
+        header.bayer_format,
+    )
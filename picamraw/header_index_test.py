@@ -0,0 +1,132 @@
+import os
+import pkg_resources
+import shutil
+
+import pytest
+
+from . import header_index as module
+from . import instrumentation
+from .constants import BayerOrder, PiCameraVersion
+
+picamv2_jpeg_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2.jpeg')
+
+
+@pytest.fixture
+def captures_directory(tmpdir):
+    captures_directory = tmpdir.mkdir('captures')
+    shutil.copy(picamv2_jpeg_path, str(captures_directory.join('a.jpeg')))
+    shutil.copy(picamv2_jpeg_path, str(captures_directory.mkdir('day2').join('b.JPG')))
+    captures_directory.join('notes.txt').write('not a capture')
+    captures_directory.join('plain.jpg').write_binary(b'\xff\xd8 a JPEG without raw data')
+    return str(captures_directory)
+
+
+@pytest.fixture
+def header_index(tmpdir):
+    with module.HeaderIndex(str(tmpdir.join('index.sqlite'))) as header_index:
+        yield header_index
+
+
+class TestHeaderIndex:
+    def test_indexes_headers_of_matching_files(self, header_index, captures_directory):
+        actual = header_index.refresh([captures_directory])
+
+        assert actual == module.IndexRefresh(scanned=3, updated=3, removed=0)
+        assert len(header_index) == 3
+
+        indexed_file = header_index.get(os.path.join(captures_directory, 'a.jpeg'))
+        assert indexed_file.size == os.path.getsize(picamv2_jpeg_path)
+        assert indexed_file.camera_version == PiCameraVersion.V2
+        assert indexed_file.sensor_mode == 0
+        assert (indexed_file.width, indexed_file.height) == (3280, 2464)
+        assert indexed_file.bayer_order == BayerOrder.BGGR
+        header = module.main.read_raw_header(picamv2_jpeg_path, PiCameraVersion.V2)
+        assert indexed_file.sensor_name == header.name.decode('ascii')
+        assert (indexed_file.padding_right, indexed_file.padding_down) == (header.padding_right, header.padding_down)
+
+        without_raw_data = header_index.get(os.path.join(captures_directory, 'plain.jpg'))
+        assert without_raw_data.raw_block_size is None
+        assert without_raw_data.width is None
+
+    def test_queries_by_format(self, header_index, captures_directory):
+        header_index.refresh([captures_directory])
+
+        actual = header_index.query(camera_version=PiCameraVersion.V2, sensor_mode=0, bayer_order=BayerOrder.BGGR)
+
+        assert [indexed_file.path for indexed_file in actual] == [
+            os.path.join(captures_directory, 'a.jpeg'),
+            os.path.join(captures_directory, 'day2', 'b.JPG'),
+        ]
+        assert header_index.query(width=1640) == []
+        assert len(header_index.query(path_prefix=os.path.join(captures_directory, 'day2'))) == 1
+
+    def test_refresh_only_reads_new_and_changed_files(self, header_index, captures_directory, mocker):
+        header_index.refresh([captures_directory])
+        spy_read_row = mocker.spy(module, '_read_row')
+
+        changed_path = os.path.join(captures_directory, 'a.jpeg')
+        stat = os.stat(changed_path)
+        os.utime(changed_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        os.remove(os.path.join(captures_directory, 'day2', 'b.JPG'))
+
+        actual = header_index.refresh([captures_directory])
+
+        assert actual == module.IndexRefresh(scanned=2, updated=1, removed=1)
+        assert [call[0][0] for call in spy_read_row.call_args_list] == [changed_path]
+        assert header_index.get(changed_path).mtime_ns == stat.st_mtime_ns + 10 ** 9
+        assert header_index.get(os.path.join(captures_directory, 'day2', 'b.JPG')) is None
+
+    def test_refresh_of_subdirectory_leaves_the_rest(self, header_index, captures_directory):
+        header_index.refresh([captures_directory])
+
+        actual = header_index.refresh([os.path.join(captures_directory, 'day2')])
+
+        assert actual == module.IndexRefresh(scanned=1, updated=0, removed=0)
+        assert len(header_index) == 3
+
+    def test_persists_between_connections(self, tmpdir, captures_directory):
+        index_path = str(tmpdir.join('index.sqlite'))
+        with module.HeaderIndex(index_path) as header_index:
+            header_index.refresh([captures_directory])
+
+        with module.HeaderIndex(index_path) as header_index:
+            actual = header_index.refresh([captures_directory])
+
+        assert actual == module.IndexRefresh(scanned=3, updated=0, removed=0)
+
+    def test_does_not_follow_symlinks_to_directories(self, header_index, captures_directory):
+        os.symlink('..', os.path.join(captures_directory, 'day2', 'up'))
+
+        actual = header_index.refresh([captures_directory])
+
+        assert actual == module.IndexRefresh(scanned=3, updated=3, removed=0)
+
+    def test_indexes_individual_files(self, header_index, captures_directory):
+        filepath = os.path.join(captures_directory, 'a.jpeg')
+
+        header_index.refresh([filepath])
+        os.remove(filepath)
+        actual = header_index.refresh([filepath])
+
+        assert actual == module.IndexRefresh(scanned=0, updated=0, removed=1)
+        assert len(header_index) == 0
+
+
+class TestReadRow:
+    def test_reads_only_the_start_of_candidate_raw_blocks(self, tmpdir):
+        filepath = str(tmpdir.join('large.jpg'))
+        # Larger than every known raw block size, and without a raw block at the end
+        with open(filepath, mode='wb') as file:
+            file.write(b'\xff\xd8' + b'\0' * (12 * 1024 * 1024))
+        stat = os.stat(filepath)
+
+        @instrumentation.instrumented_call('read_row')
+        def _read_row():
+            with instrumentation.stage('read'):
+                return module._read_row(filepath, (stat.st_size, stat.st_mtime_ns))
+
+        with instrumentation.instrument() as measurements:
+            actual = _read_row()
+
+        assert actual[3:] == (None,) * (len(module._COLUMNS) - 3)
+        assert measurements[0].bytes_read < 16 * 1024
@@ -0,0 +1,187 @@
+from collections import namedtuple
+from contextlib import contextmanager
+import functools
+import threading
+import time
+
+
+class StageMeasurement(namedtuple('StageMeasurement', ('stage', 'seconds', 'bytes_read', 'bytes_allocated'))):
+    ''' The measurements of a single stage of an instrumented call
+
+    Attrs:
+        stage: The name of the stage: one of 'locate', 'read', 'parse_header', 'reshape', 'unpack', 'rgb', '3d',
+            'planes', 'calibrate' or 'demosaic'
+        seconds: The wall time spent in the stage
+        bytes_read: The number of bytes read from the file. For memory-mapped files, this is the size of the mapping.
+        bytes_allocated: The number of bytes allocated for arrays (outputs and scratch buffers)
+    '''
+    __slots__ = ()
+
+
+class CallMeasurement(namedtuple('CallMeasurement', ('call', 'seconds', 'stages'))):
+    ''' The measurements of an instrumented call, e.g. of `extract_raw_from_jpeg` or of initializing a `PiRawBayer`
+
+    Attrs:
+        call: The name of the function or method called
+        seconds: The wall time of the whole call
+        stages: A list of `StageMeasurement`s, in the order the stages ran. A stage may appear more than once.
+    '''
+    __slots__ = ()
+
+    @property
+    def bytes_read(self):
+        return sum(stage.bytes_read for stage in self.stages)
+
+    @property
+    def bytes_allocated(self):
+        return sum(stage.bytes_allocated for stage in self.stages)
+
+
+# Every registered callback is called with the `CallMeasurement` of every instrumented call. The list is replaced
+# rather than modified, so that it can be checked and iterated without holding the lock.
+_callbacks = []  # type: list
+_callbacks_lock = threading.Lock()
+
+# The call (and stage within it) currently being measured on each thread
+_measuring = threading.local()
+
+
+def add_callback(callback):
+    ''' Start calling `callback` with a `CallMeasurement` after each instrumented call, on any thread.
+
+    Instrumented calls are `PiRawBayer` initialization and its methods, and the public extraction and conversion
+    functions. When one instrumented call makes another, only the outer call is reported, including the stages of
+    both. Calls that raise an exception are not reported. Exceptions raised by `callback` are propagated to the caller.
+
+    While no callback is registered, instrumentation costs a single check per call and per stage.
+    '''
+    global _callbacks
+    with _callbacks_lock:
+        _callbacks = _callbacks + [callback]
+
+
+def remove_callback(callback):
+    ''' Stop calling a callback registered with `add_callback` '''
+    global _callbacks
+    with _callbacks_lock:
+        callbacks = list(_callbacks)
+        callbacks.remove(callback)
+        _callbacks = callbacks
+
+
+@contextmanager
+def instrument(callback=None):
+    ''' Measure the instrumented calls made (on any thread) within a `with` block. See `add_callback` for details.
+
+    Args:
+        callback: Optional. A function to call with the `CallMeasurement` of each call as soon as it completes.
+
+    Returns:
+        A context manager that gives a list, to which the `CallMeasurement` of each call is appended
+
+    Example:
+        with instrument() as measurements:
+            PiRawBayer('path/to/image.jpeg', PiCameraVersion.V2)
+
+        for stage in measurements[0].stages:
+            print(stage.stage, stage.seconds)
+    '''
+    measurements = []
+
+    def _record(call_measurement):
+        measurements.append(call_measurement)
+        if callback is not None:
+            callback(call_measurement)
+
+    add_callback(_record)
+    try:
+        yield measurements
+    finally:
+        remove_callback(_record)
+
+
+def instrumented_call(call_name):
+    ''' Decorator that reports the `CallMeasurement` of each call of the decorated function to the registered
+        callbacks, unless it's made from within another instrumented call
+    '''
+    def _decorator(function):
+        @functools.wraps(function)
+        def _wrapper(*args, **kwargs):
+            if not _callbacks or getattr(_measuring, 'stages', None) is not None:
+                return function(*args, **kwargs)
+
+            _measuring.stages = []
+            _measuring.stage = None
+            start_time = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+                call_measurement = CallMeasurement(call_name, time.perf_counter() - start_time, _measuring.stages)
+            finally:
+                _measuring.stages = None
+                _measuring.stage = None
+
+            for callback in _callbacks:
+                callback(call_measurement)
+
+            return result
+        return _wrapper
+    return _decorator
+
+
+class _Stage:
+    ''' Context manager that measures a stage of the current call '''
+    __slots__ = ('name', 'bytes_read', 'bytes_allocated', '_start_time')
+
+    def __init__(self, name):
+        self.name = name
+        self.bytes_read = 0
+        self.bytes_allocated = 0
+
+    def __enter__(self):
+        _measuring.stage = self
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self._start_time
+        _measuring.stage = None
+        _measuring.stages.append(StageMeasurement(self.name, seconds, self.bytes_read, self.bytes_allocated))
+
+
+class _NotMeasured:
+    ''' Context manager that does nothing, used for stages when no call is being measured '''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NOT_MEASURED = _NotMeasured()
+
+
+def stage(stage_name):
+    ''' Returns a context manager that measures a stage of the current call, if it's being measured. Stages don't nest:
+        within another stage, this does nothing, and the outer stage is measured as a whole.
+    '''
+    if not _callbacks or getattr(_measuring, 'stages', None) is None or _measuring.stage is not None:
+        return _NOT_MEASURED
+    return _Stage(stage_name)
+
+
+def record_read(byte_count):
+    ''' Add to the bytes read by the current stage, if it's being measured '''
+    if _callbacks:
+        current_stage = getattr(_measuring, 'stage', None)
+        if current_stage is not None:
+            current_stage.bytes_read += byte_count
+
+
+def record_allocation(byte_count):
+    ''' Add to the bytes allocated by the current stage, if it's being measured '''
+    if _callbacks:
+        current_stage = getattr(_measuring, 'stage', None)
+        if current_stage is not None:
+            current_stage.bytes_allocated += byte_count
@@ -0,0 +1,85 @@
+import threading
+
+from . import instrumentation as module
+
+
+@module.instrumented_call('outer')
+def _outer():
+    with module.stage('first'):
+        module.record_read(10)
+        module.record_allocation(20)
+    _inner()
+    return 'result'
+
+
+@module.instrumented_call('inner')
+def _inner():
+    with module.stage('second'):
+        module.record_read(1)
+        with module.stage('nested'):
+            module.record_read(2)
+
+
+class TestInstrument:
+    def test_measures_stages_of_outer_call_only(self):
+        with module.instrument() as measurements:
+            actual = _outer()
+
+        assert actual == 'result'
+        assert [measurement.call for measurement in measurements] == ['outer']
+        assert [(stage.stage, stage.bytes_read, stage.bytes_allocated) for stage in measurements[0].stages] == [
+            ('first', 10, 20),
+            ('second', 3, 0),
+        ]
+        assert measurements[0].bytes_read == 13
+        assert measurements[0].bytes_allocated == 20
+        assert measurements[0].seconds >= sum(stage.seconds for stage in measurements[0].stages)
+
+    def test_calls_callback(self):
+        callback_measurements = []  # type: list
+
+        with module.instrument(callback_measurements.append) as measurements:
+            _inner()
+
+        assert callback_measurements == measurements
+
+    def test_measures_calls_on_other_threads(self):
+        with module.instrument() as measurements:
+            thread = threading.Thread(target=_inner)
+            thread.start()
+            thread.join()
+            _outer()
+
+        assert sorted(measurement.call for measurement in measurements) == ['inner', 'outer']
+
+    def test_does_not_measure_outside_block(self):
+        with module.instrument() as measurements:
+            pass
+        _outer()
+
+        assert measurements == []
+        assert module._callbacks == []
+
+    def test_does_not_report_calls_that_raise(self):
+        @module.instrumented_call('raises')
+        def _raises():
+            with module.stage('first'):
+                raise ValueError()
+
+        with module.instrument() as measurements:
+            try:
+                _raises()
+            except ValueError:
+                pass
+            _inner()
+
+        assert [measurement.call for measurement in measurements] == ['inner']
+
+
+class TestStage:
+    def test_does_nothing_outside_a_call(self):
+        with module.instrument():
+            with module.stage('first') as stage:
+                module.record_read(10)
+
+        assert stage is module._NOT_MEASURED
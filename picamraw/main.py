@@ -1,9 +1,22 @@
+import asyncio
+from collections import namedtuple, OrderedDict
 import ctypes
+import io
+import os
+import threading
+from typing import Optional
 
 import numpy as np
 
-from .constants import PiCameraVersion, BayerOrder, BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES
-from .resolution import PiResolution
+from . import instrumentation
+from .aio import amap, get_default_unpack_executor
+from .cache import file_cache_key
+from .channel_statistics import channel_statistics, DEFAULT_PERCENTILES
+from .constants import PiCameraVersion, BayerOrder, BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES, MAX_10BIT_VALUE
+from .demosaic import demosaic, DEFAULT_TILE_SIZE
+from .metadata import build_raw_metadata, read_exif_tags, MAX_EXIF_SEGMENT_SIZE
+from .parallel import imap
+from .resolution import PiRegion, PiResolution
 
 
 class PiRawBayer:
@@ -12,37 +25,414 @@ class PiRawBayer:
     Attrs:
         bayer_data: The raw bayer data as a 16-bit 2D numpy array
         bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the `bayer_array`
+        header: The `BroadcomRawHeader` of the raw data, e.g. for its `width`, `height` and padding
+        cache: The `FrameCache` that decoded frames are shared through, or None
+        disk_cache: The `SidecarCache` that decoded frames are stored in on disk, or None
+        calibration: The `Calibration` applied to `bayer_array`, or None
     '''
-    def __init__(self, filepath, camera_version: PiCameraVersion, sensor_mode=0):
+    @instrumentation.instrumented_call('PiRawBayer')
+    def __init__(self, filepath, camera_version: Optional[PiCameraVersion] = None, sensor_mode=0, memory_map=False,
+                 lazy=False, roi=None, cache=None, disk_cache=None, calibration=None):
         ''' Initializing a PiRawBayer object results in extracting the raw bayer data from the provided JPEG+RAW file.
 
         Args:
             filepath: The full path of the JPEG+RAW image to extract raw data from
-            camera_version: A `PiCameraVersion` enum representing the camera hardware version used to capture the image
+            camera_version: A `PiCameraVersion` enum representing the camera hardware version used to capture the image.
+                If None, the camera version and sensor mode are detected from the file (see `detect_raw_format`).
             sensor_mode: Optional - defaults to 0. An integer representing the `sensor_mode` used to capture the image.
                 See https://picamera.readthedocs.io/en/release-1.13/fov.html#sensor-modes for more information
                 on sensor_modes.
+            memory_map: Optional - defaults to False. If True, memory-map the file instead of reading it.
+                See `extract_raw_from_jpeg` for details.
+            lazy: Optional - defaults to False. If True, only the header is read on initialization; the pixel data
+                is extracted on first access to `bayer_array` (or a method that uses it, e.g. `to_rgb()`).
+            roi: Optional. A `PiRegion` (or an (x, y, width, height) tuple) to extract instead of the whole image.
+                See `extract_raw_from_jpeg` for details.
+            cache: Optional. A `FrameCache` to share decoded frames through. The whole frame is decoded and cached once
+                per file (and camera version and sensor mode) and regions are sliced out of it, as are the results of
+                `to_rgb()`. Arrays from the cache are read-only.
+            disk_cache: Optional. A `SidecarCache` to store decoded frames in on disk. The whole frame is loaded from
+                its sidecar (memory-mapped and read-only) if it is up to date, or else decoded and written to it, and
+                regions are sliced out of it.
+            calibration: Optional. A `Calibration` (dark frame, black level and flat field correction) to apply to
+                `bayer_array`, which stays uint16. It's applied in place straight after unpacking, or to a copy of a
+                cached frame.
         '''
-        bayer_array, bayer_order = extract_raw_from_jpeg(filepath, camera_version, sensor_mode)
-        self.bayer_array = bayer_array
-        self.bayer_order = bayer_order
+        camera_version, sensor_mode = _resolve_raw_format(filepath, camera_version, sensor_mode)
+
+        self.filepath = filepath
+        self.camera_version = camera_version
+        self.sensor_mode = sensor_mode
+        self.memory_map = memory_map
+        self.roi = None if roi is None else PiRegion(*roi)
+        self.cache = cache
+        self.disk_cache = disk_cache
+        self.calibration = calibration
+        self._cache_key = None if cache is None else file_cache_key(filepath, camera_version, sensor_mode)
+        self._metadata = None
+
+        if lazy:
+            self._bayer_array = None
+            self.header = read_raw_header(filepath, camera_version, sensor_mode)
+        else:
+            self._bayer_array, self.header = self._extract_raw_and_header()
+
+        self.bayer_order = _get_bayer_order(self.header, self.roi)
+
+    @classmethod
+    def from_files(cls, filepaths, camera_version: Optional[PiCameraVersion] = None, sensor_mode=0, workers=None,
+                   ordered=True, memory_map=False, cache=None, disk_cache=None):
+        ''' Extract the raw bayer data from many JPEG+RAW files in parallel, on a pool of worker threads.
 
-    def to_3d(self):
+        Args:
+            filepaths: An iterable of full paths of JPEG+RAW images to extract raw data from
+            camera_version: A `PiCameraVersion` enum representing the camera hardware version used to capture the
+                images. If None, the camera version and sensor mode of each file are detected from the file.
+            sensor_mode: Optional - defaults to 0. An integer representing the `sensor_mode` used to capture the images.
+            workers: Optional - defaults to the number of CPUs. The number of files to extract concurrently.
+            ordered: Optional - defaults to True. If True, yield objects in the order of `filepaths`. Otherwise yield
+                each one as soon as it is extracted; use its `filepath` attribute to tell which file it came from.
+            memory_map: Optional - defaults to False. See `extract_raw_from_jpeg` for details.
+            cache: Optional. A `FrameCache` to share decoded frames through. See `PiRawBayer` for details.
+            disk_cache: Optional. A `SidecarCache` to store decoded frames in on disk. See `PiRawBayer` for details.
+
+        Returns:
+            A generator of `PiRawBayer` objects
+        '''
+        return imap(
+            lambda filepath: cls(
+                filepath, camera_version, sensor_mode, memory_map=memory_map, cache=cache, disk_cache=disk_cache
+            ),
+            filepaths,
+            workers=workers,
+            ordered=ordered,
+        )
+
+    @classmethod
+    async def aload(cls, filepath, camera_version: Optional[PiCameraVersion] = None, sensor_mode=0, roi=None,
+                    executor=None):
+        ''' Extract the raw bayer data from a JPEG+RAW file without blocking the event loop: the raw block is read on
+            the event loop's default executor, and unpacked on `executor`.
+
+        Args:
+            filepath: The full path of the JPEG+RAW image to extract raw data from
+            camera_version: Optional - defaults to None. See `PiRawBayer` for details.
+            sensor_mode: Optional - defaults to 0. See `PiRawBayer` for details.
+            roi: Optional. A `PiRegion` (or an (x, y, width, height) tuple) to extract instead of the whole image.
+            executor: Optional - defaults to a thread pool with a thread per CPU, shared by the whole process (see
+                `aio.get_default_unpack_executor`). The `concurrent.futures.Executor` to unpack on, which bounds how
+                many files are unpacked at once.
+
+        Returns:
+            A `PiRawBayer` object, as `PiRawBayer(filepath, camera_version, sensor_mode, roi=roi)` would return
+
+        Example:
+            raw_bayer = await PiRawBayer.aload('path/to/image.jpeg', PiCameraVersion.V2)
+        '''
+        loop = asyncio.get_event_loop()
+
+        camera_version, sensor_mode, jpeg_tail = await loop.run_in_executor(
+            None, _read_raw_format_and_block, filepath, camera_version, sensor_mode
+        )
+        raw_bayer = await loop.run_in_executor(
+            executor or get_default_unpack_executor(), cls.from_buffer, jpeg_tail, camera_version, sensor_mode, roi
+        )
+
+        raw_bayer.filepath = filepath
+        return raw_bayer
+
+    @classmethod
+    def afrom_files(cls, filepaths, camera_version: Optional[PiCameraVersion] = None, sensor_mode=0, concurrency=None,
+                    ordered=True, executor=None):
+        ''' Extract the raw bayer data from many JPEG+RAW files with `aload`, with at most `concurrency` in flight.
+
+        Args:
+            filepaths: An iterable of full paths of JPEG+RAW images to extract raw data from
+            camera_version: Optional - defaults to None. See `from_files` for details.
+            sensor_mode: Optional - defaults to 0. See `from_files` for details.
+            concurrency: Optional - defaults to the number of CPUs. The number of files to read and unpack at once.
+            ordered: Optional - defaults to True. If True, yield objects in the order of `filepaths`. Otherwise yield
+                each one as soon as it is extracted.
+            executor: Optional. The executor to unpack on. See `aload` for details.
+
+        Returns:
+            An asynchronous iterator of `PiRawBayer` objects, to use with `async for`
+
+        Example:
+            async for raw_bayer in PiRawBayer.afrom_files(filepaths, PiCameraVersion.V2):
+                ...
+        '''
+        return amap(
+            lambda filepath: cls.aload(filepath, camera_version, sensor_mode, executor=executor),
+            filepaths,
+            concurrency=concurrency,
+            ordered=ordered,
+        )
+
+    @classmethod
+    @instrumentation.instrumented_call('PiRawBayer.from_buffer')
+    def from_buffer(cls, buffer, camera_version: PiCameraVersion, sensor_mode=0, roi=None):
+        ''' Extract the raw bayer data from the in-memory contents of a JPEG+RAW file, without copying them.
+            See `extract_raw_from_buffer` for details.
+
+        Returns:
+            A `PiRawBayer` object, with a `filepath` of None
+        '''
+        bayer_array, header = _extract_raw_and_header_from_buffer(buffer, camera_version, sensor_mode, roi=roi)
+
+        return cls._from_extracted(bayer_array, header, camera_version, sensor_mode, roi)
+
+    @classmethod
+    @instrumentation.instrumented_call('PiRawBayer.from_stream')
+    def from_stream(cls, stream, camera_version: PiCameraVersion, sensor_mode=0, roi=None):
+        ''' Extract the raw bayer data from a binary file-like object holding a JPEG+RAW image, eg. an `io.BytesIO`
+            that an image was captured into with `picamera`. See `extract_raw_from_stream` for details.
+
+        Returns:
+            A `PiRawBayer` object, with a `filepath` of None
+        '''
+        jpeg_data = _read_stream_tail(stream, _get_raw_block_size(camera_version, sensor_mode))
+
+        return cls.from_buffer(jpeg_data, camera_version, sensor_mode, roi)
+
+    @classmethod
+    def _from_extracted(cls, bayer_array, header, camera_version, sensor_mode, roi):
+        raw_bayer = cls.__new__(cls)
+        raw_bayer.filepath = None
+        raw_bayer.camera_version = camera_version
+        raw_bayer.sensor_mode = sensor_mode
+        raw_bayer.memory_map = False
+        raw_bayer.roi = None if roi is None else PiRegion(*roi)
+        raw_bayer.cache = None
+        raw_bayer.disk_cache = None
+        raw_bayer.calibration = None
+        raw_bayer._cache_key = None
+        raw_bayer._metadata = None
+        raw_bayer._bayer_array = bayer_array
+        raw_bayer.header = header
+        raw_bayer.bayer_order = _get_bayer_order(header, roi)
+        return raw_bayer
+
+    @property
+    def bayer_array(self):
+        if self._bayer_array is None:
+            self._bayer_array = self._extract_bayer_array()
+        return self._bayer_array
+
+    @bayer_array.setter
+    def bayer_array(self, bayer_array):
+        self._bayer_array = bayer_array
+
+    @property
+    def __array_interface__(self):
+        ''' Lets numpy (and libraries that accept numpy-like arrays) use `bayer_array` in place, e.g. `np.asarray()` '''
+        return self.bayer_array.__array_interface__
+
+    def __buffer__(self, flags):
+        ''' Lets `memoryview()` (Python 3.12+) view `bayer_array` in place '''
+        return memoryview(self.bayer_array)
+
+    def __dlpack__(self, **kwargs):
+        ''' Lets DLPack consumers, e.g. `torch.from_dlpack()` or `np.from_dlpack()`, use `bayer_array` in place '''
+        return self.bayer_array.__dlpack__(**kwargs)
+
+    def __dlpack_device__(self):
+        return self.bayer_array.__dlpack_device__()
+
+    @property
+    def metadata(self):
+        ''' The `RawMetadata` of the image: the fields of its `BroadcomRawHeader`, and the exposure, gain and white
+            balance recorded in its EXIF data. The EXIF data is read (from the start of the file) on first access, and
+            the result is cached. Objects extracted from memory (with a `filepath` of None) have no EXIF data.
+        '''
+        if self._metadata is None:
+            self._metadata = _read_raw_metadata(self.filepath, self.header)
+        return self._metadata
+
+    @instrumentation.instrumented_call('PiRawBayer.bayer_array')
+    def _extract_bayer_array(self):
+        bayer_array, _ = self._extract_raw_and_header()
+        return bayer_array
+
+    def _extract_raw_and_header(self):
+        ''' Extract the bayer array (of `roi`, if provided) and header, and apply `calibration` (if provided)
+
+        Returns: (bayer_array, header)
+        '''
+        bayer_array, header = self._extract_uncalibrated_raw_and_header()
+
+        if self.calibration is not None:
+            bayer_array = self.calibration.apply(
+                bayer_array, roi=self.roi, out=bayer_array if bayer_array.flags.writeable else None
+            )
+
+        return bayer_array, header
+
+    def _extract_uncalibrated_raw_and_header(self):
+        ''' Extract the bayer array (of `roi`, if provided) and header - from `cache` or `disk_cache`, if provided and
+            they hold them
+
+        Returns: (bayer_array, header)
+        '''
+        if self.cache is None and self.disk_cache is None:
+            return _extract_raw_and_header(
+                self.filepath, self.camera_version, self.sensor_mode, self.memory_map, roi=self.roi
+            )
+
+        cached = None if self.cache is None else self.cache.get(self._cache_key)
+        if cached is None:
+            bayer_array, header = self._extract_whole_frame()
+            if self.cache is not None:
+                self.cache.put(self._cache_key, (bayer_array, header), bayer_array.nbytes)
+        else:
+            bayer_array, header = cached
+
+        # Each object gets its own copy of the (mutable) header
+        header = BroadcomRawHeader.from_buffer_copy(header)
+
+        if self.roi is not None:
+            _guard_region_is_within_image(self.roi, header)
+            bayer_array = bayer_array[
+                self.roi.y:self.roi.y + self.roi.height,
+                self.roi.x:self.roi.x + self.roi.width,
+            ]
+
+        return bayer_array, header
+
+    def _extract_whole_frame(self):
+        ''' Load the read-only bayer array of the whole image and its header from `disk_cache`, or else decode them
+            (and write them to `disk_cache`, if provided)
+
+        Returns: (bayer_array, header)
+        '''
+        if self.disk_cache is not None:
+            source_stat = os.stat(self.filepath)
+            loaded = self.disk_cache.load(self.filepath, self.camera_version, self.sensor_mode)
+            if loaded is not None:
+                bayer_array, header_bytes = loaded
+                return bayer_array, BroadcomRawHeader.from_buffer_copy(header_bytes)
+
+        bayer_array, header = _extract_raw_and_header(
+            self.filepath, self.camera_version, self.sensor_mode, self.memory_map
+        )
+        bayer_array.flags.writeable = False
+
+        if self.disk_cache is not None:
+            self.disk_cache.save(self.filepath, source_stat, self.camera_version, self.sensor_mode, bayer_array, header)
+
+        return bayer_array, header
+
+    @instrumentation.instrumented_call('PiRawBayer.to_3d')
+    def to_3d(self, dtype=None, out=None):
         '''
+        Args:
+            dtype: Optional - defaults to the dtype of `bayer_array`. The dtype of the output array.
+            out: Optional. A preallocated output array to fill in, e.g. one reused from a previous frame.
+
         Returns: A 16-bit 3D numpy array. This array has the same 2D dimensions as the input `bayer_array`, but pulls
             each pixel out into either the R, G, or B channel in the 3rd dimension. Thus, each "pixel" in the output
             array will be [R, G, B] where 2 of R, G, and B are 0 and the other contains a value from bayer_array.
             It determines whether a given pixel is R, G, or B using the provided `bayer_order`.
         '''
-        return bayer_array_to_3d(self.bayer_array, self.bayer_order)
+        return bayer_array_to_3d(self.bayer_array, self.bayer_order, dtype=dtype, out=out)
 
-    def to_rgb(self):
+    @instrumentation.instrumented_call('PiRawBayer.to_rgb')
+    def to_rgb(self, dtype=np.float64, out=None):
         '''
+        Args:
+            dtype: Optional - defaults to np.float64. The dtype of the output array.
+            out: Optional. A preallocated output array to fill in, e.g. one reused from a previous frame.
+
         Returns: A 16-bit 3D numpy array. Every 2x2 containing R, G1, G2, B in the original array is collapsed into a
             single [R, (G1+G2)/2, B] pixel. Thus, this array is 1/4 the size of the input `bayer_array` - both width and
             height are halved.
+
+            If this object is lazy and `bayer_array` hasn't been extracted yet, the RGB array of the whole image is
+            extracted straight from the file (see `extract_rgb_from_jpeg`) and `bayer_array` is never built.
+
+            If this object has a `cache` or `disk_cache`, the RGB array is always converted from the (cached)
+            `bayer_array`. If it has a `cache` and `out` is not provided, the (read-only) result is cached too.
+        '''
+        if self.cache is None or out is not None:
+            return self._to_rgb(dtype, out)
+
+        rgb_cache_key = (self._cache_key, 'rgb', np.dtype(dtype).str, self.roi, self.calibration)
+        rgb_array = self.cache.get(rgb_cache_key)
+        if rgb_array is None:
+            rgb_array = self._to_rgb(dtype)
+            rgb_array.flags.writeable = False
+            self.cache.put(rgb_cache_key, rgb_array, rgb_array.nbytes)
+        return rgb_array
+
+    @instrumentation.instrumented_call('PiRawBayer.to_planes')
+    def to_planes(self, contiguous=False, dtype=None, out=None):
+        '''
+        Args:
+            contiguous: Optional - defaults to False. If True, copy the planes into a contiguous (4, H/2, W/2) array.
+            dtype: Optional - defaults to the dtype of `bayer_array`. The dtype of the contiguous array.
+            out: Optional. A preallocated (4, H/2, W/2) array to copy the planes into, e.g. one reused from a previous
+                frame. Implies `contiguous`.
+
+        Returns: The four bayer planes (R, G1, G2, B), each of half the width and height of `bayer_array` - as a
+            `BayerPlanes` of views into `bayer_array` (nothing is copied), or else a contiguous array.
+            See `bayer_array_to_planes` for details.
+        '''
+        return bayer_array_to_planes(self.bayer_array, self.bayer_order, contiguous=contiguous, dtype=dtype, out=out)
+
+    @instrumentation.instrumented_call('PiRawBayer.demosaic')
+    def demosaic(self, method='malvar_he_cutler', dtype=np.float64, out=None, tile_size=DEFAULT_TILE_SIZE,
+                 workers=None):
+        '''
+        Args:
+            method: Optional - defaults to 'malvar_he_cutler'. The interpolation method: 'bilinear' or
+                'malvar_he_cutler'.
+            dtype: Optional - defaults to np.float64. The dtype of the output array.
+            out: Optional. A preallocated output array to fill in, e.g. one reused from a previous frame.
+            tile_size: Optional - defaults to 256. The height and width of the tiles the image is processed in.
+            workers: Optional - defaults to the number of CPUs. The number of tiles to process concurrently.
+
+        Returns: A 3D numpy array with the same 2D dimensions as `bayer_array`, in which every pixel has all of
+            [R, G, B] - the two missing colors of each pixel are interpolated from its neighbors. See `demosaic`.
+        '''
+        return demosaic(
+            self.bayer_array, self.bayer_order, method=method, dtype=dtype, out=out, tile_size=tile_size,
+            workers=workers,
+        )
+
+    @instrumentation.instrumented_call('PiRawBayer.channel_statistics')
+    def channel_statistics(self, roi=None, percentiles=DEFAULT_PERCENTILES, saturation_level=MAX_10BIT_VALUE):
+        ''' Calculate statistics of each bayer channel, straight from `bayer_array` (see `channel_statistics`)
+
+        Args:
+            roi: Optional. A `PiRegion` (or an (x, y, width, height) tuple) within `bayer_array` to calculate
+                statistics of, instead of the whole array.
+            percentiles: Optional - defaults to (1, 5, 25, 75, 95, 99). The percentiles to calculate, from 0 to 100.
+            saturation_level: Optional - defaults to 1023. The value at or above which a pixel is counted as saturated.
+
+        Returns:
+            An OrderedDict of {channel name: `ChannelStatistics`}, for the channels 'R', 'G1', 'G2' and 'B'
         '''
-        return bayer_array_to_rgb(self.bayer_array, self.bayer_order)
+        bayer_array = self.bayer_array
+        bayer_order = self.bayer_order
+
+        if roi is not None:
+            roi = PiRegion(*roi)
+            height, width = bayer_array.shape
+            _guard_region_is_within_image(roi, PiResolution(width, height))
+            bayer_array = bayer_array[roi.y:roi.y + roi.height, roi.x:roi.x + roi.width]
+            bayer_order = _bayer_order_at_offset(bayer_order, roi.y, roi.x)
+
+        return channel_statistics(bayer_array, bayer_order, percentiles, saturation_level)
+
+    def _to_rgb(self, dtype, out=None):
+        can_skip_bayer_array = (
+            self.roi is None and self.cache is None and self.disk_cache is None and self.calibration is None
+        )
+        if self._bayer_array is None and can_skip_bayer_array:
+            return extract_rgb_from_jpeg(
+                self.filepath, self.camera_version, self.sensor_mode, dtype=dtype, memory_map=self.memory_map, out=out
+            )
+        return bayer_array_to_rgb(self.bayer_array, self.bayer_order, dtype=dtype, out=out)
 
 
 BROADCOM_BAYER_ORDER_TO_ENUM = {
@@ -72,37 +462,398 @@ class BroadcomRawHeader(ctypes.Structure):
     ]
 
 
-def extract_raw_from_jpeg(filepath, camera_version, sensor_mode):
+@instrumentation.instrumented_call('extract_raw_from_jpeg')
+def extract_raw_from_jpeg(filepath, camera_version=None, sensor_mode=0, memory_map=False, out=None, roi=None):
     ''' Extracts the raw 10-bit bayer data from a Raspberry Pi camera JPEG+RAW file into a 16-bit numpy array
 
+    Only the raw block at the end of the file is read; the JPEG portion in front of it is skipped.
+
     Args:
         filepath: The full path of the JPEG+RAW image to extract raw data from
-        camera_version: A `PiCameraVersion` enum representing the camera hardware version used to capture the image
+        camera_version: Optional - defaults to None. A `PiCameraVersion` enum representing the camera hardware version
+            used to capture the image. If None, the camera version and sensor mode are detected from the file (see
+            `detect_raw_format`).
         sensor_mode: Optional - defaults to 0. An integer representing the `sensor_mode` used to capture the image.
             See https://picamera.readthedocs.io/en/release-1.13/fov.html#sensor-modes for more information
             on sensor_modes.
+        memory_map: Optional - defaults to False. If True, memory-map the raw block rather than reading it into a
+            bytes object. The packed pixel data is then unpacked straight from the page cache, without any
+            intermediate copy.
+        out: Optional. A preallocated 2D uint16 array to unpack the bayer data into, e.g. one reused from a previous
+            frame.
+        roi: Optional. A `PiRegion` (or an (x, y, width, height) tuple) to extract instead of the whole image. Only the
+            packed bytes covering the region are unpacked, and when memory-mapped only the rows of the region are read
+            from disk.
 
     Returns: (bayer_data, bayer_order)
         bayer_data: The raw bayer data as a 16-bit 2D numpy array
-        bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the `bayer_array`
+        bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the `bayer_array`. If `roi` is
+            provided, this is the bayer pattern starting from the region's top left corner.
     '''
+    camera_version, sensor_mode = _resolve_raw_format(filepath, camera_version, sensor_mode)
+
+    bayer_array, header = _extract_raw_and_header(filepath, camera_version, sensor_mode, memory_map, out, roi)
+    bayer_order = _get_bayer_order(header, roi)
+
+    return bayer_array, bayer_order
 
-    with open(filepath, mode='rb') as file:
-        jpeg_data_as_bytes = file.read()
 
-    raw_bytes = _get_raw_bayer_bytes(jpeg_data_as_bytes, camera_version, sensor_mode)
+@instrumentation.instrumented_call('read_raw_header')
+def read_raw_header(filepath, camera_version=None, sensor_mode=0):
+    ''' Reads the `BroadcomRawHeader` of a JPEG+RAW file without reading or unpacking any of its pixel data
 
-    # Extract header (metadata) and pixel data using known byte offsets
-    header = BroadcomRawHeader.from_buffer_copy(raw_bytes, HEADER_BYTE_OFFSET)
+    Args:
+        filepath: The full path of the JPEG+RAW image to read the header from
+        camera_version: Optional - defaults to None. A `PiCameraVersion` enum representing the camera hardware version
+            used to capture the image. If None, the camera version and sensor mode are detected from the file (see
+            `detect_raw_format`).
+        sensor_mode: Optional - defaults to 0. An integer representing the `sensor_mode` used to capture the image.
+
+    Returns:
+        A `BroadcomRawHeader` with the width, height, padding and bayer order of the raw data
+    '''
+    camera_version, sensor_mode = _resolve_raw_format(filepath, camera_version, sensor_mode)
+    raw_block_size = _get_raw_block_size(camera_version, sensor_mode)
+    with instrumentation.stage('read'):
+        raw_block_prefix = _read_file_tail(
+            filepath,
+            raw_block_size,
+            length=HEADER_BYTE_OFFSET + ctypes.sizeof(BroadcomRawHeader),
+        )
+
+    with instrumentation.stage('parse_header'):
+        _guard_is_raw_bayer_data(raw_block_prefix)
+        return BroadcomRawHeader.from_buffer_copy(raw_block_prefix, HEADER_BYTE_OFFSET)
+
+
+@instrumentation.instrumented_call('read_raw_metadata')
+def read_raw_metadata(filepath, camera_version=None, sensor_mode=0):
+    ''' Reads the capture metadata of a JPEG+RAW file - the fields of its `BroadcomRawHeader`, and the exposure, gain
+        and white balance recorded in its EXIF data - without reading any of its pixel data or JPEG image data
+
+    Args:
+        filepath: The full path of the JPEG+RAW image to read the metadata of
+        camera_version: Optional - defaults to None. See `read_raw_header` for details.
+        sensor_mode: Optional - defaults to 0. See `read_raw_header` for details.
+
+    Returns:
+        A `RawMetadata`
+    '''
+    return _read_raw_metadata(filepath, read_raw_header(filepath, camera_version, sensor_mode))
+
+
+def _read_raw_metadata(filepath, header):
+    exif_tags = {}  # type: dict
+    if filepath is not None:
+        with instrumentation.stage('read'):
+            # The camera writes the EXIF segment first, straight after the JPEG's 2-byte start of image marker
+            with open(filepath, mode='rb') as file:
+                jpeg_start = file.read(2 + MAX_EXIF_SEGMENT_SIZE)
+            instrumentation.record_read(len(jpeg_start))
+
+        with instrumentation.stage('parse_header'):
+            exif_tags = read_exif_tags(jpeg_start)
+
+    return build_raw_metadata(header, _get_bayer_order(header), exif_tags)
+
+
+def _extract_raw_and_header(filepath, camera_version, sensor_mode, memory_map, out=None, roi=None):
+    ''' Extracts the raw bayer data as `extract_raw_from_jpeg` does, but returns the full `BroadcomRawHeader` with it
+
+    Returns: (bayer_data, header)
+    '''
+    pixel_bytes, header = _read_pixel_bytes_and_header(filepath, camera_version, sensor_mode, memory_map)
+
+    bayer_array = _pixel_bytes_to_array(pixel_bytes, header, out=out, roi=roi)
+
+    return bayer_array, header
+
+
+def _read_pixel_bytes_and_header(filepath, camera_version, sensor_mode, memory_map):
+    ''' Reads the raw block of a JPEG+RAW file, without unpacking it
+
+    Returns: (pixel_bytes, header)
+        pixel_bytes: The still-packed pixel data, as a 1D numpy array of uint8 values
+        header: The `BroadcomRawHeader` of the raw data
+    '''
+    raw_block_size = _get_raw_block_size(camera_version, sensor_mode)
+    with instrumentation.stage('read'):
+        if memory_map:
+            jpeg_tail = _memory_map_file_tail(filepath, raw_block_size)
+        else:
+            jpeg_tail = _read_file_tail(filepath, raw_block_size)
+
+    return _get_pixel_bytes_and_header(jpeg_tail, camera_version, sensor_mode)
+
+
+def _get_pixel_bytes_and_header(jpeg_data, camera_version, sensor_mode):
+    ''' Locates the raw block within the contents (or the tail) of a JPEG+RAW file, without unpacking it or copying
+        its pixel data
+
+    Returns: (pixel_bytes, header)
+    '''
+    with instrumentation.stage('parse_header'):
+        raw_bytes = _get_raw_bayer_bytes(jpeg_data, camera_version, sensor_mode)
+
+        # Extract header (metadata) and pixel data using known byte offsets
+        header = BroadcomRawHeader.from_buffer_copy(raw_bytes, HEADER_BYTE_OFFSET)
 
     # Extract the 1D array of 8-bit (1-byte) values that collectively represent the pixel data
     # Note: pixel data is actually 10-bits per pixel, but is packed into 8-bit values
     pixel_bytes = np.frombuffer(raw_bytes, dtype=np.uint8, offset=PIXEL_BYTE_OFFSET)
 
-    bayer_array = _pixel_bytes_to_array(pixel_bytes, header)
+    return pixel_bytes, header
+
+
+@instrumentation.instrumented_call('extract_raw_from_buffer')
+def extract_raw_from_buffer(buffer, camera_version, sensor_mode, out=None, roi=None):
+    ''' Extracts the raw 10-bit bayer data from the contents of a Raspberry Pi camera JPEG+RAW file that are already in
+        memory - eg. `bytes`, a `bytearray`, a `memoryview` or a numpy array. The buffer is read in place, without being
+        copied.
+
+    Args:
+        buffer: Any object supporting the buffer protocol that holds the contents of a JPEG+RAW image (or at least its
+            raw block at the end)
+        camera_version: A `PiCameraVersion` enum representing the camera hardware version used to capture the image
+        sensor_mode: An integer representing the `sensor_mode` used to capture the image.
+        out: Optional. See `extract_raw_from_jpeg` for details.
+        roi: Optional. See `extract_raw_from_jpeg` for details.
+
+    Returns: (bayer_data, bayer_order)
+        See `extract_raw_from_jpeg` for details.
+    '''
+    bayer_array, header = _extract_raw_and_header_from_buffer(buffer, camera_version, sensor_mode, out, roi)
+
+    return bayer_array, _get_bayer_order(header, roi)
+
+
+@instrumentation.instrumented_call('extract_raw_from_stream')
+def extract_raw_from_stream(stream, camera_version, sensor_mode, out=None, roi=None):
+    ''' Extracts the raw 10-bit bayer data from a binary file-like object holding a Raspberry Pi camera JPEG+RAW image,
+        eg. an `io.BytesIO` that an image was captured into with `picamera`.
+
+        The contents of streams that offer `getbuffer()` (like `io.BytesIO`) are used in place, without being copied.
+        Otherwise only the raw block at the end of the stream is read, if the stream is seekable.
+
+    Args:
+        stream: A binary file-like object holding the contents of a JPEG+RAW image
+        camera_version: A `PiCameraVersion` enum representing the camera hardware version used to capture the image
+        sensor_mode: An integer representing the `sensor_mode` used to capture the image.
+        out: Optional. See `extract_raw_from_jpeg` for details.
+        roi: Optional. See `extract_raw_from_jpeg` for details.
+
+    Returns: (bayer_data, bayer_order)
+        See `extract_raw_from_jpeg` for details.
+    '''
+    jpeg_data = _read_stream_tail(stream, _get_raw_block_size(camera_version, sensor_mode))
+
+    return extract_raw_from_buffer(jpeg_data, camera_version, sensor_mode, out, roi)
+
+
+def _extract_raw_and_header_from_buffer(buffer, camera_version, sensor_mode, out=None, roi=None):
+    ''' Extracts the raw bayer data as `extract_raw_from_buffer` does, but returns the full `BroadcomRawHeader` with it
+
+    Returns: (bayer_data, header)
+    '''
+    pixel_bytes, header = _get_pixel_bytes_and_header(
+        np.frombuffer(buffer, dtype=np.uint8), camera_version, sensor_mode
+    )
+
+    bayer_array = _pixel_bytes_to_array(pixel_bytes, header, out=out, roi=roi)
+
+    return bayer_array, header
+
+
+def _read_stream_tail(stream, size):
+    ''' Get the contents of a binary file-like object - viewed in place if possible, or else read from the stream.
+        If the stream is seekable, only (at most) its last `size` bytes are read.
+    '''
+    if hasattr(stream, 'getbuffer'):
+        return stream.getbuffer()
+
+    with instrumentation.stage('read'):
+        if stream.seekable():
+            stream.seek(0, io.SEEK_END)
+            stream.seek(max(stream.tell() - size, 0))
+
+        data = stream.read()
+        instrumentation.record_read(len(data))
+
+    return data
+
+
+@instrumentation.instrumented_call('extract_rgb_from_jpeg')
+def extract_rgb_from_jpeg(filepath, camera_version=None, sensor_mode=0, dtype=np.float64, memory_map=False,
+                          out=None):
+    ''' Extracts the raw bayer data from a Raspberry Pi camera JPEG+RAW file straight into the 3D RGB array that
+        `bayer_array_to_rgb` would produce, without ever building the full-resolution bayer array.
+
+    Args:
+        filepath: The full path of the JPEG+RAW image to extract raw data from
+        camera_version: Optional - defaults to None. A `PiCameraVersion` enum representing the camera hardware version
+            used to capture the image. If None, the camera version and sensor mode are detected from the file (see
+            `detect_raw_format`).
+        sensor_mode: Optional - defaults to 0. An integer representing the `sensor_mode` used to capture the image.
+        dtype: Optional - defaults to np.float64. The dtype of the output array. For integer dtypes, the average of
+            the two green values is rounded down.
+        memory_map: Optional - defaults to False. See `extract_raw_from_jpeg` for details.
+        out: Optional. A preallocated output array to fill in, e.g. one reused from a previous frame. If provided,
+            `dtype` is ignored in favor of the dtype of `out`.
+
+    Returns:
+        A 3D numpy array of the given `dtype`. Every 2x2 containing R, G1, G2, B in the raw bayer data is collapsed
+        into a single [R, (G1+G2)/2, B] pixel; see `bayer_array_to_rgb` for details.
+    '''
+    camera_version, sensor_mode = _resolve_raw_format(filepath, camera_version, sensor_mode)
+    pixel_bytes, header = _read_pixel_bytes_and_header(filepath, camera_version, sensor_mode, memory_map)
+
+    return _pixel_bytes_to_rgb(pixel_bytes, header, dtype, out)
+
+
+# Default number of rows per band when extracting in bands
+DEFAULT_BAND_HEIGHT = 64
+
+
+def extract_raw_bands_from_jpeg(filepath, camera_version=None, sensor_mode=0, band_height=DEFAULT_BAND_HEIGHT):
+    ''' Extracts the raw bayer data from a Raspberry Pi camera JPEG+RAW file as a series of horizontal bands, reading
+        and unpacking one band at a time so that memory use is proportional to the band size rather than the image size.
+
+    Args:
+        filepath: The full path of the JPEG+RAW image to extract raw data from
+        camera_version: Optional - defaults to None. A `PiCameraVersion` enum representing the camera hardware version
+            used to capture the image. If None, the camera version and sensor mode are detected from the file (see
+            `detect_raw_format`).
+        sensor_mode: Optional - defaults to 0. An integer representing the `sensor_mode` used to capture the image.
+        band_height: Optional - defaults to 64. The number of rows in each band (the last band may be shorter). Must
+            be a multiple of 2, so that every band has the same `bayer_order`.
+
+    Returns: (bands, bayer_order)
+        bands: A generator of 16-bit 2D numpy arrays: consecutive bands of rows of the bayer data, from top to bottom
+        bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by each of the bands
+    '''
+    camera_version, sensor_mode = _resolve_raw_format(filepath, camera_version, sensor_mode)
+    header, packed_bands = _read_header_and_packed_bands(filepath, camera_version, sensor_mode, band_height)
+
+    bands = (_unpack_10bit_values(packed_band) for packed_band in packed_bands)
+
+    return bands, _get_bayer_order(header)
+
+
+def extract_rgb_bands_from_jpeg(filepath, camera_version=None, sensor_mode=0, band_height=DEFAULT_BAND_HEIGHT,
+                                dtype=np.float64):
+    ''' Extracts the raw bayer data from a Raspberry Pi camera JPEG+RAW file as a series of horizontal bands of the 3D
+        RGB array that `extract_rgb_from_jpeg` would produce, reading and unpacking one band at a time.
+
+    Args:
+        filepath: The full path of the JPEG+RAW image to extract raw data from
+        camera_version: Optional - defaults to None. A `PiCameraVersion` enum representing the camera hardware version
+            used to capture the image. If None, the camera version and sensor mode are detected from the file (see
+            `detect_raw_format`).
+        sensor_mode: Optional - defaults to 0. An integer representing the `sensor_mode` used to capture the image.
+        band_height: Optional - defaults to 64. The number of rows of bayer data that go into each band; each RGB
+            band has half as many rows. Must be a multiple of 2.
+        dtype: Optional - defaults to np.float64. The dtype of the output arrays.
+
+    Returns:
+        A generator of 3D numpy arrays: consecutive bands of rows of the RGB array, from top to bottom
+    '''
+    camera_version, sensor_mode = _resolve_raw_format(filepath, camera_version, sensor_mode)
+    header, packed_bands = _read_header_and_packed_bands(filepath, camera_version, sensor_mode, band_height)
+    bayer_order = _get_bayer_order(header)
+
+    return (_pixel_bytes_2d_to_rgb(packed_band, bayer_order, dtype) for packed_band in packed_bands)
+
+
+def _read_header_and_packed_bands(filepath, camera_version, sensor_mode, band_height):
+    ''' Read the header of a JPEG+RAW file, and set up a generator of bands of its packed pixel data
+
+    Returns: (header, packed_bands)
+    '''
+    # Bands must hold whole bayer tiles, so that every band has the same bayer order
+    if band_height <= 0 or band_height % 2:
+        raise ValueError('band_height ({band_height}) must be a positive multiple of 2'.format(**locals()))
+
+    header = read_raw_header(filepath, camera_version, sensor_mode)
+    packed_bands = _read_packed_bands(filepath, _get_raw_block_size(camera_version, sensor_mode), header, band_height)
+
+    return header, packed_bands
+
+
+def _read_packed_bands(filepath, raw_block_size, header, band_height):
+    ''' Generate consecutive bands of 2D rows of packed 10-bit values (cropped to the image), reading each band from
+        the file only when it is reached
+    '''
+    shape, crop = _get_packed_shape_and_crop(header)
+
+    with open(filepath, mode='rb') as file:
+        file_size = os.fstat(file.fileno()).st_size
+        pixel_data_offset = file_size - raw_block_size + PIXEL_BYTE_OFFSET
+
+        for band_start_row in range(0, crop.height, band_height):
+            band_rows = min(band_height, crop.height - band_start_row)
+            file.seek(pixel_data_offset + band_start_row * shape.width)
+            band_bytes = np.frombuffer(file.read(band_rows * shape.width), dtype=np.uint8)
+
+            yield band_bytes.reshape((band_rows, shape.width))[:, :crop.width]
+
+
+def _get_bayer_order(header, roi=None):
+    ''' The `BayerOrder` of the raw data described by `header`, or of the region `roi` within it '''
     bayer_order = BROADCOM_BAYER_ORDER_TO_ENUM[header.bayer_order]
+    if roi is None:
+        return bayer_order
+
+    roi = PiRegion(*roi)
+    return _bayer_order_at_offset(bayer_order, roi.y, roi.x)
+
+
+def _bayer_order_at_offset(bayer_order, y_offset, x_offset):
+    ''' The `BayerOrder` of the part of a bayer array that starts at (`y_offset`, `x_offset`). Starting on an odd row
+        swaps the two rows of the 2x2 bayer pattern; starting on an odd column swaps its two columns.
+    '''
+    # eg. 'BGGR' is the pattern of rows 'BG' and 'GR'
+    rows = [bayer_order.value[:2], bayer_order.value[2:]]
+    if y_offset % 2:
+        rows = rows[::-1]
+    if x_offset % 2:
+        rows = [row[::-1] for row in rows]
+
+    return BayerOrder(''.join(rows))
+
+
+def _read_raw_format_and_block(filepath, camera_version, sensor_mode):
+    ''' Read the raw block at the end of a JPEG+RAW file, without unpacking it
+
+    Returns: (camera_version, sensor_mode, jpeg_tail)
+        camera_version, sensor_mode: The given ones - or, if `camera_version` is None, the detected ones
+        jpeg_tail: The bytes of (at most) the raw block at the end of the file
+    '''
+    camera_version, sensor_mode = _resolve_raw_format(filepath, camera_version, sensor_mode)
+    with instrumentation.stage('read'):
+        jpeg_tail = _read_file_tail(filepath, _get_raw_block_size(camera_version, sensor_mode))
+
+    return camera_version, sensor_mode, jpeg_tail
 
-    return bayer_array, bayer_order
+
+def _read_file_tail(filepath, size, length=None):
+    ''' Read (at most) the last `size` bytes of a file, without reading anything in front of them.
+        If `length` is provided, only that many bytes from the start of the tail are read.
+    '''
+    with open(filepath, mode='rb') as file:
+        file_size = os.fstat(file.fileno()).st_size
+        file.seek(max(file_size - size, 0))
+        data = file.read(size if length is None else length)
+
+    instrumentation.record_read(len(data))
+    return data
+
+
+def _memory_map_file_tail(filepath, size):
+    ''' Memory-map (at most) the last `size` bytes of a file as a read-only 1D array of uint8 '''
+    file_size = os.path.getsize(filepath)
+    offset = max(file_size - size, 0)
+    instrumentation.record_read(file_size - offset)
+    return np.memmap(filepath, dtype=np.uint8, mode='r', offset=offset, shape=(file_size - offset,))
 
 
 def _guard_attribute_is_a_multiple_of(attribute_name, attribute_value, multiple):
@@ -113,13 +864,17 @@ def _guard_attribute_is_a_multiple_of(attribute_name, attribute_value, multiple)
         )
 
 
-def bayer_array_to_3d(bayer_array, bayer_order: BayerOrder):
+@instrumentation.instrumented_call('bayer_array_to_3d')
+def bayer_array_to_3d(bayer_array, bayer_order: BayerOrder, dtype=None, out=None):
     ''' Convert the 2D `bayer_array` to a 3D RGB array, in which each value in the original 2D array is
         moved to one of the three R,G, or B channels.
 
     Args:
         bayer_array: the 2D bayer array to convert
         bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the `bayer_array`
+        dtype: Optional - defaults to the dtype of `bayer_array`. The dtype of the output array.
+        out: Optional. A preallocated output array to fill in, e.g. one reused from a previous frame. If provided,
+            `dtype` is ignored in favor of the dtype of `out`.
 
     Returns:
         A 3D numpy array. This array has the same 2D dimensions as the input `bayer_array`, but pulls each pixel
@@ -141,30 +896,42 @@ def bayer_array_to_3d(bayer_array, bayer_order: BayerOrder):
         ])
     '''
 
-    # Prepare an empty 3D array that has the same 2D dimensions as the bayer array
-    array_3d = np.zeros(bayer_array.shape + (3,), dtype=bayer_array.dtype)
+    with instrumentation.stage('3d'):
+        # Prepare an empty 3D array that has the same 2D dimensions as the bayer array
+        output_shape = bayer_array.shape + (3,)
+        if out is None:
+            array_3d = np.zeros(output_shape, dtype=bayer_array.dtype if dtype is None else dtype)
+            instrumentation.record_allocation(array_3d.nbytes)
+        else:
+            array_3d = _guard_output_array_shape(out, output_shape)
+            array_3d.fill(0)
 
-    ((ry, rx), (gy, gx), (Gy, Gx), (by, bx)) = BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES[bayer_order]
+        ((ry, rx), (gy, gx), (Gy, Gx), (by, bx)) = BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES[bayer_order]
 
-    # Keeps pixels in the same 2D location, but separates into RGB channels based on bayer order
-    # Increment by 2: a given color will be in every other column in every other row in the bayer array
-    # "Seed" this incrementating using the (x,y) coordinates of that color in the first 2x2 corner of the array
-    R_CHANNEL_INDEX, G_CHANNEL_INDEX, B_CHANNEL_INDEX = [0, 1, 2]
-    array_3d[ry::2, rx::2, R_CHANNEL_INDEX] = bayer_array[ry::2, rx::2]  # Red
-    array_3d[gy::2, gx::2, G_CHANNEL_INDEX] = bayer_array[gy::2, gx::2]  # Green
-    array_3d[Gy::2, Gx::2, G_CHANNEL_INDEX] = bayer_array[Gy::2, Gx::2]  # Green
-    array_3d[by::2, bx::2, B_CHANNEL_INDEX] = bayer_array[by::2, bx::2]  # Blue
+        # Keeps pixels in the same 2D location, but separates into RGB channels based on bayer order
+        # Increment by 2: a given color will be in every other column in every other row in the bayer array
+        # "Seed" this incrementating using the (x,y) coordinates of that color in the first 2x2 corner of the array
+        R_CHANNEL_INDEX, G_CHANNEL_INDEX, B_CHANNEL_INDEX = [0, 1, 2]
+        array_3d[ry::2, rx::2, R_CHANNEL_INDEX] = bayer_array[ry::2, rx::2]  # Red
+        array_3d[gy::2, gx::2, G_CHANNEL_INDEX] = bayer_array[gy::2, gx::2]  # Green
+        array_3d[Gy::2, Gx::2, G_CHANNEL_INDEX] = bayer_array[Gy::2, Gx::2]  # Green
+        array_3d[by::2, bx::2, B_CHANNEL_INDEX] = bayer_array[by::2, bx::2]  # Blue
 
-    return array_3d
+        return array_3d
 
 
-def bayer_array_to_rgb(bayer_array, bayer_order: BayerOrder):
+@instrumentation.instrumented_call('bayer_array_to_rgb')
+def bayer_array_to_rgb(bayer_array, bayer_order: BayerOrder, dtype=np.float64, out=None):
     ''' Convert the 2D `bayer_array` to a 3D RGB array, in which each value in the original 2D array is
         moved to one of the three R,G, or B channels.
 
     Args:
         bayer_array: the 2D bayer array to convert
         bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the `bayer_array`
+        dtype: Optional - defaults to np.float64. The dtype of the output array. For integer dtypes, the average of
+            the two green values is rounded down.
+        out: Optional. A preallocated output array to fill in, e.g. one reused from a previous frame. If provided,
+            `dtype` is ignored in favor of the dtype of `out`.
 
     Returns:
         A 3D numpy array. Every 2x2 containing R, G1, G2, B in the original array is collapsed into a single
@@ -183,31 +950,213 @@ def bayer_array_to_rgb(bayer_array, bayer_order: BayerOrder):
             [[1, 2.5, 4]],  # R, (G1+G2)/2, B
         ])
     '''
-    # Initialize a new array that is the expected shape of 1/2 width and height dimensions
-    original_height = bayer_array.shape[0]
-    original_width = bayer_array.shape[1]
+    with instrumentation.stage('rgb'):
+        # Initialize a new array that is the expected shape of 1/2 width and height dimensions
+        original_height = bayer_array.shape[0]
+        original_width = bayer_array.shape[1]
+
+        _guard_attribute_is_a_multiple_of('width', original_width, 2)
+        _guard_attribute_is_a_multiple_of('height', original_height, 2)
+
+        rgb_array = _prepare_output_array(out, (original_height // 2, original_width // 2, 3), dtype)
+
+        ((ry, rx), (gy, gx), (Gy, Gx), (by, bx)) = BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES[bayer_order]
+
+        # Increment by 2: a given color will be in every other column in every other row in the bayer array
+        # "Seed" this incrementating using the (x,y) coordinates of that color in the first 2x2 corner of the array
+        R_CHANNEL_INDEX, G_CHANNEL_INDEX, B_CHANNEL_INDEX = [0, 1, 2]
+        rgb_array[:, :, R_CHANNEL_INDEX] = bayer_array[ry::2, rx::2]
+        _average_into(rgb_array[:, :, G_CHANNEL_INDEX], bayer_array[gy::2, gx::2], bayer_array[Gy::2, Gx::2])
+        rgb_array[:, :, B_CHANNEL_INDEX] = bayer_array[by::2, bx::2]
+
+        return rgb_array
+
+
+class BayerPlanes(namedtuple('BayerPlanes', ('R', 'G1', 'G2', 'B'))):
+    ''' The four planes of a bayer array, each holding a single color, in the order of the coordinates in
+        `BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES`
+    '''
+    __slots__ = ()
+
+
+@instrumentation.instrumented_call('bayer_array_to_planes')
+def bayer_array_to_planes(bayer_array, bayer_order: BayerOrder, contiguous=False, dtype=None, out=None):
+    ''' Split the 2D `bayer_array` into its four bayer planes: R, G1, G2 and B.
+
+    Args:
+        bayer_array: the 2D bayer array to split
+        bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the `bayer_array`
+        contiguous: Optional - defaults to False. If True, copy the planes into a contiguous (4, H/2, W/2) array.
+        dtype: Optional - defaults to the dtype of `bayer_array`. The dtype of the contiguous array.
+        out: Optional. A preallocated (4, H/2, W/2) array to copy the planes into, e.g. one reused from a previous
+            frame. Implies `contiguous`. If provided, `dtype` is ignored in favor of the dtype of `out`.
+
+    Returns:
+        If neither `contiguous` nor `out` is provided, a `BayerPlanes` of strided views into `bayer_array`: nothing
+        is copied or allocated. Otherwise, a (4, H/2, W/2) numpy array of the planes in the order R, G1, G2, B.
+
+    Example:
+        bayer_array_to_planes(
+            bayer_array=np.array([
+                [1, 2],  # R  G2
+                [3, 4],  # G1 B
+            ]),
+            bayer_order=BayerOrder.RGGB
+        )
+        >>> BayerPlanes(R=np.array([[1]]), G1=np.array([[3]]), G2=np.array([[2]]), B=np.array([[4]]))
+    '''
+    original_height, original_width = bayer_array.shape
 
     _guard_attribute_is_a_multiple_of('width', original_width, 2)
     _guard_attribute_is_a_multiple_of('height', original_height, 2)
 
-    rgb_array = np.zeros((int(original_height/2), int(original_width/2), 3))
+    planes = BayerPlanes(*(
+        bayer_array[y::2, x::2]
+        for y, x in BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES[bayer_order]
+    ))
+    if not contiguous and out is None:
+        return planes
+
+    with instrumentation.stage('planes'):
+        planes_array = _prepare_output_array(
+            out, (4, original_height // 2, original_width // 2), bayer_array.dtype if dtype is None else dtype
+        )
+        for plane_index, plane in enumerate(planes):
+            planes_array[plane_index] = plane
+
+        return planes_array
+
+
+def _average_into(out, values_1, values_2):
+    ''' Average two arrays into `out`, without allocating any temporary arrays. Integer outputs are rounded down. '''
+    np.add(values_1, values_2, out=out, casting='unsafe')
+    if np.issubdtype(out.dtype, np.integer):
+        np.floor_divide(out, 2, out=out)
+    else:
+        np.true_divide(out, 2, out=out)
+
+
+def _prepare_output_array(out, shape, dtype):
+    ''' Returns `out` if provided (after checking its shape), or else a new uninitialized array '''
+    if out is None:
+        output_array = np.empty(shape, dtype=dtype)
+        instrumentation.record_allocation(output_array.nbytes)
+        return output_array
+    return _guard_output_array_shape(out, shape)
+
+
+def _guard_output_array_shape(out, shape):
+    if out.shape != tuple(shape):
+        raise ValueError(
+            'Output array is the wrong shape: expected {expected_shape}, got {out.shape}'
+            .format(expected_shape=tuple(shape), out=out)
+        )
+    return out
+
+
+def _pixel_bytes_to_array(pixel_bytes, header, dtype=np.uint16, out=None, roi=None):
+    ''' Convert the 1D array of 8-bit values ("packed" 10-bit values) to a 2D array of 10-bit values. Every 5 bytes
+        contains the high 8-bits of 4 values followed by the low 2-bits of 4 values packed into the fifth byte.
+        If `roi` is provided, only the values within that region are unpacked.
+    '''
+    with instrumentation.stage('reshape'):
+        pixel_bytes_2d = _pixel_bytes_to_2d(pixel_bytes, header)
+
+    with instrumentation.stage('unpack'):
+        return _unpack_pixel_bytes_2d(pixel_bytes_2d, header, dtype, out, roi)
+
+
+def _unpack_pixel_bytes_2d(pixel_bytes_2d, header, dtype, out, roi):
+    ''' Unpack 2D rows of packed 10-bit values - or, if `roi` is provided, only the values within that region '''
+    if roi is None:
+        return _unpack_10bit_values(pixel_bytes_2d, dtype=dtype, out=out)
+
+    roi = PiRegion(*roi)
+    _guard_region_is_within_image(roi, header)
+
+    # Every 5-byte set holds 4 values, so unpack all of the whole sets that the region overlaps,
+    # and then crop the region out of them
+    first_set_index = roi.x // 4
+    end_set_index = (roi.x + roi.width + 3) // 4
+    region_bytes_2d = pixel_bytes_2d[roi.y:roi.y + roi.height, first_set_index * 5:end_set_index * 5]
+
+    x_offset_within_sets = roi.x - first_set_index * 4
+    if x_offset_within_sets == 0 and roi.width % 4 == 0:
+        # The region is aligned to the sets, so there's nothing to crop
+        return _unpack_10bit_values(region_bytes_2d, dtype=dtype, out=out)
+
+    region_array = _unpack_10bit_values(region_bytes_2d, dtype=dtype)[
+        :, x_offset_within_sets:x_offset_within_sets + roi.width
+    ]
+    if out is None:
+        return region_array
+
+    output_array = _guard_output_array_shape(out, region_array.shape)
+    output_array[...] = region_array
+    return output_array
+
+
+def _guard_region_is_within_image(roi, header):
+    is_within_image = (
+        roi.width > 0 and roi.height > 0 and roi.x >= 0 and roi.y >= 0
+        and roi.x + roi.width <= header.width and roi.y + roi.height <= header.height
+    )
+    if not is_within_image:
+        raise ValueError(
+            'Region of interest ({roi}) is not within the image ({header.width}x{header.height})'
+            .format(roi=roi, header=header)
+        )
+
+
+def _pixel_bytes_to_rgb(pixel_bytes, header, dtype, out=None):
+    ''' Convert the 1D array of 8-bit values ("packed" 10-bit values) straight to the 3D RGB array produced by
+        `bayer_array_to_rgb`. Each color is unpacked on its own from the packed bytes, into a plane that is already at
+        the output's half resolution.
+    '''
+    with instrumentation.stage('reshape'):
+        pixel_bytes_2d = _pixel_bytes_to_2d(pixel_bytes, header)
+    bayer_order = BROADCOM_BAYER_ORDER_TO_ENUM[header.bayer_order]
+
+    with instrumentation.stage('rgb'):
+        return _pixel_bytes_2d_to_rgb(pixel_bytes_2d, bayer_order, dtype, out)
+
+
+def _pixel_bytes_2d_to_rgb(pixel_bytes_2d, bayer_order, dtype, out=None):
+    ''' Convert 2D rows of packed 10-bit values straight to the 3D RGB array produced by `bayer_array_to_rgb` '''
+    input_height, input_width = pixel_bytes_2d.shape
+
+    # Each 5-byte set holds 4 values: 2 bayer tiles wide
+    _guard_attribute_is_a_multiple_of('width', input_width, 5)
+    _guard_attribute_is_a_multiple_of('height', input_height, 2)
+
+    rgb_array = _prepare_output_array(out, (input_height // 2, input_width * 2 // 5, 3), dtype)
 
     ((ry, rx), (gy, gx), (Gy, Gx), (by, bx)) = BAYER_ORDER_TO_RGB_CHANNEL_COORDINATES[bayer_order]
 
-    # Increment by 2: a given color will be in every other column in every other row in the bayer array
-    # "Seed" this incrementating using the (x,y) coordinates of that color in the first 2x2 corner of the array
     R_CHANNEL_INDEX, G_CHANNEL_INDEX, B_CHANNEL_INDEX = [0, 1, 2]
-    rgb_array[:, :, R_CHANNEL_INDEX] = bayer_array[ry::2, rx::2]
-    rgb_array[:, :, G_CHANNEL_INDEX] = (bayer_array[gy::2, gx::2] + bayer_array[Gy::2, Gx::2])/2
-    rgb_array[:, :, B_CHANNEL_INDEX] = bayer_array[by::2, bx::2]
+    rgb_array[:, :, R_CHANNEL_INDEX] = _unpack_10bit_plane(pixel_bytes_2d, ry, rx)
+    rgb_array[:, :, B_CHANNEL_INDEX] = _unpack_10bit_plane(pixel_bytes_2d, by, bx)
+
+    _average_into(
+        rgb_array[:, :, G_CHANNEL_INDEX],
+        _unpack_10bit_plane(pixel_bytes_2d, gy, gx),
+        _unpack_10bit_plane(pixel_bytes_2d, Gy, Gx),
+    )
 
     return rgb_array
 
 
-def _pixel_bytes_to_array(pixel_bytes, header):
-    ''' Convert the 1D array of 8-bit values ("packed" 10-bit values) to a 2D array of 10-bit values. Every 5 bytes
-        contains the high 8-bits of 4 values followed by the low 2-bits of 4 values packed into the fifth byte
+def _pixel_bytes_to_2d(pixel_bytes, header):
+    ''' Reshape the 1D array of 8-bit values ("packed" 10-bit values) to 2D rows of packed values, cropped to the
+        image. This is a view on `pixel_bytes`: nothing is copied or unpacked.
     '''
+    shape, crop = _get_packed_shape_and_crop(header)
+
+    return pixel_bytes.reshape((shape.height, shape.width))[:crop.height, :crop.width]
+
+
+def _get_packed_shape_and_crop(header):
+    ''' Calculate the shape of the packed pixel data, in bytes, and the crop of that shape that holds the image '''
     # Reshape and crop the data. The crop's width is multiplied by 5/4 to deal with the packed 10-bit format;
     # the shape's width is calculated in a similar fashion but with padding included
     crop = PiResolution(
@@ -224,14 +1173,10 @@ def _pixel_bytes_to_array(pixel_bytes, header):
         (header.height + header.padding_down)
     ).pad()
 
-    pixel_bytes_2d = pixel_bytes.reshape((shape.height, shape.width))[:crop.height, :crop.width]
-
-    array = _unpack_10bit_values(pixel_bytes_2d)
-
-    return array
+    return shape, crop
 
 
-def _unpack_10bit_values(pixel_bytes_2d):
+def _unpack_10bit_values(pixel_bytes_2d, dtype=np.uint16, out=None):
     ''' Unpack 10-bit values from 8-bit values.
         Every 5 bytes in the input data corresponds to 4 10-bit values in the output.
         The 5 input bytes consist of the high 8 bits of the 4 output values followed by the low 2 bits of
@@ -240,24 +1185,42 @@ def _unpack_10bit_values(pixel_bytes_2d):
         Args:
             pixel_bytes_2d: 2d numpy array where the 2nd dimension arrays are encoded per this spec:
                 https://linuxtv.org/downloads/v4l-dvb-apis-new/uapi/v4l/pixfmt-srggb10p.html
+            dtype: Optional - defaults to np.uint16. The dtype to store the unpacked values with.
+            out: Optional. A preallocated output array to fill in, e.g. one reused from a previous frame. If provided,
+                `dtype` is ignored in favor of the dtype of `out`.
         Returns:
             2d numpy array containing 10-bit values unpacked from pixel_bytes_2d, stored with dtype np.uint16.
     '''
+    return _unpack_byte_cohorts(pixel_bytes_2d, byte_cohort_indices=range(4), dtype=dtype, out=out)
+
+
+def _unpack_10bit_plane(pixel_bytes_2d, y_offset, x_offset):
+    ''' Unpack only the 10-bit values of a single bayer color - every other value in every other row, starting at
+        (`y_offset`, `x_offset`) - from 8-bit values encoded as for `_unpack_10bit_values`.
+
+        Returns:
+            2d numpy array of half the unpacked height and width, stored with dtype np.uint16.
+    '''
+    # In each 5-byte set, bytes 0 and 2 hold even columns and bytes 1 and 3 hold odd columns
+    return _unpack_byte_cohorts(pixel_bytes_2d[y_offset::2], byte_cohort_indices=(x_offset, x_offset + 2))
+
+
+def _unpack_byte_cohorts(pixel_bytes_2d, byte_cohort_indices, dtype=np.uint16, out=None):
+    ''' Unpack the 10-bit values held by the given "byte cohorts" (see below) of each 5-byte set, interleaving them in
+        the output in the order given
+    '''
     input_height, input_width = pixel_bytes_2d.shape
 
     # This code assumes that bytes in each row come in sets of 5. If the width is not a multiple of 5, it breaks.
     _guard_attribute_is_a_multiple_of('width', input_width, 5)
 
-    # Set up the output array with the correct shape: same height but width reduced by 4/5
-    output_data = np.zeros(
-        shape=(
-            input_height,
-            # Every 5 bytes in the input will be turned into 4 items in the output
-            input_width * 4 // 5
-        ),
-        # This will be filled with 10 bit values, but uint16 is the closest numpy has to offer.
-        dtype=np.uint16
-    )
+    cohort_count = len(byte_cohort_indices)
+    cohort_width = input_width // 5
+
+    # Set up the output array with the correct shape: same height, with one item per cohort for every 5 bytes in the
+    # input. Each item is written exactly once below, so there is no need to zero the array first.
+    # This will be filled with 10 bit values, but by default uint16 is the closest numpy has to offer.
+    output_data = _prepare_output_array(out, (input_height, cohort_width * cohort_count), dtype)
 
     # Method to populate the output array:
     # In each 5-byte set, byte 0 gets the lowest bits from byte 4, byte 1 gets the next lowest bits from byte 4, etc.
@@ -265,22 +1228,67 @@ def _unpack_10bit_values(pixel_bytes_2d):
     # and so on through the "byte 3"s.
     # For lack of a better term, we'll call these the "byte cohorts" 0 through 3.
 
+    # Each cohort is assembled (as uint16, whatever the output dtype) in these two scratch buffers, which are reused
+    # for every cohort. Every step below writes into them in place, rather than allocating a new full-size temporary
+    # array per operation.
+    cohort_values = np.empty(shape=(input_height, cohort_width), dtype=np.uint16)
+    cohort_low_bits = np.empty(shape=(input_height, cohort_width), dtype=np.uint8)
+    instrumentation.record_allocation(cohort_values.nbytes + cohort_low_bits.nbytes)
+
     # First, set aside cohort 4: the bytes that will be unpacked into the low bits to go with the first 4 bytes
     cohort_4 = pixel_bytes_2d[:, 4::5]
-    for byte_cohort_index in range(4):
-        # High bits come from the input array,
+    for output_index, byte_cohort_index in enumerate(byte_cohort_indices):
+        # High bits come from the input array, widened to 16 bits and
         # shifted left by two bits to make room for the low 2-bits which will come from the 5th byte
-        high_bits = pixel_bytes_2d[:, byte_cohort_index::5].astype(np.uint16) << 2
+        np.left_shift(pixel_bytes_2d[:, byte_cohort_index::5], 2, out=cohort_values, dtype=np.uint16)
 
         # Now process bits from cohort 4 and unpack the appropriate ones to be our low 2 bits:
         # Shift the bits over so that the relevant ones are in the rightmost (lowest 2 bits) position
         # eg. for byte 1, 0b00001100 -> 0b11
-        shifted_bits_from_cohort_4 = cohort_4 >> (byte_cohort_index * 2)
+        np.right_shift(cohort_4, byte_cohort_index * 2, out=cohort_low_bits)
         # Mask the relevant ones (the lowest 2)
-        masked_low_bits = shifted_bits_from_cohort_4 & 0b11
+        cohort_low_bits &= 0b11
+
+        # Finally, combine the high and low bits and put them into their place in the output array
+        cohort_values |= cohort_low_bits
+        output_data[:, output_index::cohort_count] = cohort_values
+
+    return output_data
+
+
+def _pack_10bit_values(bayer_array, out=None):
+    ''' Pack 10-bit values into 8-bit values - the inverse of `_unpack_10bit_values`.
+        Every 4 values in the input are packed into 5 bytes in the output: the high 8 bits of each of the 4 values,
+        followed by their low 2 bits packed into the fifth byte.
+
+        Args:
+            bayer_array: 2d numpy array of 10-bit values, with a width that is a multiple of 4
+            out: Optional. A preallocated uint8 output array to fill in.
+        Returns:
+            2d numpy array of uint8 values, 5/4 of the width of `bayer_array`
+    '''
+    input_height, input_width = bayer_array.shape
+    _guard_attribute_is_a_multiple_of('width', input_width, 4)
+
+    if bayer_array.size and bayer_array.max() > MAX_10BIT_VALUE:
+        raise ValueError('Unable to pack values larger than 10 bits (max {})'.format(MAX_10BIT_VALUE))
+
+    output_data = _prepare_output_array(out, (input_height, input_width * 5 // 4), np.uint8)
+
+    # Pack one "byte cohort" (see `_unpack_byte_cohorts`) at a time, reusing a single scratch buffer for the low bits
+    cohort_4 = output_data[:, 4::5]
+    cohort_4.fill(0)
+    cohort_low_bits = np.empty(shape=cohort_4.shape, dtype=np.uint8)
+    for byte_cohort_index in range(4):
+        cohort_values = bayer_array[:, byte_cohort_index::4]
+
+        # The high 8 bits make up the cohort's own byte
+        np.right_shift(cohort_values, 2, out=output_data[:, byte_cohort_index::5], casting='unsafe')
 
-        # Finally, put the masked low bits into their place in the output array
-        output_data[:, byte_cohort_index::4] = high_bits | masked_low_bits
+        # The low 2 bits are shifted into their place in the fifth byte
+        np.bitwise_and(cohort_values, 0b11, out=cohort_low_bits, casting='unsafe')
+        np.left_shift(cohort_low_bits, byte_cohort_index * 2, out=cohort_low_bits)
+        cohort_4 |= cohort_low_bits
 
     return output_data
 
@@ -309,19 +1317,212 @@ RAW_BLOCK_SIZE_BY_VERSION_AND_MODE = {
     },
 }
 
+_KNOWN_RAW_BLOCK_SIZES = sorted({
+    raw_block_size
+    for raw_block_size_by_mode in RAW_BLOCK_SIZE_BY_VERSION_AND_MODE.values()
+    for raw_block_size in raw_block_size_by_mode.values()
+})
+
 
 def _get_raw_block_size(camera_version, sensor_mode):
     return RAW_BLOCK_SIZE_BY_VERSION_AND_MODE[camera_version][sensor_mode]
 
 
 def _get_raw_bayer_bytes(jpeg_data_as_bytes, camera_version, sensor_mode):
-    ''' Extract the bytes that represent the raw bayer data from the contents of a JPEG+RAW file '''
+    ''' Extract the bytes that represent the raw bayer data from the contents (or the tail) of a JPEG+RAW file '''
     # The raw bayer data is at the end of the file, so extract an appropriately-sized block of data from the end
     raw_block_size = _get_raw_block_size(camera_version, sensor_mode)
     raw_bytes = jpeg_data_as_bytes[-raw_block_size:]
 
+    _guard_is_raw_bayer_data(raw_bytes)
+
+    return raw_bytes
+
+
+def _guard_is_raw_bayer_data(raw_bytes):
     # Bayer data should start with 'BCRM'
-    if raw_bytes[:4] != b'BRCM':
+    if bytes(raw_bytes[:4]) != b'BRCM':
         raise ValueError('Unable to locate Bayer data at end of buffer')
 
-    return raw_bytes
+
+@instrumentation.instrumented_call('detect_raw_format')
+def detect_raw_format(filepath):
+    ''' Detects the camera version and sensor mode of a JPEG+RAW file from its raw block, without reading pixel data.
+
+    The raw block is located by checking for its 'BRCM' marker at each of the known raw block sizes (most recently
+    detected first), falling back to scanning backwards from the end of the file in bounded chunks. A candidate block
+    is only accepted if the size of the pixel data described by its header exactly fills it. The camera version is
+    taken from the sensor name in the header; the sensor mode from the size of the raw block.
+
+    Args:
+        filepath: The full path of the JPEG+RAW image
+
+    Returns: (camera_version, sensor_mode)
+        camera_version: A `PiCameraVersion` enum representing the camera hardware version used to capture the image
+        sensor_mode: An integer representing a `sensor_mode` with the image's raw block size. Sensor modes that share a
+            raw block size are extracted identically, so the lowest such sensor mode is returned.
+    '''
+    with open(filepath, mode='rb') as file, instrumentation.stage('locate'):
+        file_size = os.fstat(file.fileno()).st_size
+
+        raw_block_size, header_bytes = _locate_raw_block(file, file_size)
+
+    if raw_block_size is None:
+        raise ValueError('Unable to locate Bayer data in {filepath}'.format(**locals()))
+
+    cache_key = (raw_block_size, header_bytes)
+    with _detected_raw_formats_lock:
+        raw_format = _detected_raw_formats.get(cache_key)
+
+    if raw_format is None:
+        header = BroadcomRawHeader.from_buffer_copy(header_bytes)
+        raw_format = _get_camera_version_and_sensor_mode(header, raw_block_size)
+
+    with _detected_raw_formats_lock:
+        _move_to_end_of_bounded(_detected_raw_formats, cache_key, raw_format, MAX_DETECTED_RAW_FORMATS)
+        # So that this raw block size is checked first next time
+        _move_to_end_of_bounded(_recent_raw_block_sizes, raw_block_size, None, MAX_RECENT_RAW_BLOCK_SIZES)
+
+    return raw_format
+
+
+def _move_to_end_of_bounded(ordered_dict, key, value, max_length):
+    ''' Set a key of an OrderedDict as its most recently used, evicting the least recently used key if it's too long '''
+    ordered_dict[key] = value
+    ordered_dict.move_to_end(key)
+    if len(ordered_dict) > max_length:
+        ordered_dict.popitem(last=False)
+
+
+# The number of formats, and of raw block sizes, to remember having detected
+MAX_DETECTED_RAW_FORMATS = 64
+MAX_RECENT_RAW_BLOCK_SIZES = 8
+
+# Formats that have been detected by `detect_raw_format`, keyed by (raw block size, header bytes), and the raw block
+# sizes of recently detected formats, both least recently used first. Formats are detected from many threads at once
+# (e.g. by `PiRawBayer.from_files`), so these are only used under the lock.
+_detected_raw_formats = OrderedDict()  # type: OrderedDict
+_recent_raw_block_sizes = OrderedDict()  # type: OrderedDict
+_detected_raw_formats_lock = threading.Lock()
+
+# The number of bytes to read at a time when scanning backwards through a file for its raw block
+RAW_BLOCK_SCAN_CHUNK_SIZE = 1024 * 1024
+
+
+def _resolve_raw_format(filepath, camera_version, sensor_mode):
+    ''' Returns the given (camera_version, sensor_mode) - or, if `camera_version` is None, the detected ones '''
+    if camera_version is None:
+        return detect_raw_format(filepath)
+    return camera_version, sensor_mode
+
+
+def _locate_raw_block(file, file_size):
+    ''' Find the raw block at the end of an open JPEG+RAW file, checking each known raw block size and then scanning
+        backwards through the whole file
+
+    Returns: (raw_block_size, header_bytes), or (None, None) if there is no raw block
+    '''
+    raw_block_size, header_bytes = _locate_raw_block_of_known_size(file, file_size)
+    if raw_block_size is not None:
+        return raw_block_size, header_bytes
+
+    # Scan backwards from the end of the file. Consecutive chunks overlap by 3 bytes so that a marker that straddles
+    # the boundary between them is still found.
+    marker = b'BRCM'
+    chunk_end = file_size
+    while chunk_end > 0:
+        chunk_start = max(chunk_end - RAW_BLOCK_SCAN_CHUNK_SIZE, 0)
+        file.seek(chunk_start)
+        chunk = file.read(chunk_end - chunk_start + len(marker) - 1)
+        instrumentation.record_read(len(chunk))
+
+        marker_index = chunk.rfind(marker)
+        while marker_index != -1:
+            raw_block_size = file_size - (chunk_start + marker_index)
+            header_bytes = _read_header_bytes_if_raw_block(file, file_size, raw_block_size)
+            if header_bytes is not None:
+                return raw_block_size, header_bytes
+            marker_index = chunk.rfind(marker, 0, marker_index)
+
+        chunk_end = chunk_start
+
+    return None, None
+
+
+def _locate_raw_block_of_known_size(file, file_size):
+    ''' Find the raw block at the end of an open JPEG+RAW file by checking only the known raw block sizes (most
+        recently detected first). Only the start of each candidate raw block is read.
+
+    Returns: (raw_block_size, header_bytes), or (None, None) if the file doesn't end in a raw block of a known size
+    '''
+    with _detected_raw_formats_lock:
+        recently_detected_sizes = list(reversed(_recent_raw_block_sizes))
+
+    # Each size is only checked once, in order of first appearance
+    for raw_block_size in OrderedDict.fromkeys(recently_detected_sizes + _KNOWN_RAW_BLOCK_SIZES):
+        header_bytes = _read_header_bytes_if_raw_block(file, file_size, raw_block_size)
+        if header_bytes is not None:
+            return raw_block_size, header_bytes
+
+    return None, None
+
+
+def _read_header_bytes_if_raw_block(file, file_size, raw_block_size):
+    ''' Check whether the last `raw_block_size` bytes of an open file are a raw block that exactly fits the pixel data
+        described by its header
+
+    Returns: The bytes of the raw block's `BroadcomRawHeader`, or None if it's not a raw block
+    '''
+    if raw_block_size > file_size:
+        return None
+
+    file.seek(file_size - raw_block_size)
+    raw_block_prefix = file.read(HEADER_BYTE_OFFSET + ctypes.sizeof(BroadcomRawHeader))
+    instrumentation.record_read(len(raw_block_prefix))
+    if len(raw_block_prefix) < HEADER_BYTE_OFFSET + ctypes.sizeof(BroadcomRawHeader) or raw_block_prefix[:4] != b'BRCM':
+        return None
+
+    header_bytes = raw_block_prefix[HEADER_BYTE_OFFSET:]
+    header = BroadcomRawHeader.from_buffer_copy(header_bytes)
+    if header.width == 0 or header.height == 0:
+        return None
+
+    shape, _ = _get_packed_shape_and_crop(header)
+    if PIXEL_BYTE_OFFSET + shape.width * shape.height != raw_block_size:
+        return None
+
+    return header_bytes
+
+
+def _get_camera_version_and_sensor_mode(header, raw_block_size):
+    ''' Determine the camera version from the sensor name in the header, or failing that from the raw block size (if
+        only one camera version uses that size). Then determine the sensor mode from the raw block size.
+    '''
+    sensor_name = header.name.decode('ascii', errors='ignore').upper()
+    camera_versions = [
+        camera_version for camera_version in PiCameraVersion
+        if camera_version.value in sensor_name
+    ] or [
+        camera_version for camera_version, raw_block_size_by_mode in RAW_BLOCK_SIZE_BY_VERSION_AND_MODE.items()
+        if raw_block_size in raw_block_size_by_mode.values()
+    ]
+
+    if len(camera_versions) != 1:
+        raise ValueError(
+            'Unable to determine camera version from sensor name {header.name!r} and raw block size {raw_block_size}'
+            .format(**locals())
+        )
+    camera_version = camera_versions[0]
+
+    sensor_modes = [
+        sensor_mode for sensor_mode, sensor_mode_raw_block_size
+        in sorted(RAW_BLOCK_SIZE_BY_VERSION_AND_MODE[camera_version].items())
+        if sensor_mode_raw_block_size == raw_block_size
+    ]
+    if not sensor_modes:
+        raise ValueError(
+            'Raw block size {raw_block_size} does not match any sensor mode of camera version {camera_version}'
+            .format(**locals())
+        )
+
+    return camera_version, sensor_modes[0]
@@ -1,10 +1,20 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
 import pkg_resources
+import sys
 from unittest.mock import sentinel, MagicMock
 
 import numpy as np
 import pytest
 
+from .cache import FrameCache, SidecarCache
 from .constants import BayerOrder, PiCameraVersion
+from .metadata_test import make_exif_jpeg
+from .resolution import PiRegion
+from . import instrumentation
 from . import main as module
 
 picamv2_jpeg_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2.jpeg')
@@ -39,6 +49,160 @@ class TestGetRawBayerBytes:
             )
 
 
+class TestReadFileTail:
+    def test_reads_only_the_tail(self, tmp_path):
+        filepath = tmp_path / 'file.jpeg'
+        filepath.write_bytes(b'initial-file-contents-BRCM-test-stream')
+
+        actual = module._read_file_tail(str(filepath), 16)
+
+        assert actual == b'BRCM-test-stream'
+
+    def test_reads_whole_file_if_shorter_than_size(self, tmp_path):
+        filepath = tmp_path / 'file.jpeg'
+        filepath.write_bytes(b'short')
+
+        actual = module._read_file_tail(str(filepath), 16)
+
+        assert actual == b'short'
+
+
+class TestMemoryMapFileTail:
+    def test_maps_only_the_tail(self, tmp_path):
+        filepath = tmp_path / 'file.jpeg'
+        filepath.write_bytes(b'initial-file-contents-BRCM-test-stream')
+
+        actual = module._memory_map_file_tail(str(filepath), 16)
+
+        assert actual.tobytes() == b'BRCM-test-stream'
+        assert not actual.flags.writeable
+
+    def test_get_raw_bayer_bytes_accepts_mapped_tail(self, tmp_path, mocker):
+        filepath = tmp_path / 'file.jpeg'
+        filepath.write_bytes(b'initial-file-contents-BRCM-test-stream')
+        mocker.patch.object(module, '_get_raw_block_size').return_value = 16
+
+        actual = module._get_raw_bayer_bytes(
+            jpeg_data_as_bytes=module._memory_map_file_tail(str(filepath), 16),
+            camera_version=sentinel.camera_version,
+            sensor_mode=sentinel.sensor_mode,
+        )
+
+        assert actual.tobytes() == b'BRCM-test-stream'
+
+
+def _make_raw_block(sensor_name, width, height):
+    header = module.BroadcomRawHeader(name=sensor_name, width=width, height=height)
+    shape, _ = module._get_packed_shape_and_crop(header)
+
+    raw_block = bytearray(module.PIXEL_BYTE_OFFSET + shape.width * shape.height)
+    raw_block[:4] = b'BRCM'
+    raw_block[module.HEADER_BYTE_OFFSET:module.HEADER_BYTE_OFFSET + len(bytes(header))] = bytes(header)
+    return bytes(raw_block)
+
+
+class TestDetectRawFormat:
+    def test_detects_known_format(self):
+        actual = module.detect_raw_format(picamv2_jpeg_path)
+
+        assert actual == (PiCameraVersion.V2, 0)
+
+    def test_pi_raw_bayer_detects_format(self):
+        raw_bayer = module.PiRawBayer(filepath=picamv2_jpeg_path)
+
+        assert raw_bayer.camera_version == PiCameraVersion.V2
+        assert raw_bayer.bayer_order == BayerOrder.BGGR
+        np.testing.assert_array_equal(raw_bayer.bayer_array, np.load(picamv2_BGGR_bayer_array_path))
+
+    def test_scans_for_unknown_raw_block_size(self, tmp_path, mocker):
+        mocker.patch.object(module, 'RAW_BLOCK_SCAN_CHUNK_SIZE', 1000)
+        raw_block = _make_raw_block(b'imx219', width=16, height=16)
+        filepath = tmp_path / 'file.jpeg'
+        # Include a decoy marker, which doesn't have a matching header, ahead of the real raw block
+        filepath.write_bytes(b'jpeg-data-BRCM' + b'-jpeg-data' * 500 + raw_block)
+
+        with open(str(filepath), mode='rb') as file:
+            raw_block_size, header_bytes = module._locate_raw_block(file, len(filepath.read_bytes()))
+
+        assert raw_block_size == len(raw_block)
+        assert module.BroadcomRawHeader.from_buffer_copy(header_bytes).width == 16
+
+        with pytest.raises(ValueError, match='does not match any sensor mode of camera version PiCameraVersion.V2'):
+            module.detect_raw_format(str(filepath))
+
+    def test_detects_mixed_formats_from_many_threads(self, tmp_path, mocker):
+        mocker.patch.object(module, '_detected_raw_formats', OrderedDict())
+        mocker.patch.object(module, '_recent_raw_block_sizes', OrderedDict())
+        formats = [
+            (b'imx219', 1640, 922, (PiCameraVersion.V2, 5)),
+            (b'ov5647', 1296, 730, (PiCameraVersion.V1, 5)),
+            (b'ov5647', 1296, 972, (PiCameraVersion.V1, 4)),
+        ]
+        filepaths_and_formats = []
+        for index, (sensor_name, width, height, expected) in enumerate(formats):
+            filepath = tmp_path / '{index}.jpeg'.format(**locals())
+            filepath.write_bytes(b'jpeg-data' + _make_raw_block(sensor_name, width, height))
+            filepaths_and_formats.append((str(filepath), expected))
+
+        def _detect_all(_):
+            return [
+                module.detect_raw_format(filepath) == expected
+                for _ in range(20)
+                for filepath, expected in filepaths_and_formats
+            ]
+
+        # Switch threads as often as possible, so that they interleave mid-iteration
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                actual = [all(detected) for detected in executor.map(_detect_all, range(8))]
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        assert actual == [True] * 8
+
+    def test_remembers_a_bounded_number_of_formats(self, tmp_path, mocker):
+        mocker.patch.object(module, '_detected_raw_formats', OrderedDict())
+        mocker.patch.object(module, '_recent_raw_block_sizes', OrderedDict())
+        mocker.patch.object(module, 'MAX_DETECTED_RAW_FORMATS', 2)
+        mocker.patch.object(module, 'MAX_RECENT_RAW_BLOCK_SIZES', 2)
+        for sensor_name, width, height in [(b'imx219', 1640, 922), (b'ov5647', 1296, 730), (b'ov5647', 1296, 972)]:
+            filepath = tmp_path / 'file.jpeg'
+            filepath.write_bytes(b'jpeg-data' + _make_raw_block(sensor_name, width, height))
+            module.detect_raw_format(str(filepath))
+
+        assert len(module._detected_raw_formats) == 2
+        # Most recently detected last
+        assert list(module._recent_raw_block_sizes) == [1233920, 1625600]
+
+    def test_raises_if_no_raw_block(self, tmp_path):
+        filepath = tmp_path / 'file.jpeg'
+        filepath.write_bytes(b'jpeg-data-BRCM-jpeg-data')
+
+        with pytest.raises(ValueError, match='Unable to locate Bayer data'):
+            module.detect_raw_format(str(filepath))
+
+
+class TestGetCameraVersionAndSensorMode:
+    @pytest.mark.parametrize('sensor_name,raw_block_size,expected', [
+        (b'ov5647', 445440, (PiCameraVersion.V1, 6)),
+        (b'imx219', 445440, (PiCameraVersion.V2, 7)),
+        (b'', 10270208, (PiCameraVersion.V2, 0)),
+        (b'', 2717696, (PiCameraVersion.V1, 1)),
+    ])
+    def test_gets_camera_version_and_sensor_mode(self, sensor_name, raw_block_size, expected):
+        header = module.BroadcomRawHeader(name=sensor_name)
+
+        assert module._get_camera_version_and_sensor_mode(header, raw_block_size) == expected
+
+    def test_raises_if_ambiguous(self):
+        header = module.BroadcomRawHeader(name=b'unknown')
+
+        with pytest.raises(ValueError, match='Unable to determine camera version'):
+            module._get_camera_version_and_sensor_mode(header, 445440)
+
+
 class TestGetRawBlockSize:
     @pytest.mark.parametrize('camera_version,sensor_mode', [
         (camera_version_enum, sensor_mode)
@@ -71,6 +235,249 @@ class TestExtractRawFromJpeg:
 
         np.testing.assert_array_equal(actual, expected)
 
+    def test_memory_mapped_extraction_matches(self):
+        bayer_array, bayer_order = module.extract_raw_from_jpeg(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            memory_map=True,
+        )
+
+        assert bayer_order == BayerOrder.BGGR
+        np.testing.assert_array_equal(bayer_array, self.bayer_array)
+
+    def test_extracts_into_out_array(self):
+        out = np.empty_like(self.bayer_array)
+
+        bayer_array, _ = module.extract_raw_from_jpeg(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            out=out,
+        )
+
+        assert bayer_array is out
+        np.testing.assert_array_equal(bayer_array, self.bayer_array)
+
+
+class TestExtractRawFromBuffer:
+    @pytest.mark.parametrize('buffer_type', [bytes, bytearray, memoryview])
+    def test_extracts_raw_data(self, buffer_type):
+        with open(picamv2_jpeg_path, mode='rb') as file:
+            buffer = buffer_type(file.read())
+
+        bayer_array, bayer_order = module.extract_raw_from_buffer(
+            buffer,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+        )
+
+        assert bayer_order == BayerOrder.BGGR
+        np.testing.assert_array_equal(bayer_array, np.load(picamv2_BGGR_bayer_array_path))
+
+
+class TestExtractRawFromStream:
+    def test_extracts_raw_data_from_bytes_io(self):
+        with open(picamv2_jpeg_path, mode='rb') as file:
+            stream = io.BytesIO(file.read())
+
+        bayer_array, bayer_order = module.extract_raw_from_stream(
+            stream,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+        )
+
+        assert bayer_order == BayerOrder.BGGR
+        np.testing.assert_array_equal(bayer_array, np.load(picamv2_BGGR_bayer_array_path))
+
+        # The stream's buffer has been released, so the stream can be written to again
+        stream.write(b'more')
+
+    def test_extracts_raw_data_from_file_object(self):
+        with open(picamv2_jpeg_path, mode='rb') as file:
+            bayer_array, bayer_order = module.extract_raw_from_stream(
+                file,
+                camera_version=PiCameraVersion.V2,
+                sensor_mode=0,
+            )
+
+        assert bayer_order == BayerOrder.BGGR
+        np.testing.assert_array_equal(bayer_array, np.load(picamv2_BGGR_bayer_array_path))
+
+
+class TestReadStreamTail:
+    def test_reads_only_the_tail_of_seekable_streams(self):
+        stream = io.BufferedReader(io.BytesIO(b'initial-file-contents-BRCM-test-stream'))
+
+        actual = module._read_stream_tail(stream, 16)
+
+        assert actual == b'BRCM-test-stream'
+
+    def test_reads_all_of_unseekable_streams(self):
+        stream = MagicMock(spec=['read', 'seekable'])
+        stream.seekable.return_value = False
+        stream.read.return_value = b'initial-file-contents-BRCM-test-stream'
+
+        actual = module._read_stream_tail(stream, 16)
+
+        assert actual == b'initial-file-contents-BRCM-test-stream'
+
+
+class TestExtractRawFromJpegRegion:
+    full_bayer_array = np.load(picamv2_BGGR_bayer_array_path)
+
+    @pytest.mark.parametrize('roi,expected_bayer_order', [
+        (PiRegion(x=0, y=0, width=3280, height=2464), BayerOrder.BGGR),
+        (PiRegion(x=400, y=200, width=64, height=32), BayerOrder.BGGR),
+        (PiRegion(x=401, y=200, width=64, height=32), BayerOrder.GBRG),
+        (PiRegion(x=402, y=201, width=63, height=31), BayerOrder.GRBG),
+        (PiRegion(x=3277, y=2461, width=3, height=3), BayerOrder.RGGB),
+    ])
+    @pytest.mark.parametrize('memory_map', [False, True])
+    def test_extracts_region(self, roi, expected_bayer_order, memory_map):
+        bayer_array, bayer_order = module.extract_raw_from_jpeg(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            memory_map=memory_map,
+            roi=roi,
+        )
+
+        expected = self.full_bayer_array[roi.y:roi.y + roi.height, roi.x:roi.x + roi.width]
+
+        assert bayer_order == expected_bayer_order
+        np.testing.assert_array_equal(bayer_array, expected)
+
+    def test_extracts_region_into_out_array(self):
+        out = np.empty((10, 10), dtype=np.uint16)
+
+        bayer_array, _ = module.extract_raw_from_jpeg(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            roi=(3, 5, 10, 10),
+            out=out,
+        )
+
+        assert bayer_array is out
+        np.testing.assert_array_equal(bayer_array, self.full_bayer_array[5:15, 3:13])
+
+    @pytest.mark.parametrize('roi', [
+        (-1, 0, 10, 10),
+        (0, 0, 0, 10),
+        (3272, 0, 10, 10),
+        (0, 2460, 10, 10),
+    ])
+    def test_region_outside_image_raises(self, roi):
+        with pytest.raises(ValueError, match='Region of interest .* is not within the image'):
+            module.extract_raw_from_jpeg(
+                filepath=picamv2_jpeg_path,
+                camera_version=PiCameraVersion.V2,
+                sensor_mode=0,
+                roi=roi,
+            )
+
+
+class TestExtractBandsFromJpeg:
+    @pytest.mark.parametrize('band_height', [2, 64, 1000, 4000])
+    def test_raw_bands_concatenate_to_bayer_array(self, band_height):
+        bands, bayer_order = module.extract_raw_bands_from_jpeg(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            band_height=band_height,
+        )
+        bands = list(bands)
+
+        assert bayer_order == BayerOrder.BGGR
+        assert all(band.shape[0] <= band_height for band in bands)
+        np.testing.assert_array_equal(np.concatenate(bands), np.load(picamv2_BGGR_bayer_array_path))
+
+    def test_rgb_bands_concatenate_to_rgb_array(self):
+        bands = module.extract_rgb_bands_from_jpeg(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            band_height=100,
+            dtype=np.float32,
+        )
+
+        np.testing.assert_array_equal(np.concatenate(list(bands)), np.load(picamv2_rgb_path))
+
+    def test_odd_band_height_raises(self):
+        expected_error_message = r'band_height \(63\) must be a positive multiple of 2'
+        with pytest.raises(ValueError, match=expected_error_message):
+            module.extract_raw_bands_from_jpeg(
+                filepath=picamv2_jpeg_path,
+                camera_version=PiCameraVersion.V2,
+                sensor_mode=0,
+                band_height=63,
+            )
+
+
+class TestBayerOrderAtOffset:
+    @pytest.mark.parametrize('bayer_order,y_offset,x_offset,expected', [
+        (BayerOrder.RGGB, 0, 0, BayerOrder.RGGB),
+        (BayerOrder.RGGB, 0, 1, BayerOrder.GRBG),
+        (BayerOrder.RGGB, 1, 0, BayerOrder.GBRG),
+        (BayerOrder.RGGB, 1, 1, BayerOrder.BGGR),
+        (BayerOrder.BGGR, 2, 3, BayerOrder.GBRG),
+        (BayerOrder.GRBG, 5, 4, BayerOrder.BGGR),
+    ])
+    def test_bayer_order_at_offset(self, bayer_order, y_offset, x_offset, expected):
+        assert module._bayer_order_at_offset(bayer_order, y_offset, x_offset) == expected
+
+
+class TestReadRawHeader:
+    def test_reads_header_fields(self):
+        header = module.read_raw_header(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0
+        )
+
+        assert (header.width, header.height) == (3280, 2464)
+        assert module.BROADCOM_BAYER_ORDER_TO_ENUM[header.bayer_order] == BayerOrder.BGGR
+
+    def test_raises_if_missing_prefix(self, tmp_path, mocker):
+        filepath = tmp_path / 'file.jpeg'
+        filepath.write_bytes(b'initial-file-contents-test-stream' * 10)
+        mocker.patch.object(module, '_get_raw_block_size').return_value = 250
+
+        with pytest.raises(ValueError, match='Unable to locate Bayer data'):
+            module.read_raw_header(str(filepath), sentinel.camera_version, sentinel.sensor_mode)
+
+
+class TestExtractRgbFromJpeg:
+    def test_matches_bayer_array_to_rgb(self):
+        actual = module.extract_rgb_from_jpeg(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0
+        )
+
+        expected = np.load(picamv2_rgb_path)
+
+        assert actual.dtype == np.float64
+        np.testing.assert_array_equal(actual, expected)
+
+    @pytest.mark.parametrize('dtype', [np.float32, np.uint16])
+    def test_output_dtype(self, dtype):
+        actual = module.extract_rgb_from_jpeg(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            dtype=dtype,
+        )
+
+        # Integer dtypes round the averaged green down
+        expected = np.load(picamv2_rgb_path)
+        if np.issubdtype(dtype, np.integer):
+            expected = np.floor(expected)
+
+        assert actual.dtype == dtype
+        np.testing.assert_array_equal(actual, expected.astype(dtype))
+
 
 class TestBayerArrayTo3D:
     bayer_array = np.array([
@@ -101,6 +508,21 @@ class TestBayerArrayTo3D:
 
         np.testing.assert_array_equal(actual, expected)
 
+    def test_reuses_out_array(self):
+        out = np.ones((2, 2, 3), dtype=np.float32)
+
+        actual = module.bayer_array_to_3d(self.bayer_array, BayerOrder.RGGB, out=out)
+
+        assert actual is out
+        np.testing.assert_array_equal(actual, module.bayer_array_to_3d(self.bayer_array, BayerOrder.RGGB))
+
+    @pytest.mark.parametrize('dtype', [np.float32, np.dtype('float32')])
+    def test_output_dtype(self, dtype):
+        # On numpy 1.x, a dtype instance with no fields is falsy
+        actual = module.bayer_array_to_3d(self.bayer_array.astype(np.uint16), BayerOrder.RGGB, dtype=dtype)
+
+        assert actual.dtype == np.float32
+
     def test_integration(self):
         bayer_array = np.load(picamv2_BGGR_bayer_array_path)
         actual = module.bayer_array_to_3d(bayer_array, BayerOrder.BGGR)
@@ -134,6 +556,41 @@ class TestBayerArrayToRGB:
 
         np.testing.assert_array_equal(actual, expected)
 
+    @pytest.mark.parametrize('dtype,expected_green', [
+        (np.float32, 2.5),
+        (np.uint16, 2),
+    ])
+    def test_output_dtype(self, dtype, expected_green):
+        bayer_array = np.array([
+            [1, 2],
+            [3, 5],
+        ], dtype=np.uint16)
+
+        actual = module.bayer_array_to_rgb(bayer_array, BayerOrder.RGGB, dtype=dtype)
+
+        assert actual.dtype == dtype
+        np.testing.assert_array_equal(actual, np.array([[[1, expected_green, 5]]], dtype=dtype))
+
+    def test_reuses_out_array(self):
+        bayer_array = np.array([
+            [1, 2],
+            [3, 5],
+        ])
+        out = np.empty((1, 1, 3), dtype=np.float32)
+
+        actual = module.bayer_array_to_rgb(bayer_array, BayerOrder.RGGB, out=out)
+
+        assert actual is out
+        np.testing.assert_array_equal(actual, np.array([[[1, 2.5, 5]]]))
+
+    def test_wrong_shape_out_array_raises(self):
+        bayer_array = np.zeros((4, 4))
+        out = np.empty((4, 4, 3))
+
+        expected_error_message = r'Output array is the wrong shape: expected \(2, 2, 3\), got \(4, 4, 3\)'
+        with pytest.raises(ValueError, match=expected_error_message):
+            module.bayer_array_to_rgb(bayer_array, BayerOrder.RGGB, out=out)
+
     def test_uneven_shape_raises(self):
         bayer_array = np.array([
             [1, 2, 3],
@@ -209,6 +666,15 @@ class TestUnpack10BitValues:
 
         np.testing.assert_array_equal(actual, expected)
 
+    def test_unpack_10bit_values__into_out_array(self):
+        mock_pixel_bytes_2d = np.array([[0b11111111, 0b10010010, 0b01001001, 0b00000000, 0b11100100]], dtype=np.uint8)
+        out = np.zeros((1, 4), dtype=np.float32)
+
+        actual = module._unpack_10bit_values(mock_pixel_bytes_2d, out=out)
+
+        assert actual is out
+        np.testing.assert_array_equal(actual, [[0b1111111100, 0b1001001001, 0b0100100110, 0b0000000011]])
+
     def test_unpack_10bit_values__correct_shape_doesnt_raise(self):
         mock_pixel_bytes_2d = np.zeros((10, 25)).astype(np.uint8)
         module._unpack_10bit_values(mock_pixel_bytes_2d)
@@ -221,6 +687,17 @@ class TestUnpack10BitValues:
             module._unpack_10bit_values(mock_pixel_bytes_2d)
 
 
+class TestUnpack10BitPlane:
+    @pytest.mark.parametrize('y_offset,x_offset', [(0, 0), (0, 1), (1, 0), (1, 1)])
+    def test_matches_slice_of_unpacked_values(self, y_offset, x_offset):
+        mock_pixel_bytes_2d = np.arange(4 * 10, dtype=np.uint8).reshape((4, 10)) * 5
+
+        unpacked = module._unpack_10bit_values(mock_pixel_bytes_2d)
+        actual = module._unpack_10bit_plane(mock_pixel_bytes_2d, y_offset, x_offset)
+
+        np.testing.assert_array_equal(actual, unpacked[y_offset::2, x_offset::2])
+
+
 class TestPixelBytesToArray:
     def test_pixel_bytes_to_array(self):
         mock_header = MagicMock(
@@ -269,6 +746,116 @@ class TestPiRawBayer:
 
         np.testing.assert_array_equal(actual, expected)
 
+    def test_lazy_reads_header_without_extracting(self, mocker):
+        mock_extract = mocker.patch.object(module, '_extract_raw_and_header')
+
+        raw_bayer = module.PiRawBayer(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            lazy=True,
+        )
+
+        assert raw_bayer.bayer_order == BayerOrder.BGGR
+        assert raw_bayer.header.width == 3280
+        mock_extract.assert_not_called()
+
+    def test_lazy_extracts_on_first_access_only(self, mocker):
+        spy_extract = mocker.spy(module, '_extract_raw_and_header')
+
+        raw_bayer = module.PiRawBayer(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            lazy=True,
+        )
+
+        np.testing.assert_array_equal(raw_bayer.bayer_array, np.load(picamv2_BGGR_bayer_array_path))
+        assert raw_bayer.bayer_array is raw_bayer.bayer_array
+        assert spy_extract.call_count == 1
+
+    def test_from_files_extracts_each_file_in_order(self):
+        raw_bayers = list(module.PiRawBayer.from_files(
+            [picamv2_jpeg_path, picamv2_jpeg_path],
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            workers=2,
+        ))
+
+        assert len(raw_bayers) == 2
+        for raw_bayer in raw_bayers:
+            assert raw_bayer.filepath == picamv2_jpeg_path
+            assert raw_bayer.bayer_order == BayerOrder.BGGR
+            np.testing.assert_array_equal(raw_bayer.bayer_array, np.load(picamv2_BGGR_bayer_array_path))
+
+    def test_aload_extracts_file_on_executors(self):
+        loop = asyncio.new_event_loop()
+        try:
+            raw_bayer = loop.run_until_complete(module.PiRawBayer.aload(picamv2_jpeg_path, roi=(1, 1, 64, 32)))
+        finally:
+            loop.close()
+
+        assert raw_bayer.filepath == picamv2_jpeg_path
+        assert raw_bayer.camera_version == PiCameraVersion.V2
+        assert raw_bayer.bayer_order == BayerOrder.RGGB
+        np.testing.assert_array_equal(raw_bayer.bayer_array, np.load(picamv2_BGGR_bayer_array_path)[1:33, 1:65])
+
+    def test_afrom_files_extracts_each_file(self):
+        async def _collect():
+            raw_bayers = []
+            async for raw_bayer in module.PiRawBayer.afrom_files(
+                [picamv2_jpeg_path, picamv2_jpeg_path], PiCameraVersion.V2, concurrency=2
+            ):
+                raw_bayers.append(raw_bayer)
+            return raw_bayers
+
+        loop = asyncio.new_event_loop()
+        try:
+            raw_bayers = loop.run_until_complete(_collect())
+        finally:
+            loop.close()
+
+        assert len(raw_bayers) == 2
+        for raw_bayer in raw_bayers:
+            np.testing.assert_array_equal(raw_bayer.bayer_array, np.load(picamv2_BGGR_bayer_array_path))
+
+    def test_lazy_rgb_skips_bayer_array(self, mocker):
+        mock_extract = mocker.patch.object(module, '_extract_raw_and_header')
+
+        raw_bayer = module.PiRawBayer(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            lazy=True,
+        )
+
+        np.testing.assert_array_equal(raw_bayer.to_rgb(), np.load(picamv2_rgb_path))
+        mock_extract.assert_not_called()
+
+    @pytest.mark.parametrize('lazy', [False, True])
+    def test_extracts_region(self, lazy):
+        raw_bayer = module.PiRawBayer(
+            filepath=picamv2_jpeg_path,
+            camera_version=PiCameraVersion.V2,
+            sensor_mode=0,
+            lazy=lazy,
+            roi=(1, 1, 4, 4),
+        )
+
+        assert raw_bayer.bayer_order == BayerOrder.RGGB
+        np.testing.assert_array_equal(raw_bayer.bayer_array, np.load(picamv2_BGGR_bayer_array_path)[1:5, 1:5])
+        assert raw_bayer.to_rgb().shape == (2, 2, 3)
+
+    def test_from_stream(self):
+        with open(picamv2_jpeg_path, mode='rb') as file:
+            stream = io.BytesIO(file.read())
+
+        raw_bayer = module.PiRawBayer.from_stream(stream, camera_version=PiCameraVersion.V2, roi=(0, 1, 4, 4))
+
+        assert raw_bayer.filepath is None
+        assert raw_bayer.bayer_order == BayerOrder.GRBG
+        np.testing.assert_array_equal(raw_bayer.bayer_array, np.load(picamv2_BGGR_bayer_array_path)[1:5, 0:4])
+
     def test_rgb_array_property(self, mocker):
         mocker.patch.object(module, 'bayer_array_to_rgb').return_value = sentinel.rgb_array
 
@@ -290,3 +877,269 @@ class TestPiRawBayer:
         )
 
         assert raw_bayer.to_3d() == sentinel.array_3d
+
+
+class TestBayerArrayToPlanes:
+    test_bayer_array = np.array([
+        [1, 2, 5, 6],
+        [3, 4, 7, 8],
+    ])
+
+    def test_returns_views(self):
+        actual = module.bayer_array_to_planes(self.test_bayer_array, BayerOrder.GBRG)
+
+        # GBRG: G1 is top left, B is top right, R is bottom left and G2 is bottom right
+        np.testing.assert_array_equal(actual.R, [[3, 7]])
+        np.testing.assert_array_equal(actual.G1, [[1, 5]])
+        np.testing.assert_array_equal(actual.G2, [[4, 8]])
+        np.testing.assert_array_equal(actual.B, [[2, 6]])
+        for plane in actual:
+            assert plane.base is self.test_bayer_array
+
+    @pytest.mark.parametrize('dtype', [np.float32, np.dtype('float32')])
+    def test_returns_contiguous_array(self, dtype):
+        actual = module.bayer_array_to_planes(self.test_bayer_array, BayerOrder.RGGB, contiguous=True, dtype=dtype)
+
+        assert actual.dtype == np.float32
+        np.testing.assert_array_equal(actual, [[[1, 5]], [[3, 7]], [[2, 6]], [[4, 8]]])
+
+    def test_fills_out(self):
+        out = np.zeros((4, 1, 2), dtype=np.uint16)
+
+        actual = module.bayer_array_to_planes(self.test_bayer_array, BayerOrder.RGGB, out=out)
+
+        assert actual is out
+        np.testing.assert_array_equal(out[0], [[1, 5]])
+
+    def test_raises_on_odd_shape(self):
+        with pytest.raises(ValueError):
+            module.bayer_array_to_planes(self.test_bayer_array[:1], BayerOrder.RGGB)
+
+    def test_pi_raw_bayer_to_planes(self):
+        raw_bayer = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2)
+
+        actual = raw_bayer.to_planes()
+
+        # BGGR: blue is top left
+        np.testing.assert_array_equal(actual.B, np.load(picamv2_BGGR_bayer_array_path)[0::2, 0::2])
+        assert raw_bayer.to_planes(contiguous=True).shape == (4, 1232, 1640)
+
+
+class TestPiRawBayerChannelStatistics:
+    def test_calculates_statistics_of_region(self):
+        raw_bayer = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2)
+        region_array = np.load(picamv2_BGGR_bayer_array_path)[1:101, 1:201]
+
+        actual = raw_bayer.channel_statistics(roi=(1, 1, 200, 100))
+
+        # The region starts at an odd row and column of a BGGR image, so its top left pixel is red
+        assert actual['R'].count == 100 * 50
+        assert actual['R'].mean == pytest.approx(region_array[0::2, 0::2].mean())
+        assert actual['B'].max == region_array[1::2, 1::2].max()
+
+    def test_does_not_build_rgb_array(self, mocker):
+        raw_bayer = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2)
+        mock_to_rgb = mocker.patch.object(module, 'bayer_array_to_rgb')
+
+        raw_bayer.channel_statistics()
+
+        mock_to_rgb.assert_not_called()
+
+
+class TestPiRawBayerMetadata:
+    @pytest.fixture
+    def exif_jpeg_path(self, tmp_path):
+        with open(picamv2_jpeg_path, 'rb') as jpeg_file:
+            jpeg_bytes = jpeg_file.read()
+        exif_jpeg_path = tmp_path / 'exif.jpeg'
+        exif_jpeg_path.write_bytes(make_exif_jpeg() + jpeg_bytes[2:])
+        return str(exif_jpeg_path)
+
+    def test_reads_metadata_lazily_once(self, exif_jpeg_path, mocker):
+        spy_read_exif_tags = mocker.spy(module, 'read_exif_tags')
+        raw_bayer = module.PiRawBayer(exif_jpeg_path, PiCameraVersion.V2, roi=(1, 1, 4, 4))
+
+        assert spy_read_exif_tags.call_count == 0
+        metadata = raw_bayer.metadata
+        assert raw_bayer.metadata is metadata
+        assert spy_read_exif_tags.call_count == 1
+
+        assert (metadata.width, metadata.height) == (3280, 2464)
+        # The bayer order of the whole image, not the region
+        assert metadata.bayer_order == BayerOrder.BGGR
+        assert metadata.exposure_time == 0.01
+        assert metadata.awb_gains == (1.426, 1.797)
+
+    def test_read_raw_metadata_skips_pixel_data(self, exif_jpeg_path, mocker):
+        spy_unpack = mocker.spy(module, '_pixel_bytes_to_array')
+
+        actual = module.read_raw_metadata(exif_jpeg_path)
+
+        assert actual.iso == 200
+        spy_unpack.assert_not_called()
+
+    def test_from_buffer_has_no_exif(self):
+        with open(picamv2_jpeg_path, 'rb') as jpeg_file:
+            raw_bayer = module.PiRawBayer.from_buffer(jpeg_file.read(), PiCameraVersion.V2)
+
+        assert raw_bayer.metadata.width == 3280
+        assert raw_bayer.metadata.exposure_time is None
+
+
+class TestPiRawBayerDemosaic:
+    def test_demosaics_region_with_its_own_bayer_order(self):
+        raw_bayer = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, roi=(1, 1, 64, 32))
+
+        actual = raw_bayer.demosaic(method='bilinear', dtype=np.float32)
+
+        region_array = np.load(picamv2_BGGR_bayer_array_path)[1:33, 1:65]
+        assert actual.shape == (32, 64, 3)
+        assert actual.dtype == np.float32
+        # The region's top left pixel is red
+        np.testing.assert_array_equal(actual[0::2, 0::2, 0], region_array[0::2, 0::2])
+        np.testing.assert_array_equal(actual[1::2, 1::2, 2], region_array[1::2, 1::2])
+
+
+class TestPiRawBayerCache:
+    def test_extracts_each_file_once(self, mocker):
+        spy_extract = mocker.spy(module, '_extract_raw_and_header')
+        cache = FrameCache()
+
+        first = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, cache=cache)
+        second = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, cache=cache)
+
+        assert spy_extract.call_count == 1
+        assert second.bayer_array is first.bayer_array
+        assert not second.bayer_array.flags.writeable
+        np.testing.assert_array_equal(second.bayer_array, np.load(picamv2_BGGR_bayer_array_path))
+
+    @pytest.mark.parametrize('lazy', [False, True])
+    def test_slices_regions_from_cached_frame(self, mocker, lazy):
+        cache = FrameCache()
+        module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, cache=cache)
+        spy_extract = mocker.spy(module, '_extract_raw_and_header')
+
+        raw_bayer = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, lazy=lazy, roi=(1, 1, 4, 4), cache=cache)
+
+        assert raw_bayer.bayer_order == BayerOrder.RGGB
+        np.testing.assert_array_equal(raw_bayer.bayer_array, np.load(picamv2_BGGR_bayer_array_path)[1:5, 1:5])
+        spy_extract.assert_not_called()
+
+    def test_caches_rgb_by_dtype(self, mocker):
+        cache = FrameCache()
+        spy_to_rgb = mocker.spy(module, 'bayer_array_to_rgb')
+
+        first = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, cache=cache).to_rgb()
+        second = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, lazy=True, cache=cache).to_rgb()
+        module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2, cache=cache).to_rgb(dtype=np.uint16)
+
+        assert second is first
+        assert not second.flags.writeable
+        np.testing.assert_array_equal(second, np.load(picamv2_rgb_path))
+        assert spy_to_rgb.call_count == 2
+
+    def test_extracts_again_when_file_changes(self, tmpdir):
+        filepath = str(tmpdir.join('image.jpeg'))
+        with open(picamv2_jpeg_path, mode='rb') as file:
+            jpeg_data = file.read()
+        with open(filepath, mode='wb') as file:
+            file.write(jpeg_data)
+        cache = FrameCache()
+        module.PiRawBayer(filepath, PiCameraVersion.V2, cache=cache)
+
+        with open(filepath, mode='wb') as file:
+            file.write(b'extra bytes in front' + jpeg_data)
+
+        module.PiRawBayer(filepath, PiCameraVersion.V2, cache=cache)
+
+        assert cache.misses == 2
+
+
+class TestPiRawBayerDiskCache:
+    @pytest.fixture
+    def jpeg_path(self, tmpdir):
+        jpeg_path = str(tmpdir.join('image.jpeg'))
+        with open(picamv2_jpeg_path, mode='rb') as source_file, open(jpeg_path, mode='wb') as file:
+            file.write(source_file.read())
+        return jpeg_path
+
+    def test_loads_frame_from_sidecar(self, mocker, jpeg_path):
+        disk_cache = SidecarCache()
+        module.PiRawBayer(jpeg_path, PiCameraVersion.V2, disk_cache=disk_cache)
+        spy_extract = mocker.spy(module, '_extract_raw_and_header')
+
+        raw_bayer = module.PiRawBayer(jpeg_path, PiCameraVersion.V2, roi=(1, 1, 4, 4), disk_cache=disk_cache)
+
+        spy_extract.assert_not_called()
+        assert raw_bayer.bayer_order == BayerOrder.RGGB
+        assert raw_bayer.header.width == 3280
+        np.testing.assert_array_equal(raw_bayer.bayer_array, np.load(picamv2_BGGR_bayer_array_path)[1:5, 1:5])
+        np.testing.assert_array_equal(
+            module.PiRawBayer(jpeg_path, PiCameraVersion.V2, disk_cache=disk_cache).to_rgb(),
+            np.load(picamv2_rgb_path),
+        )
+
+    def test_decodes_again_when_file_changes(self, mocker, jpeg_path):
+        disk_cache = SidecarCache()
+        module.PiRawBayer(jpeg_path, PiCameraVersion.V2, disk_cache=disk_cache)
+        os.utime(jpeg_path, ns=(0, 0))
+        spy_extract = mocker.spy(module, '_extract_raw_and_header')
+
+        module.PiRawBayer(jpeg_path, PiCameraVersion.V2, disk_cache=disk_cache)
+        module.PiRawBayer(jpeg_path, PiCameraVersion.V2, disk_cache=disk_cache)
+
+        assert spy_extract.call_count == 1
+
+
+class TestInstrumentation:
+    def test_extract_raw_from_jpeg_reports_stages(self):
+        with instrumentation.instrument() as measurements:
+            module.extract_raw_from_jpeg(picamv2_jpeg_path, PiCameraVersion.V2, sensor_mode=0)
+
+        assert len(measurements) == 1
+        measurement = measurements[0]
+        assert measurement.call == 'extract_raw_from_jpeg'
+        assert [stage.stage for stage in measurement.stages] == ['read', 'parse_header', 'reshape', 'unpack']
+        assert measurement.bytes_read == module.RAW_BLOCK_SIZE_BY_VERSION_AND_MODE[PiCameraVersion.V2][0]
+        # The output array, and the scratch buffers used to unpack into it
+        assert measurement.bytes_allocated == 3280 * 2464 * 2 + 3280 * 2464 // 4 * 3
+
+    def test_pi_raw_bayer_reports_a_single_call_including_detection(self):
+        with instrumentation.instrument() as measurements:
+            module.PiRawBayer(picamv2_jpeg_path)
+
+        assert [measurement.call for measurement in measurements] == ['PiRawBayer']
+        assert [stage.stage for stage in measurements[0].stages] == [
+            'locate', 'read', 'parse_header', 'reshape', 'unpack'
+        ]
+
+    def test_to_rgb_reports_rgb_stage(self):
+        raw_bayer = module.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2)
+
+        with instrumentation.instrument() as measurements:
+            raw_bayer.to_rgb()
+
+        assert measurements[0].call == 'PiRawBayer.to_rgb'
+        assert [stage.stage for stage in measurements[0].stages] == ['rgb']
+        assert measurements[0].bytes_allocated == 1640 * 1232 * 3 * 8
+
+
+class TestPack10BitValues:
+    def test_is_inverse_of_unpack(self):
+        bayer_array = np.random.RandomState(0).randint(0, 1024, size=(4, 8)).astype(np.uint16)
+
+        packed = module._pack_10bit_values(bayer_array)
+
+        assert packed.shape == (4, 10)
+        np.testing.assert_array_equal(module._unpack_10bit_values(packed), bayer_array)
+
+    def test_packs_known_values(self):
+        bayer_array = np.array([[0b1111111111, 0b0000000001, 0b1000000010, 0b0100000011]], dtype=np.uint16)
+
+        actual = module._pack_10bit_values(bayer_array)
+
+        np.testing.assert_array_equal(actual, [[0b11111111, 0b00000000, 0b10000000, 0b01000000, 0b11100111]])
+
+    def test_raises_on_values_larger_than_10_bits(self):
+        with pytest.raises(ValueError):
+            module._pack_10bit_values(np.array([[1024, 0, 0, 0]], dtype=np.uint16))
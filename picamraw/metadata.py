@@ -0,0 +1,179 @@
+from collections import namedtuple
+import struct
+from types import MappingProxyType
+
+
+# The most a JPEG's EXIF (APP1) segment can hold, and so the most of the start of a file that needs reading for it
+MAX_EXIF_SEGMENT_SIZE = 64 * 1024
+
+# EXIF tags (see the EXIF 2.3 specification)
+_EXIF_IFD_POINTER_TAG = 0x8769
+_EXPOSURE_TIME_TAG = 0x829A
+_ISO_SPEED_RATINGS_TAG = 0x8827
+_MAKER_NOTE_TAG = 0x927C
+
+# The size in bytes of each EXIF field type: BYTE, ASCII, SHORT, LONG, RATIONAL, SBYTE, UNDEFINED, SSHORT, SLONG, ...
+_EXIF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+# The Raspberry Pi camera firmware scales gains by 256 in its maker note
+_MAKER_NOTE_GAIN_SCALE = 256
+
+
+class RawMetadata(namedtuple('RawMetadata', (
+    'sensor_name', 'width', 'height', 'padding_right', 'padding_down', 'transform', 'format', 'bayer_order',
+    'bayer_format', 'exposure_time', 'iso', 'analog_gain', 'digital_gain', 'awb_gains', 'maker_note',
+))):
+    ''' The capture metadata of a JPEG+RAW file: the fields of its `BroadcomRawHeader`, and the exposure, gain and
+        white balance that the camera firmware records in the JPEG's EXIF data. Immutable.
+
+    Attrs:
+        sensor_name: The name of the sensor, e.g. 'imx219'
+        width, height: The width and height of the image, in pixels
+        padding_right, padding_down: The padding of the raw data to the right of and below the image
+        transform, format, bayer_format: As recorded in the `BroadcomRawHeader`
+        bayer_order: A `BayerOrder` enum that indicates the bayer pattern of the whole image
+        exposure_time: The exposure time in seconds, or None if it wasn't recorded
+        iso: The ISO speed, or None if it wasn't recorded
+        analog_gain: The sensor's analog gain, or None if it wasn't recorded
+        digital_gain: The ISP's digital gain, or None if it wasn't recorded
+        awb_gains: The (red, blue) automatic white balance gains, or None if they weren't recorded
+        maker_note: A read-only mapping of each 'key=value' setting in the Raspberry Pi maker note (e.g. 'exp', 'ag',
+            'gain_r', 'gain_b', 'ccm'), with string values. Empty if there's no such maker note.
+    '''
+    __slots__ = ()
+
+
+def build_raw_metadata(header, bayer_order, exif_tags):
+    ''' Build the `RawMetadata` of a file from its `BroadcomRawHeader`, its whole-image `BayerOrder` and its EXIF tags
+        (see `read_exif_tags`)
+    '''
+    maker_note = parse_maker_note(exif_tags.get(_MAKER_NOTE_TAG))
+
+    exposure_time = exif_tags.get(_EXPOSURE_TIME_TAG)
+    if exposure_time is None and 'exp' in maker_note:
+        # Recorded in microseconds
+        exposure_time = _parse_number(maker_note['exp'], scale=1000000)
+
+    gain_r, gain_b = _parse_number(maker_note.get('gain_r')), _parse_number(maker_note.get('gain_b'))
+
+    return RawMetadata(
+        sensor_name=header.name.decode('ascii', errors='replace'),
+        width=header.width,
+        height=header.height,
+        padding_right=header.padding_right,
+        padding_down=header.padding_down,
+        transform=header.transform,
+        format=header.format,
+        bayer_order=bayer_order,
+        bayer_format=header.bayer_format,
+        exposure_time=exposure_time,
+        iso=exif_tags.get(_ISO_SPEED_RATINGS_TAG),
+        analog_gain=_parse_number(maker_note.get('ag'), scale=_MAKER_NOTE_GAIN_SCALE),
+        digital_gain=_parse_number(maker_note.get('dg'), scale=_MAKER_NOTE_GAIN_SCALE),
+        awb_gains=None if gain_r is None or gain_b is None else (gain_r, gain_b),
+        maker_note=maker_note,
+    )
+
+
+def parse_maker_note(maker_note_bytes):
+    ''' Parse the space-separated 'key=value' settings of a Raspberry Pi camera maker note
+
+    Returns:
+        A read-only mapping of {key: value}, with string values
+    '''
+    settings = {}
+    if maker_note_bytes:
+        for token in maker_note_bytes.rstrip(b'\0').decode('ascii', errors='replace').split():
+            key, separator, value = token.partition('=')
+            if separator:
+                settings[key] = value
+    return MappingProxyType(settings)
+
+
+def _parse_number(value, scale=1):
+    try:
+        return None if value is None else float(value) / scale
+    except ValueError:
+        return None
+
+
+def read_exif_tags(jpeg_start):
+    ''' Read the exposure time, ISO speed and maker note from the EXIF (APP1) segment at the start of a JPEG
+
+    Args:
+        jpeg_start: The bytes of (at least) the start of the JPEG, up to the end of its EXIF segment
+
+    Returns:
+        A dict of {EXIF tag: value} of the tags found, which is empty if there's no (readable) EXIF segment
+    '''
+    tiff = _find_exif_tiff_data(jpeg_start)
+    if tiff is None or tiff[:2] not in (b'II', b'MM'):
+        return {}
+
+    byte_order = '<' if tiff[:2] == b'II' else '>'
+    try:
+        ifd0_offset, = struct.unpack_from(byte_order + 'I', tiff, 4)
+        ifd0 = _read_ifd(tiff, byte_order, ifd0_offset)
+        exif_ifd = _read_ifd(tiff, byte_order, ifd0[_EXIF_IFD_POINTER_TAG]) if _EXIF_IFD_POINTER_TAG in ifd0 else {}
+    except (struct.error, TypeError):  # Truncated or corrupt EXIF data
+        return {}
+
+    return {
+        tag: value
+        for tag, value in exif_ifd.items()
+        if tag in (_EXPOSURE_TIME_TAG, _ISO_SPEED_RATINGS_TAG, _MAKER_NOTE_TAG)
+    }
+
+
+def _find_exif_tiff_data(jpeg_start):
+    ''' Returns: The TIFF-format data of the EXIF segment of the JPEG, or None if there isn't one '''
+    if jpeg_start[:2] != b'\xff\xd8':
+        return None
+
+    offset = 2
+    while offset + 4 <= len(jpeg_start):
+        marker, length = struct.unpack_from('>2sH', jpeg_start, offset)
+        if marker[0] != 0xff or marker == b'\xff\xda':  # Not a marker, or the start of the compressed image data
+            return None
+
+        segment = jpeg_start[offset + 4:offset + 2 + length]
+        if marker == b'\xff\xe1' and segment[:6] == b'Exif\0\0':
+            return segment[6:]
+        offset += 2 + length
+
+    return None
+
+
+def _read_ifd(tiff, byte_order, ifd_offset):
+    ''' Read the entries of an EXIF image file directory (IFD)
+
+    Returns:
+        A dict of {tag: value}. SHORT and LONG values are ints, RATIONAL values floats and UNDEFINED values bytes - of
+        the first value only, other than for UNDEFINED values.
+    '''
+    entry_count, = struct.unpack_from(byte_order + 'H', tiff, ifd_offset)
+    entries = {}
+    for entry_index in range(entry_count):
+        entry_offset = ifd_offset + 2 + 12 * entry_index
+        tag, field_type, count = struct.unpack_from(byte_order + 'HHI', tiff, entry_offset)
+        if tag == _EXIF_IFD_POINTER_TAG and (field_type != 4 or count != 1):
+            continue  # A malformed pointer, which can't be followed
+
+        # Values of up to 4 bytes are stored in the entry itself; larger ones at an offset
+        value_size = _EXIF_TYPE_SIZES.get(field_type, 1) * count
+        if value_size <= 4:
+            value_offset = entry_offset + 8
+        else:
+            value_offset, = struct.unpack_from(byte_order + 'I', tiff, entry_offset + 8)
+
+        if field_type == 3:  # SHORT
+            entries[tag], = struct.unpack_from(byte_order + 'H', tiff, value_offset)
+        elif field_type == 4:  # LONG
+            entries[tag], = struct.unpack_from(byte_order + 'I', tiff, value_offset)
+        elif field_type == 5:  # RATIONAL
+            numerator, denominator = struct.unpack_from(byte_order + 'II', tiff, value_offset)
+            entries[tag] = numerator / denominator if denominator else None
+        elif field_type in (2, 7):  # ASCII or UNDEFINED
+            entries[tag] = bytes(tiff[value_offset:value_offset + count])
+
+    return entries
@@ -0,0 +1,91 @@
+import struct
+
+import pytest
+
+from . import metadata as module
+from .constants import BayerOrder
+from .main import BroadcomRawHeader
+
+MAKER_NOTE = b'ev=-1 mlux=-1 exp=9986 ag=512 dg=288 focus=255 gain_r=1.426 gain_b=1.797 greenness=5 ccm=6022,-2050\0'
+
+
+def make_exif_jpeg(byte_order='<', exposure_time=(1, 100), iso=200, maker_note=MAKER_NOTE, exif_ifd_pointer_type=4):
+    ''' Make the start of a JPEG with an EXIF segment holding an exposure time, ISO speed and maker note '''
+    def _pack(format_string, *values):
+        return struct.pack(byte_order + format_string, *values)
+
+    # A TIFF header, then IFD0 (with just a pointer to the EXIF IFD) at offset 8, then the EXIF IFD at offset 26 with
+    # its values that don't fit in its entries at offset 68
+    tiff = (b'II' if byte_order == '<' else b'MM') + _pack('HI', 42, 8)
+    tiff += _pack('H', 1) + _pack('HHII', 0x8769, exif_ifd_pointer_type, 1, 26) + _pack('I', 0)
+    tiff += _pack('H', 3)
+    tiff += _pack('HHII', 0x829A, 5, 1, 68)
+    tiff += _pack('HHI', 0x8827, 3, 1) + _pack('HH', iso, 0)
+    tiff += _pack('HHII', 0x927C, 7, len(maker_note), 76)
+    tiff += _pack('I', 0)
+    tiff += _pack('II', *exposure_time) + maker_note
+
+    exif_segment = b'Exif\0\0' + tiff
+    return b'\xff\xd8' + b'\xff\xe1' + struct.pack('>H', len(exif_segment) + 2) + exif_segment + b'\xff\xda'
+
+
+class TestReadExifTags:
+    @pytest.mark.parametrize('byte_order', ['<', '>'])
+    def test_reads_exposure_iso_and_maker_note(self, byte_order):
+        actual = module.read_exif_tags(make_exif_jpeg(byte_order))
+
+        assert actual == {0x829A: 0.01, 0x8827: 200, 0x927C: MAKER_NOTE}
+
+    def test_skips_other_segments(self):
+        jfif_segment = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\0' + b'\0' * 9
+        exif_jpeg = make_exif_jpeg()
+
+        actual = module.read_exif_tags(exif_jpeg[:2] + jfif_segment + exif_jpeg[2:])
+
+        assert actual[0x8827] == 200
+
+    @pytest.mark.parametrize('jpeg_start', [
+        b'not a JPEG',
+        b'\xff\xd8\xff\xda',
+        make_exif_jpeg()[:40],
+        # EXIF IFD pointers that aren't a single LONG offset
+        make_exif_jpeg(exif_ifd_pointer_type=3),
+        make_exif_jpeg(exif_ifd_pointer_type=5),
+        make_exif_jpeg(exif_ifd_pointer_type=7),
+    ])
+    def test_returns_nothing_without_readable_exif(self, jpeg_start):
+        assert module.read_exif_tags(jpeg_start) == {}
+
+
+class TestBuildRawMetadata:
+    def test_combines_header_and_exif(self):
+        header = BroadcomRawHeader(name=b'imx219', width=3280, height=2464, padding_down=16, bayer_order=2)
+
+        actual = module.build_raw_metadata(header, BayerOrder.BGGR, module.read_exif_tags(make_exif_jpeg()))
+
+        assert actual.sensor_name == 'imx219'
+        assert (actual.width, actual.height, actual.padding_right, actual.padding_down) == (3280, 2464, 0, 16)
+        assert actual.bayer_order == BayerOrder.BGGR
+        assert actual.exposure_time == 0.01
+        assert actual.iso == 200
+        assert actual.analog_gain == 2
+        assert actual.digital_gain == 1.125
+        assert actual.awb_gains == (1.426, 1.797)
+        assert actual.maker_note['ccm'] == '6022,-2050'
+
+    def test_is_immutable(self):
+        actual = module.build_raw_metadata(BroadcomRawHeader(), BayerOrder.BGGR, {})
+
+        with pytest.raises(AttributeError):
+            actual.width = 1
+        with pytest.raises(AttributeError):
+            actual.extra = 1
+        with pytest.raises(TypeError):
+            actual.maker_note['exp'] = '1'
+
+    def test_falls_back_to_maker_note_exposure(self):
+        actual = module.build_raw_metadata(BroadcomRawHeader(), BayerOrder.BGGR, {0x927C: b'exp=20000'})
+
+        assert actual.exposure_time == 0.02
+        assert actual.iso is None
+        assert actual.awb_gains is None
@@ -0,0 +1,61 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import os
+
+
+def imap(function, items, workers=None, ordered=True):
+    ''' Apply `function` to each of `items` on a pool of worker threads, lazily yielding the results.
+
+    Threads (rather than processes) are used so that the numpy arrays produced by the workers are handed back without
+    being pickled. Extraction is dominated by file I/O and numpy operations, both of which release the GIL.
+
+    At most `2 * workers` items are in flight at any time, so a slow consumer bounds how many results are held in
+    memory waiting to be consumed.
+
+    Args:
+        function: A function of a single argument to apply to each item
+        items: An iterable of items to apply `function` to
+        workers: Optional - defaults to the number of CPUs. The number of worker threads to use.
+        ordered: Optional - defaults to True. If True, results are yielded in the order of `items`. Otherwise they are
+            yielded as soon as they are completed.
+
+    Returns:
+        A generator of the results of `function`. If `function` raises, the exception is re-raised when the
+        corresponding result is reached.
+    '''
+    workers = workers or os.cpu_count() or 1
+    max_pending = 2 * workers
+    items = iter(items)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def _submit_next():
+            for item in items:
+                return executor.submit(function, item)
+            return None
+
+        pending = deque()  # type: deque
+        try:
+            for _ in range(max_pending):
+                future = _submit_next()
+                if future is None:
+                    break
+                pending.append(future)
+
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done_set, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    done = [future for future in pending if future in done_set]
+                    for future in done:
+                        pending.remove(future)
+
+                for future in done:
+                    next_future = _submit_next()
+                    if next_future is not None:
+                        pending.append(next_future)
+                    yield future.result()
+        finally:
+            # Don't wait on work that hasn't started yet if the consumer stops early or a result raises
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+from . import parallel as module
+
+
+class TestImap:
+    def test_yields_results_in_order(self):
+        def _slow_for_small_numbers(number):
+            time.sleep(0.01 * (5 - number))
+            return number * 2
+
+        actual = list(module.imap(_slow_for_small_numbers, range(5), workers=5))
+
+        assert actual == [0, 2, 4, 6, 8]
+
+    def test_unordered_yields_all_results(self):
+        actual = module.imap(lambda number: number * 2, range(10), workers=3, ordered=False)
+
+        assert sorted(actual) == [number * 2 for number in range(10)]
+
+    def test_reraises_exceptions(self):
+        def _raise_on_three(number):
+            if number == 3:
+                raise ValueError('three')
+            return number
+
+        with pytest.raises(ValueError, match='three'):
+            list(module.imap(_raise_on_three, range(5), workers=2))
+
+    def test_bounds_items_in_flight(self):
+        started = []
+        lock = threading.Lock()
+
+        def _record_start(number):
+            with lock:
+                started.append(number)
+            return number
+
+        results = module.imap(_record_start, range(100), workers=2)
+        next(results)
+        time.sleep(0.05)
+
+        # 2 workers allow 4 items in flight; consuming one result lets one more be submitted
+        assert len(started) <= 5
+        results.close()
@@ -33,3 +33,20 @@ class PiResolution(namedtuple('PiResolution', ('width', 'height'))):
 
     def __str__(self):
         return '%dx%d' % (self.width, self.height)
+
+
+class PiRegion(namedtuple('PiRegion', ('x', 'y', 'width', 'height'))):
+    '''
+    A :func:`~collections.namedtuple` derivative which represents a rectangular region of interest within an image.
+
+    Attrs:
+        x: The column of the left edge of the region, in pixels
+        y: The row of the top edge of the region, in pixels
+        width: The width of the region in pixels
+        height: The height of the region in pixels
+    '''
+
+    __slots__ = ()  # workaround python issue #24931
+
+    def __str__(self):
+        return '%dx%d+%d+%d' % (self.width, self.height, self.x, self.y)
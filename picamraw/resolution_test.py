@@ -13,3 +13,10 @@ class TestPiResolution:
         expected = module.PiResolution(width=108, height=209)
 
         assert actual == expected
+
+
+class TestPiRegion:
+    def test_str(self):
+        actual = str(module.PiRegion(x=10, y=20, width=300, height=400))
+
+        assert actual == '300x400+10+20'
@@ -0,0 +1,199 @@
+from typing import Any  # noqa: F401 (used in type comments)
+
+import numpy as np
+
+from . import main
+from .parallel import imap
+
+
+STACK_METHODS = ('mean', 'sum', 'variance', 'median_of_chunks')
+
+# Default number of frames in each chunk for the 'median_of_chunks' method
+DEFAULT_MEDIAN_CHUNK_SIZE = 8
+
+
+class FrameStack:
+    ''' Accumulates many bayer arrays of the same shape into a running per-pixel sum, mean and variance, in buffers
+        allocated once for the first frame. The mean and variance are updated with Welford's algorithm, which stays
+        accurate in float32 over many frames.
+
+    Example:
+        frame_stack = FrameStack()
+        for bayer_array in bayer_arrays:
+            frame_stack.add(bayer_array)
+        frame_stack.mean
+
+    Attrs:
+        count: The number of frames added so far
+        sum: The per-pixel sum of the frames, as uint32 - enough for 4 million 10-bit frames
+        mean: The per-pixel mean of the frames
+    '''
+    def __init__(self, dtype=np.float32):
+        '''
+        Args:
+            dtype: Optional - defaults to np.float32. The dtype to accumulate the mean and variance in.
+        '''
+        self.dtype = dtype
+        self.count = 0
+        self.sum = None  # type: Any
+        self.mean = None  # type: Any
+        self._sum_of_squared_deviations = None  # type: Any
+        self._deviations = None  # type: Any
+        self._scratch = None  # type: Any
+
+    def add(self, bayer_array):
+        ''' Add a frame to the stack, without allocating any new arrays '''
+        if self.count == 0:
+            self._allocate(bayer_array.shape)
+        elif bayer_array.shape != self.mean.shape:
+            raise ValueError(
+                'Frame is the wrong shape: expected {expected_shape}, got {bayer_array.shape}'
+                .format(expected_shape=self.mean.shape, bayer_array=bayer_array)
+            )
+
+        self.count += 1
+        np.add(self.sum, bayer_array, out=self.sum, casting='unsafe')
+
+        # Welford's update: mean += (x - mean) / n; M2 += (x - old mean) * (x - new mean)
+        np.subtract(bayer_array, self.mean, out=self._deviations, casting='unsafe')
+        np.multiply(self._deviations, 1 / self.count, out=self._scratch, casting='unsafe')
+        self.mean += self._scratch
+        np.subtract(bayer_array, self.mean, out=self._scratch, casting='unsafe')
+        self._scratch *= self._deviations
+        self._sum_of_squared_deviations += self._scratch
+
+    def _allocate(self, shape):
+        self.sum = np.zeros(shape, dtype=np.uint32)
+        self.mean = np.zeros(shape, dtype=self.dtype)
+        self._sum_of_squared_deviations = np.zeros(shape, dtype=self.dtype)
+        self._deviations = np.empty(shape, dtype=self.dtype)
+        self._scratch = np.empty(shape, dtype=self.dtype)
+
+    def variance(self, ddof=0):
+        ''' Returns the per-pixel variance of the frames
+
+        Args:
+            ddof: Optional - defaults to 0. "Delta degrees of freedom", as for `np.var`: the divisor used is
+                `count - ddof`. Use 1 for the unbiased sample variance.
+        '''
+        if self.count <= ddof:
+            raise ValueError('Unable to calculate variance of {} frame(s) with ddof={}'.format(self.count, ddof))
+        return self._sum_of_squared_deviations / (self.count - ddof)
+
+
+def stack_frames(filepaths, method='mean', camera_version=None, sensor_mode=0, roi=None, workers=1,
+                 chunk_size=DEFAULT_MEDIAN_CHUNK_SIZE, dtype=np.float32, ddof=0):
+    ''' Combine the raw bayer data of many JPEG+RAW files of the same scene per pixel, e.g. to average out noise.
+        Frames are extracted one at a time (or `workers` at a time) and accumulated into buffers the size of a single
+        frame, so memory use does not grow with the number of files.
+
+    Args:
+        filepaths: An iterable of full paths of JPEG+RAW images to stack
+        method: Optional - defaults to 'mean'. One of:
+            'mean': The per-pixel mean, as `dtype`
+            'sum': The per-pixel sum, as uint32
+            'variance': The per-pixel variance, as `dtype` (see `ddof`)
+            'median_of_chunks': The mean of the per-pixel medians of consecutive chunks of `chunk_size` frames, as
+                `dtype`. This rejects outliers (e.g. cosmic ray hits) like a median, while only holding `chunk_size`
+                frames in memory.
+        camera_version: Optional - defaults to None. See `extract_raw_from_jpeg` for details.
+        sensor_mode: Optional - defaults to 0. See `extract_raw_from_jpeg` for details.
+        roi: Optional. A `PiRegion` (or an (x, y, width, height) tuple) to stack instead of the whole image.
+        workers: Optional - defaults to 1. The number of files to extract concurrently. With 1 worker, every frame is
+            unpacked into the same reused array.
+        chunk_size: Optional - defaults to 8. The number of frames in each chunk for the 'median_of_chunks' method.
+        dtype: Optional - defaults to np.float32. The dtype to accumulate the mean, variance or medians in.
+        ddof: Optional - defaults to 0. "Delta degrees of freedom" for the 'variance' method, as for `np.var`.
+
+    Returns: (stacked_array, bayer_order)
+        stacked_array: A 2D numpy array of the combined bayer data
+        bayer_order: A `BayerOrder` enum that indicates the bayer pattern used by the `stacked_array`
+    '''
+    if method not in STACK_METHODS:
+        raise ValueError('Unknown stack method {method!r}: expected one of {STACK_METHODS}'.format(
+            method=method, STACK_METHODS=STACK_METHODS
+        ))
+
+    frames = _extract_frames(filepaths, camera_version, sensor_mode, roi, workers)
+
+    if method == 'median_of_chunks':
+        return _stack_median_of_chunks(frames, chunk_size, dtype)
+
+    frame_stack = FrameStack(dtype)
+    bayer_order = None
+    for bayer_array, bayer_order in frames:
+        frame_stack.add(bayer_array)
+
+    if frame_stack.count == 0:
+        raise ValueError('Unable to stack zero frames')
+
+    if method == 'sum':
+        return frame_stack.sum, bayer_order
+    if method == 'variance':
+        return frame_stack.variance(ddof), bayer_order
+    return frame_stack.mean, bayer_order
+
+
+def _extract_frames(filepaths, camera_version, sensor_mode, roi, workers):
+    ''' Yields (bayer_array, bayer_order) for each file. With a single worker, each bayer_array is unpacked into the
+        array of the previous one, so it is only valid until the next one is yielded.
+    '''
+    if workers != 1:
+        return imap(
+            lambda filepath: main.extract_raw_from_jpeg(filepath, camera_version, sensor_mode, roi=roi),
+            filepaths,
+            workers=workers,
+        )
+    return _extract_frames_into_one_array(filepaths, camera_version, sensor_mode, roi)
+
+
+def _extract_frames_into_one_array(filepaths, camera_version, sensor_mode, roi):
+    bayer_array = None
+    for filepath in filepaths:
+        bayer_array, bayer_order = main.extract_raw_from_jpeg(
+            filepath, camera_version, sensor_mode, out=bayer_array, roi=roi
+        )
+        yield bayer_array, bayer_order
+
+
+def _stack_median_of_chunks(frames, chunk_size, dtype):
+    chunk = None  # type: Any
+    median_sum = None  # type: Any
+    frame_count = 0
+    chunk_length = 0
+    bayer_order = None
+
+    for bayer_array, bayer_order in frames:
+        if chunk is None:
+            chunk = np.empty((chunk_size,) + bayer_array.shape, dtype=bayer_array.dtype)
+            median_sum = np.zeros(bayer_array.shape, dtype=dtype)
+        elif bayer_array.shape != chunk.shape[1:]:
+            raise ValueError(
+                'Frame is the wrong shape: expected {expected_shape}, got {bayer_array.shape}'
+                .format(expected_shape=chunk.shape[1:], bayer_array=bayer_array)
+            )
+
+        chunk[chunk_length] = bayer_array
+        chunk_length += 1
+        frame_count += 1
+
+        if chunk_length == chunk_size:
+            _add_weighted_median(median_sum, chunk, chunk_length)
+            chunk_length = 0
+
+    if frame_count == 0:
+        raise ValueError('Unable to stack zero frames')
+
+    if chunk_length:
+        _add_weighted_median(median_sum, chunk, chunk_length)
+
+    # Each chunk's median is weighted by the number of frames in the chunk, as the last chunk may be short
+    median_sum /= frame_count
+    return median_sum, bayer_order
+
+
+def _add_weighted_median(median_sum, chunk, chunk_length):
+    ''' Add the per-pixel median of the first `chunk_length` frames of `chunk`, multiplied by `chunk_length` '''
+    median = np.median(chunk[:chunk_length], axis=0, overwrite_input=True)
+    median *= chunk_length
+    np.add(median_sum, median, out=median_sum, casting='unsafe')
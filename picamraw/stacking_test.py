@@ -0,0 +1,86 @@
+import pkg_resources
+
+import numpy as np
+import pytest
+
+from . import stacking as module
+from .constants import BayerOrder, PiCameraVersion
+
+picamv2_jpeg_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2.jpeg')
+picamv2_BGGR_bayer_array_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2_BGGR_bayer_array.npy')
+
+
+@pytest.fixture
+def bayer_arrays():
+    return np.random.RandomState(0).randint(0, 1024, size=(7, 4, 6)).astype(np.uint16)
+
+
+class TestFrameStack:
+    def test_accumulates_sum_mean_and_variance(self, bayer_arrays):
+        frame_stack = module.FrameStack()
+        for bayer_array in bayer_arrays:
+            frame_stack.add(bayer_array)
+
+        assert frame_stack.count == 7
+        np.testing.assert_array_equal(frame_stack.sum, bayer_arrays.sum(axis=0))
+        assert frame_stack.mean.dtype == np.float32
+        np.testing.assert_allclose(frame_stack.mean, bayer_arrays.mean(axis=0), rtol=1e-5)
+        np.testing.assert_allclose(frame_stack.variance(), bayer_arrays.var(axis=0), rtol=1e-4)
+        np.testing.assert_allclose(frame_stack.variance(ddof=1), bayer_arrays.var(axis=0, ddof=1), rtol=1e-4)
+
+    def test_raises_on_mismatched_shape(self, bayer_arrays):
+        frame_stack = module.FrameStack()
+        frame_stack.add(bayer_arrays[0])
+
+        with pytest.raises(ValueError, match='wrong shape'):
+            frame_stack.add(bayer_arrays[0][:2])
+
+    def test_variance_raises_without_enough_frames(self, bayer_arrays):
+        frame_stack = module.FrameStack()
+        frame_stack.add(bayer_arrays[0])
+
+        with pytest.raises(ValueError):
+            frame_stack.variance(ddof=1)
+
+
+class TestStackFrames:
+    @pytest.fixture
+    def mock_extract(self, mocker, bayer_arrays):
+        mock_extract = mocker.patch.object(module.main, 'extract_raw_from_jpeg')
+        mock_extract.side_effect = [(bayer_array, BayerOrder.BGGR) for bayer_array in bayer_arrays]
+        return mock_extract
+
+    @pytest.mark.parametrize('method, expected_function', [
+        ('mean', lambda frames: frames.mean(axis=0)),
+        ('sum', lambda frames: frames.sum(axis=0)),
+        ('variance', lambda frames: frames.var(axis=0)),
+    ])
+    def test_stacks_frames(self, mock_extract, bayer_arrays, method, expected_function):
+        actual, bayer_order = module.stack_frames(['path'] * 7, method, PiCameraVersion.V2)
+
+        assert bayer_order == BayerOrder.BGGR
+        np.testing.assert_allclose(actual, expected_function(bayer_arrays), rtol=1e-4)
+
+    def test_median_of_chunks(self, mock_extract, bayer_arrays):
+        actual, _ = module.stack_frames(['path'] * 7, 'median_of_chunks', PiCameraVersion.V2, chunk_size=4)
+
+        expected = (np.median(bayer_arrays[:4], axis=0) * 4 + np.median(bayer_arrays[4:], axis=0) * 3) / 7
+        np.testing.assert_allclose(actual, expected, rtol=1e-5)
+
+    @pytest.mark.parametrize('method', ['mean', 'median_of_chunks'])
+    def test_raises_on_zero_frames(self, method):
+        with pytest.raises(ValueError, match='zero frames'):
+            module.stack_frames([], method, PiCameraVersion.V2)
+
+    def test_raises_on_unknown_method(self):
+        with pytest.raises(ValueError, match='Unknown stack method'):
+            module.stack_frames([], 'mode', PiCameraVersion.V2)
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_stacks_files(self, workers):
+        actual, bayer_order = module.stack_frames(
+            [picamv2_jpeg_path] * 3, 'mean', PiCameraVersion.V2, roi=(0, 0, 8, 8), workers=workers
+        )
+
+        assert bayer_order == BayerOrder.BGGR
+        np.testing.assert_array_equal(actual, np.load(picamv2_BGGR_bayer_array_path)[:8, :8])
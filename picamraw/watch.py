@@ -0,0 +1,466 @@
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import logging
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from typing import Optional  # noqa: F401 (used in type comments)
+
+from . import main
+from .archive import ArchiveWriter, COMPRESSIONS
+from .cache import SidecarCache, _write_atomically
+from .constants import PiCameraVersion
+from .parallel import imap
+
+
+logger = logging.getLogger(__name__)
+
+OUTPUTS = ('statistics', 'sidecar', 'archive')
+
+DEFAULT_PATTERNS = ('*.jpg', '*.jpeg', '*.JPG', '*.JPEG')
+
+STATISTICS_SUFFIX = '.stats.json'
+
+DEFAULT_ARCHIVE_MAX_FRAMES = 1000
+
+# From inotify(7): the events for a file that has been closed after writing, or moved into the watched directory
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+_INOTIFY_EVENT = struct.Struct('iIII')
+_INOTIFY_READ_SIZE = 64 * 1024
+
+
+class DirectoryWatcher:
+    ''' Watches a spool directory for new JPEG+RAW files and decodes each of them on a pool of worker threads, writing
+        any of: per-channel statistics as JSON, sidecar `.npy` arrays (see `SidecarCache`) and compact archives (see
+        `ArchiveWriter`).
+
+    New files are noticed with inotify on Linux, as soon as they are closed after writing or moved into the
+    directory. Elsewhere (or if `use_inotify` is False), the directory is polled and a file is only decoded once its
+    size and modification time have settled. A file that still fails to decode - e.g. because it's partly written - is
+    retried after `settle_time`, up to `max_attempts` times.
+
+    At most 2 files per worker are in flight at once: while the workers are busy, new files wait (in the kernel's
+    inotify queue, or in the directory itself) rather than piling up in memory. If the inotify queue overflows, the
+    directory is rescanned.
+
+    Example:
+        watcher = DirectoryWatcher('/var/spool/camera', output_directory='/data/decoded', outputs=('statistics',))
+        watcher.run()  # Until `watcher.stop()` is called, e.g. from a signal handler or another thread
+
+    Attrs:
+        processed_count: The number of files decoded and written out so far
+        failed_count: The number of files that failed to decode after `max_attempts` attempts
+    '''
+    def __init__(self, directory, output_directory=None, outputs=('statistics',), camera_version=None, sensor_mode=0,
+                 workers=None, patterns=DEFAULT_PATTERNS, use_inotify=None, poll_interval=1.0, settle_time=2.0,
+                 max_attempts=3, process_existing=True, archive_max_frames=DEFAULT_ARCHIVE_MAX_FRAMES,
+                 archive_compression=None):
+        '''
+        Args:
+            directory: The directory to watch
+            output_directory: Optional - defaults to `directory`. The directory to write outputs to.
+            outputs: Optional - defaults to ('statistics',). Any of:
+                'statistics': Write the per-channel statistics (see `channel_statistics`) of each file to
+                    '<file name>.stats.json'
+                'sidecar': Write the bayer array of each file to a sidecar `.npy` file (see `SidecarCache`)
+                'archive': Add the raw data of each file to an archive (see `ArchiveWriter`), starting a new archive
+                    every `archive_max_frames` files
+            camera_version: Optional - defaults to None. See `extract_raw_from_jpeg` for details.
+            sensor_mode: Optional - defaults to 0. See `extract_raw_from_jpeg` for details.
+            workers: Optional - defaults to the number of CPUs. The number of files to decode concurrently.
+            patterns: Optional - defaults to JPEG file names. The glob patterns of the names of files to decode.
+            use_inotify: Optional - defaults to None, to use inotify where available. If False, poll the directory.
+            poll_interval: Optional - defaults to 1 second. How often to poll the directory (or check for `stop()`).
+            settle_time: Optional - defaults to 2 seconds. How long a polled file's size and modification time must be
+                unchanged for before it's decoded, and how long to wait before retrying a file that failed to decode.
+            max_attempts: Optional - defaults to 3. The number of times to try to decode each file.
+            process_existing: Optional - defaults to True. If True, decode the files already in the directory too.
+            archive_max_frames: Optional - defaults to 1000. The number of files to add to each archive.
+            archive_compression: Optional - defaults to None. The compression of archives: None, or 'zlib'.
+        '''
+        unknown_outputs = set(outputs) - set(OUTPUTS)
+        if unknown_outputs:
+            raise ValueError('Unknown outputs {unknown_outputs}: expected any of {OUTPUTS}'.format(
+                unknown_outputs=sorted(unknown_outputs), OUTPUTS=OUTPUTS
+            ))
+        if archive_compression not in COMPRESSIONS:
+            raise ValueError('Unknown compression {archive_compression!r}: expected one of {COMPRESSIONS}'.format(
+                archive_compression=archive_compression, COMPRESSIONS=COMPRESSIONS
+            ))
+
+        self.directory = directory
+        self.output_directory = directory if output_directory is None else output_directory
+        self.outputs = tuple(outputs)
+        self.camera_version = camera_version
+        self.sensor_mode = sensor_mode
+        self.workers = workers
+        self.patterns = patterns
+        self.use_inotify = _inotify_is_available() if use_inotify is None else use_inotify
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.max_attempts = max_attempts
+        self.process_existing = process_existing
+        self.archive_max_frames = archive_max_frames
+        self.archive_compression = archive_compression
+
+        self.processed_count = 0
+        self.failed_count = 0
+
+        self._stop_event = threading.Event()
+        self._counts_lock = threading.Lock()
+
+        # The (size, modification time) of each file that has been handed to the workers, by name
+        self._queued_files = {}  # type: dict
+        self._queued_files_pruned_count = 0
+
+        self._archive = None  # type: Optional[ArchiveWriter]
+        self._archive_frame_count = 0
+        self._archive_sequence = 0
+        self._archive_prefix = 'frames-{}'.format(time.strftime('%Y%m%dT%H%M%S'))
+        self._archive_lock = threading.Lock()
+
+    def run(self):
+        ''' Watch the directory and decode files until `stop()` is called. Files already in flight are finished. '''
+        try:
+            for _ in imap(self._process, self._ready_paths(), workers=self.workers, ordered=False):
+                pass
+        finally:
+            self._close_archive()
+
+    def stop(self):
+        ''' Stop watching, within `poll_interval`. Safe to call from another thread or a signal handler. '''
+        self._stop_event.set()
+
+    def _ready_paths(self):
+        ''' Yields the path of each file that is ready to decode, until `stop()` is called '''
+        if self.use_inotify:
+            events = _InotifyEvents(self.directory)
+            try:
+                for path in self._scan_for_inotify(mark_only=not self.process_existing):
+                    yield path
+                while not self._stop_event.is_set():
+                    names = events.read(self.poll_interval)
+                    paths = self._scan_for_inotify() if names is None else self._paths_to_queue(names)
+                    for path in paths:
+                        yield path
+            finally:
+                events.close()
+        else:
+            # The (size, modification time) of each file, and when it was first seen with them, by name
+            settling_files = {}  # type: dict
+            if not self.process_existing:
+                self._queued_files.update(self._list_files())
+            while not self._stop_event.is_set():
+                for path in self._poll(settling_files):
+                    yield path
+                self._stop_event.wait(self.poll_interval)
+
+    def _list_files(self):
+        ''' Returns: {name: (size, modification time)} of the files in the directory that match `patterns` '''
+        files = {}
+        for entry in os.scandir(self.directory):
+            if not self._matches(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:  # The file was removed
+                continue
+            files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def _matches(self, name):
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in self.patterns)
+
+    def _scan_for_inotify(self, mark_only=False):
+        ''' List the directory (on starting, or after the inotify queue overflowed) and returns the paths of files that
+            haven't been queued yet, or - if `mark_only` - mark them all as queued.
+        '''
+        files = self._list_files()
+        self._prune_queued_files(files)
+        if mark_only:
+            self._queued_files.update(files)
+            return []
+        return self._paths_to_queue(sorted(files, key=lambda name: files[name][1]), files)
+
+    def _paths_to_queue(self, names, files=None):
+        ''' Returns the paths of the files of `names` that haven't been queued since they last changed, marking them as
+            queued.
+        '''
+        paths = []
+        for name in names:
+            if not self._matches(name):
+                continue
+            path = os.path.join(self.directory, name)
+            if files is None:
+                try:
+                    stat = os.stat(path)
+                except OSError:  # The file was removed
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+            else:
+                signature = files[name]
+
+            if self._queued_files.get(name) != signature:
+                self._queued_files[name] = signature
+                paths.append(path)
+
+        # Forget files that have since been removed, whenever the number of files remembered has doubled
+        if len(self._queued_files) > 2 * max(self._queued_files_pruned_count, 1024):
+            self._prune_queued_files(self._list_files())
+
+        return paths
+
+    def _prune_queued_files(self, files):
+        for name in set(self._queued_files) - set(files):
+            del self._queued_files[name]
+        self._queued_files_pruned_count = len(self._queued_files)
+
+    def _poll(self, settling_files):
+        ''' List the directory, and returns the paths of files whose size and modification time haven't changed for
+            `settle_time`, and haven't been queued since they last changed
+        '''
+        now = time.monotonic()
+        files = self._list_files()
+        self._prune_queued_files(files)
+
+        for name in set(settling_files) - set(files):
+            del settling_files[name]
+
+        ready_names = []
+        for name, signature in files.items():
+            settling_signature, first_seen = settling_files.get(name, (None, None))
+            if settling_signature != signature:
+                settling_files[name] = (signature, now)
+                first_seen = now
+            if now - first_seen >= self.settle_time and self._queued_files.get(name) != signature:
+                ready_names.append(name)
+
+        return self._paths_to_queue(sorted(ready_names, key=lambda name: files[name][1]), files)
+
+    def _process(self, path):
+        ''' Decode a file and write its outputs, retrying failures. Returns: True if it succeeded '''
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._decode_and_write(path)
+            except FileNotFoundError:
+                logger.warning('%s was removed before it could be decoded', path)
+                break
+            except (ValueError, OSError) as error:
+                if attempt < self.max_attempts:
+                    logger.debug('Unable to decode %s (attempt %d), retrying: %s', path, attempt, error)
+                    time.sleep(self.settle_time)
+                    continue
+                logger.error('Unable to decode %s after %d attempts: %s', path, attempt, error)
+                break
+            except Exception:
+                # Any other failure is of this file alone (e.g. a corrupt header), so mustn't stop the watcher
+                logger.exception('Unable to decode %s', path)
+                break
+            else:
+                logger.info('Decoded %s', path)
+                with self._counts_lock:
+                    self.processed_count += 1
+                return True
+
+        with self._counts_lock:
+            self.failed_count += 1
+        return False
+
+    def _decode_and_write(self, path):
+        # Archives hold the packed pixel data, so only the other outputs need the file to be decoded
+        if 'statistics' in self.outputs or 'sidecar' in self.outputs:
+            disk_cache = SidecarCache(None if self.output_directory == self.directory else self.output_directory)
+            raw_bayer = main.PiRawBayer(
+                path,
+                self.camera_version,
+                self.sensor_mode,
+                disk_cache=disk_cache if 'sidecar' in self.outputs else None,
+            )
+
+            if 'statistics' in self.outputs:
+                self._write_statistics(raw_bayer)
+
+        if 'archive' in self.outputs:
+            self._add_to_archive(path)
+
+    def _write_statistics(self, raw_bayer):
+        statistics = raw_bayer.channel_statistics()
+        record = {
+            'path': raw_bayer.filepath,
+            'camera_version': raw_bayer.camera_version.value,
+            'sensor_mode': raw_bayer.sensor_mode,
+            'bayer_order': raw_bayer.bayer_order.value,
+            'channels': {
+                channel_name: {
+                    'count': channel.count,
+                    'mean': channel.mean,
+                    'min': channel.min,
+                    'max': channel.max,
+                    'median': channel.median,
+                    'percentiles': channel.percentiles,
+                    'saturated_count': channel.saturated_count,
+                }
+                for channel_name, channel in statistics.items()
+            },
+        }
+
+        statistics_path = os.path.join(
+            self.output_directory, os.path.basename(raw_bayer.filepath) + STATISTICS_SUFFIX
+        )
+        _write_atomically(statistics_path, lambda file: file.write(json.dumps(record).encode('utf-8')))
+
+    def _add_to_archive(self, path):
+        with self._archive_lock:
+            if self._archive is None:
+                self._archive_sequence += 1
+                archive_path = os.path.join(self.output_directory, '{prefix}-{sequence:04d}.picamraw'.format(
+                    prefix=self._archive_prefix, sequence=self._archive_sequence
+                ))
+                self._archive = ArchiveWriter(archive_path, compression=self.archive_compression)
+
+            self._archive.add_file(path, self.camera_version, self.sensor_mode)
+            self._archive_frame_count += 1
+
+            if self._archive_frame_count >= self.archive_max_frames:
+                self._close_archive()
+
+    def _close_archive(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+            self._archive_frame_count = 0
+
+
+class _InotifyEvents:
+    ''' The names of files that are closed after writing to, or moved into, a directory - via inotify(7) '''
+    def __init__(self, directory):
+        libc = _load_libc()
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+            error_number = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error_number, os.strerror(error_number), directory)
+
+    def read(self, timeout):
+        ''' Wait up to `timeout` seconds for events
+
+        Returns:
+            A list of the names of the files of the events, or None if events were lost (and so the directory needs to
+            be rescanned)
+        '''
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            buffer = os.read(self._fd, _INOTIFY_READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        names = []
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, name_length = _INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += _INOTIFY_EVENT.size
+            name = buffer[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            if name:
+                names.append(os.fsdecode(name))
+
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+def _load_libc():
+    return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+
+def _inotify_is_available():
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        return hasattr(_load_libc(), 'inotify_init1')
+    except OSError:
+        return False
+
+
+def cli(argv=None):
+    ''' The `picamraw-watch` command: watch a directory and decode new JPEG+RAW files until interrupted '''
+    parser = argparse.ArgumentParser(
+        prog='picamraw-watch',
+        description='Watch a directory for new JPEG+RAW files and decode them as they arrive.',
+    )
+    parser.add_argument('directory', help='The directory to watch')
+    parser.add_argument('--output-directory', help='The directory to write outputs to (default: the watched one)')
+    parser.add_argument(
+        '--output', dest='outputs', action='append', choices=OUTPUTS,
+        help='What to write for each file; may be repeated (default: statistics)',
+    )
+    parser.add_argument('--camera-version', choices=[version.name for version in PiCameraVersion])
+    parser.add_argument('--sensor-mode', type=int, default=0)
+    parser.add_argument('--workers', type=int, help='The number of files to decode concurrently (default: CPUs)')
+    parser.add_argument('--pattern', dest='patterns', action='append', help='Glob of file names to decode')
+    parser.add_argument('--poll', action='store_true', help='Poll the directory, even where inotify is available')
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--settle-time', type=float, default=2.0)
+    parser.add_argument('--skip-existing', action='store_true', help="Don't decode files already in the directory")
+    parser.add_argument('--archive-max-frames', type=int, default=DEFAULT_ARCHIVE_MAX_FRAMES)
+    parser.add_argument('--archive-compression', choices=[compression for compression in COMPRESSIONS if compression])
+    parser.add_argument('--verbose', '-v', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s %(levelname)s %(message)s',
+    )
+
+    watcher = DirectoryWatcher(
+        args.directory,
+        output_directory=args.output_directory,
+        outputs=args.outputs or ('statistics',),
+        camera_version=None if args.camera_version is None else PiCameraVersion[args.camera_version],
+        sensor_mode=args.sensor_mode,
+        workers=args.workers,
+        patterns=args.patterns or DEFAULT_PATTERNS,
+        use_inotify=False if args.poll else None,
+        poll_interval=args.poll_interval,
+        settle_time=args.settle_time,
+        process_existing=not args.skip_existing,
+        archive_max_frames=args.archive_max_frames,
+        archive_compression=args.archive_compression,
+    )
+
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: watcher.stop())
+
+    logger.info('Watching %s (%s)', args.directory, 'inotify' if watcher.use_inotify else 'polling')
+    watcher.run()
+    logger.info('Stopped: decoded %d files, %d failed', watcher.processed_count, watcher.failed_count)
+    return 1 if watcher.failed_count else 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
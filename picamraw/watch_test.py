@@ -0,0 +1,243 @@
+import json
+import os
+import pkg_resources
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from . import watch as module
+from .archive import ArchiveReader
+from .cache import SidecarCache
+from .constants import PiCameraVersion
+
+picamv2_jpeg_path = pkg_resources.resource_filename(__name__, 'test_fixtures/picamv2.jpeg')
+
+
+def _write_capture_with_bad_bayer_order(path):
+    ''' Copy the test capture, with a bayer order in its header that isn't one of the known ones '''
+    shutil.copy(picamv2_jpeg_path, path)
+    bayer_order_offset = (
+        os.path.getsize(path)
+        - module.main.RAW_BLOCK_SIZE_BY_VERSION_AND_MODE[PiCameraVersion.V2][0]
+        + module.main.HEADER_BYTE_OFFSET
+        + module.main.BroadcomRawHeader.bayer_order.offset
+    )
+    with open(path, 'r+b') as file:
+        file.seek(bayer_order_offset)
+        file.write(bytes([99]))
+
+
+requires_inotify = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is only on Linux')
+
+
+def _wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.01)
+
+
+class _RunningWatcher:
+    ''' Runs a `DirectoryWatcher` on a background thread for the duration of a `with` block '''
+    def __init__(self, watcher):
+        self.watcher = watcher
+        self._thread = threading.Thread(target=watcher.run)
+
+    def __enter__(self):
+        self._thread.start()
+        return self.watcher
+
+    def __exit__(self, *exc_info):
+        self.watcher.stop()
+        self._thread.join()
+
+
+@pytest.fixture
+def spool_directory(tmpdir):
+    return str(tmpdir.mkdir('spool'))
+
+
+@pytest.fixture
+def output_directory(tmpdir):
+    return str(tmpdir.mkdir('output'))
+
+
+class TestDirectoryWatcher:
+    @pytest.mark.parametrize('use_inotify', [
+        pytest.param(True, marks=requires_inotify),
+        False,
+    ])
+    def test_writes_statistics_of_new_files(self, spool_directory, output_directory, use_inotify):
+        watcher = module.DirectoryWatcher(
+            spool_directory,
+            output_directory,
+            camera_version=PiCameraVersion.V2,
+            use_inotify=use_inotify,
+            poll_interval=0.01,
+            settle_time=0,
+        )
+
+        with _RunningWatcher(watcher):
+            shutil.copy(picamv2_jpeg_path, os.path.join(spool_directory, 'new.jpeg'))
+            _wait_for(lambda: watcher.processed_count == 1)
+
+        with open(os.path.join(output_directory, 'new.jpeg.stats.json')) as statistics_file:
+            statistics = json.load(statistics_file)
+        assert statistics['bayer_order'] == 'BGGR'
+        assert statistics['camera_version'] == 'IMX219'
+        assert sorted(statistics['channels']) == ['B', 'G1', 'G2', 'R']
+        assert statistics['channels']['R']['count'] > 0
+
+    def test_processes_existing_files_once(self, spool_directory, output_directory, mocker):
+        shutil.copy(picamv2_jpeg_path, os.path.join(spool_directory, 'existing.jpeg'))
+        open(os.path.join(spool_directory, 'ignored.txt'), 'w').close()
+        spy_decode = mocker.spy(module.DirectoryWatcher, '_decode_and_write')
+        watcher = module.DirectoryWatcher(
+            spool_directory, output_directory, use_inotify=False, poll_interval=0.01, settle_time=0,
+        )
+
+        with _RunningWatcher(watcher):
+            _wait_for(lambda: watcher.processed_count == 1)
+            # Let the directory be polled a few more times
+            time.sleep(0.1)
+
+        assert spy_decode.call_count == 1
+        assert os.listdir(output_directory) == ['existing.jpeg.stats.json']
+
+    def test_skips_existing_files(self, spool_directory, output_directory):
+        shutil.copy(picamv2_jpeg_path, os.path.join(spool_directory, 'existing.jpeg'))
+        watcher = module.DirectoryWatcher(
+            spool_directory, output_directory, use_inotify=False, poll_interval=0.01, settle_time=0,
+            process_existing=False,
+        )
+
+        with _RunningWatcher(watcher):
+            time.sleep(0.1)
+            shutil.copy(picamv2_jpeg_path, os.path.join(spool_directory, 'new.jpeg'))
+            _wait_for(lambda: watcher.processed_count == 1)
+
+        assert os.listdir(output_directory) == ['new.jpeg.stats.json']
+
+    def test_waits_for_polled_files_to_settle(self, spool_directory, output_directory, mocker):
+        spy_decode = mocker.spy(module.DirectoryWatcher, '_decode_and_write')
+        watcher = module.DirectoryWatcher(
+            spool_directory, output_directory, use_inotify=False, poll_interval=0.01, settle_time=0.5,
+        )
+        with open(picamv2_jpeg_path, 'rb') as jpeg_file:
+            jpeg_bytes = jpeg_file.read()
+
+        with _RunningWatcher(watcher):
+            with open(os.path.join(spool_directory, 'slow.jpeg'), 'wb') as partial_file:
+                partial_file.write(jpeg_bytes[:len(jpeg_bytes) // 2])
+                partial_file.flush()
+                time.sleep(0.2)
+                partial_file.write(jpeg_bytes[len(jpeg_bytes) // 2:])
+            _wait_for(lambda: watcher.processed_count == 1)
+
+        assert spy_decode.call_count == 1
+        assert watcher.failed_count == 0
+
+    def test_retries_files_that_fail_to_decode(self, spool_directory, mocker):
+        watcher = module.DirectoryWatcher(spool_directory, settle_time=0, max_attempts=3)
+        mocker.patch.object(watcher, '_decode_and_write', side_effect=[ValueError('Partly written'), None])
+
+        assert watcher._process(os.path.join(spool_directory, 'partial.jpeg')) is True
+
+        assert watcher.processed_count == 1
+        assert watcher.failed_count == 0
+
+    def test_counts_files_that_never_decode(self, spool_directory):
+        bad_path = os.path.join(spool_directory, 'bad.jpeg')
+        with open(bad_path, 'wb') as bad_file:
+            bad_file.write(b'not a JPEG+RAW file')
+        watcher = module.DirectoryWatcher(spool_directory, settle_time=0, max_attempts=2)
+
+        assert watcher._process(bad_path) is False
+
+        assert watcher.failed_count == 1
+
+    def test_keeps_watching_after_unexpected_errors(self, spool_directory, output_directory):
+        watcher = module.DirectoryWatcher(
+            spool_directory, output_directory, workers=1, use_inotify=False, poll_interval=0.01, settle_time=0
+        )
+
+        with _RunningWatcher(watcher):
+            _write_capture_with_bad_bayer_order(os.path.join(spool_directory, 'bad.jpeg'))
+            _wait_for(lambda: watcher.failed_count == 1)
+
+            shutil.copy(picamv2_jpeg_path, os.path.join(spool_directory, 'good.jpeg'))
+            _wait_for(lambda: watcher.processed_count == 1)
+
+        assert os.listdir(output_directory) == ['good.jpeg' + module.STATISTICS_SUFFIX]
+
+    def test_writes_sidecars_and_archives(self, spool_directory, output_directory):
+        for index in range(3):
+            shutil.copy(picamv2_jpeg_path, os.path.join(spool_directory, '{}.jpeg'.format(index)))
+        watcher = module.DirectoryWatcher(
+            spool_directory,
+            output_directory,
+            outputs=('sidecar', 'archive'),
+            camera_version=PiCameraVersion.V2,
+            workers=2,
+            use_inotify=False,
+            poll_interval=0.01,
+            settle_time=0,
+            archive_max_frames=2,
+        )
+
+        with _RunningWatcher(watcher):
+            _wait_for(lambda: watcher.processed_count == 3)
+
+        archive_paths = sorted(name for name in os.listdir(output_directory) if name.endswith('.picamraw'))
+        frame_counts = []
+        for archive_path in archive_paths:
+            with ArchiveReader(os.path.join(output_directory, archive_path)) as archive:
+                frame_counts.append(len(archive))
+        assert frame_counts == [2, 1]
+
+        sidecar_cache = SidecarCache(output_directory)
+        assert sidecar_cache.load(os.path.join(spool_directory, '0.jpeg'), PiCameraVersion.V2, 0) is not None
+
+    def test_archives_packed_data_without_decoding(self, spool_directory, output_directory, mocker):
+        shutil.copy(picamv2_jpeg_path, os.path.join(spool_directory, 'a.jpeg'))
+        spy_pi_raw_bayer = mocker.spy(module.main, 'PiRawBayer')
+        watcher = module.DirectoryWatcher(spool_directory, output_directory, outputs=('archive',), use_inotify=False)
+
+        assert watcher._process(os.path.join(spool_directory, 'a.jpeg')) is True
+        watcher._close_archive()
+
+        assert spy_pi_raw_bayer.call_count == 0
+        archive_path, = os.listdir(output_directory)
+        with ArchiveReader(os.path.join(output_directory, archive_path)) as archive:
+            actual_bayer_array, actual_bayer_order = archive.read_frame(0)
+        expected = module.main.PiRawBayer(picamv2_jpeg_path, PiCameraVersion.V2)
+        assert actual_bayer_order == expected.bayer_order
+        np.testing.assert_array_equal(actual_bayer_array, expected.bayer_array)
+
+    def test_raises_on_unknown_output(self, spool_directory):
+        with pytest.raises(ValueError, match='Unknown outputs'):
+            module.DirectoryWatcher(spool_directory, outputs=('thumbnails',))
+
+
+class TestCli:
+    def test_runs_watcher_with_arguments(self, mocker):
+        mock_watcher_class = mocker.patch.object(module, 'DirectoryWatcher')
+        mock_watcher_class.return_value.failed_count = 0
+        mocker.patch.object(module.signal, 'signal')
+
+        exit_code = module.cli([
+            '/spool', '--output', 'archive', '--output', 'statistics', '--camera-version', 'V2', '--poll',
+            '--archive-compression', 'zlib',
+        ])
+
+        assert exit_code == 0
+        _, kwargs = mock_watcher_class.call_args
+        assert kwargs['outputs'] == ['archive', 'statistics']
+        assert kwargs['camera_version'] == PiCameraVersion.V2
+        assert kwargs['use_inotify'] is False
+        assert kwargs['archive_compression'] == 'zlib'
+        mock_watcher_class.return_value.run.assert_called_once_with()
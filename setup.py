@@ -24,6 +24,11 @@ setup(
         'numpy',
     ],
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'picamraw-watch = picamraw.watch:cli',
+        ],
+    },
     classifiers=[
         'Intended Audience :: Developers',
         'License :: OSI Approved :: BSD License',